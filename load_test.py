@@ -0,0 +1,210 @@
+"""Load generator for the weight tracker.
+
+Concurrent clients drive a weighted mix of dashboard GETs (optionally with
+`user2` and `compare_users`), entry POSTs, edits and deletes, then report
+throughput and p50/p95/p99 latency per route.
+
+    python load_test.py                              # in-process, against a throwaway workbook
+    python load_test.py --url http://127.0.0.1:5000  # against a running server
+
+Against a running server the synthetic users and entries are written into
+that server's data, so start it on a scratch file first:
+
+    WEIGHT_TRACKER_DATA_FILE=/tmp/loadtest.xlsx python weight_tracking_og2.py
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import tempfile
+import argparse
+import datetime
+import threading
+import http.client
+from urllib.parse import urlencode, urlsplit
+
+DEFAULT_MIX = "dashboard=50,compare=20,post=20,edit=5,delete=5"
+ROUTES = {
+    'dashboard': "GET /",
+    'compare': "GET / (compare)",
+    'post': "POST /",
+    'edit': "POST /update",
+    'delete': "GET /delete",
+}
+ROW_LINK = re.compile(r'/delete/(\d+)\?user=')
+
+class InProcessClient:
+    """Calls the app through Flask's test client; one per worker thread."""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, form=None, json_body=None):
+        response = self._client.open(path, method=method, data=form, json=json_body)
+        return response.status_code, response.get_data(as_text=True)
+
+class HttpClient:
+    """Calls a running server over one keep-alive HTTP connection; one per worker thread."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self._conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+
+    def request(self, method, path, form=None, json_body=None):
+        headers, body = {}, None
+        if form is not None:
+            headers['Content-Type'], body = 'application/x-www-form-urlencoded', urlencode(form)
+        elif json_body is not None:
+            headers['Content-Type'], body = 'application/json', json.dumps(json_body)
+        try:
+            self._conn.request(method, path, body=body, headers=headers)
+            response = self._conn.getresponse()
+            return response.status, response.read().decode('utf-8', 'replace')
+        except (OSError, http.client.HTTPException):
+            self._conn.close()  # reconnect on the next request
+            raise
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ROUTES: raise SystemExit(f"Unknown operation '{name}'; choose from {', '.join(ROUTES)}.")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values: return None
+    return sorted_values[max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)]
+
+def seed(client, users, entries_per_user, rng):
+    """Creates synthetic users with goals and a history of entries through the app's own endpoints."""
+    names = [f"loadtest-{i:03d}" for i in range(users)]
+    start = datetime.date.today() - datetime.timedelta(days=entries_per_user)
+    batch = []
+    for name in names:
+        client.request('POST', '/add_user', form={'new_user_name': name})
+        start_weight = round(rng.uniform(150, 250), 1)
+        client.request('POST', '/update_goals', form={'user': name, 'start_weight': start_weight,
+                                                      'goal_weight': round(start_weight * 0.85, 1)})
+        for day in range(entries_per_user):
+            batch.append({"user": name, "date": (start + datetime.timedelta(days=day)).isoformat(),
+                          "weight": round(start_weight - day * 0.05 + rng.uniform(-1, 1), 1),
+                          "body_fat": round(rng.uniform(15, 30), 1) if rng.random() < 0.3 else None,
+                          "waist_size": None})
+    for i in range(0, len(batch), 1000):
+        status, body = client.request('POST', '/api/entries', json_body=batch[i:i + 1000])
+        if status != 200: raise SystemExit(f"Seeding failed with HTTP {status}: {body[:200]}")
+    return names
+
+class LoadTest:
+    def __init__(self, make_client, names, mix, clients, duration, seed_value):
+        self.make_client, self.names, self.mix = make_client, names, mix
+        self.clients, self.duration, self.seed = clients, duration, seed_value
+        self.latencies = {op: [] for op in ROUTES}
+        self.errors = {op: 0 for op in ROUTES}
+        self.rows = {}  # user -> row numbers seen on their dashboard, for edits and deletes
+        self._lock = threading.Lock()
+
+    def _dashboard_path(self, rng, user, compare):
+        params = [('user1', user)]
+        if compare:
+            params.append(('user2', rng.choice(self.names)))
+            params += [('compare_users', u) for u in rng.sample(self.names, min(3, len(self.names)))]
+        return '/?' + urlencode(params)
+
+    def _call(self, client, rng, op):
+        """Performs one operation; returns (operation actually performed, HTTP status)."""
+        user = rng.choice(self.names)
+        if op in ('dashboard', 'compare'):
+            status, body = client.request('GET', self._dashboard_path(rng, user, op == 'compare'))
+            with self._lock: self.rows[user] = [int(r) for r in ROW_LINK.findall(body)]
+            return op, status
+        if op == 'post':
+            day = datetime.date.today() - datetime.timedelta(days=rng.randrange(3650))
+            return op, client.request('POST', '/', form={'user': user, 'date': day.isoformat(),
+                                                         'weight': round(rng.uniform(150, 250), 1)})[0]
+        with self._lock:
+            known = self.rows.get(user)
+            row = known.pop(rng.randrange(len(known))) if known else None
+        if row is None:  # nothing seen for this user yet; load their dashboard instead
+            return self._call(client, rng, 'dashboard')
+        if op == 'edit':
+            return op, client.request('POST', f'/update/{row}', form={
+                'user': user, 'date': datetime.date.today().isoformat(), 'weight': round(rng.uniform(150, 250), 1)})[0]
+        return op, client.request('GET', f'/delete/{row}?user={user}')[0]
+
+    def _worker(self, index, deadline):
+        rng = random.Random(self.seed + index)
+        client = self.make_client()
+        ops, weights = list(self.mix), list(self.mix.values())
+        while time.perf_counter() < deadline:
+            op = rng.choices(ops, weights)[0]
+            started = time.perf_counter()
+            try: op, status = self._call(client, rng, op)
+            except Exception: status = None
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.latencies[op].append(elapsed)
+                if status is None or status >= 500: self.errors[op] += 1
+
+    def run(self):
+        deadline = time.perf_counter() + self.duration
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self._worker, args=(i, deadline), daemon=True) for i in range(self.clients)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed):
+        routes = {}
+        for op, latencies in self.latencies.items():
+            if not latencies: continue
+            latencies.sort()
+            routes[ROUTES[op]] = {"requests": len(latencies), "errors": self.errors[op],
+                                  "rps": len(latencies) / elapsed,
+                                  **{f"p{p}_ms": percentile(latencies, p) * 1000 for p in (50, 95, 99)}}
+        total = sum(r["requests"] for r in routes.values())
+        return {"clients": self.clients, "seconds": elapsed, "requests": total, "rps": total / elapsed,
+                "errors": sum(r["errors"] for r in routes.values()), "routes": routes}
+
+def print_report(result):
+    print(f"\n{result['requests']} requests from {result['clients']} clients in {result['seconds']:.1f}s"
+          f" = {result['rps']:.1f} req/s, {result['errors']} errors\n")
+    print(f"{'route':<18}{'requests':>10}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for route, r in result["routes"].items():
+        print(f"{route:<18}{r['requests']:>10}{r['rps']:>9.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+              f"{r['p99_ms']:>10.1f}{r['errors']:>8}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive the weight tracker with concurrent clients and report latency per route.")
+    parser.add_argument('--url', help="server to test, e.g. http://127.0.0.1:5000 (default: run the app in-process)")
+    parser.add_argument('--clients', type=int, default=16, help="concurrent clients (default 16)")
+    parser.add_argument('--duration', type=float, default=30, help="seconds to run (default 30)")
+    parser.add_argument('--users', type=int, default=20, help="synthetic users to create (default 20)")
+    parser.add_argument('--entries', type=int, default=200, help="entries per synthetic user (default 200)")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"operation weights (default {DEFAULT_MIX})")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args(argv)
+    mix = parse_mix(args.mix)
+
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+    else:
+        # Point the app at a throwaway workbook before it is imported and set up.
+        os.environ['WEIGHT_TRACKER_DATA_FILE'] = os.path.join(tempfile.mkdtemp(prefix='weight-loadtest-'), 'weights.xlsx')
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import weight_tracking_og2
+        make_client = lambda: InProcessClient(weight_tracking_og2.app)
+
+    names = seed(make_client(), args.users, args.entries, random.Random(args.seed))
+    result = LoadTest(make_client, names, mix, args.clients, args.duration, args.seed).run()
+    if args.json: print(json.dumps(result, indent=1))
+    else: print_report(result)
+
+if __name__ == '__main__':
+    main()
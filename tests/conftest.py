@@ -0,0 +1,44 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MODULE = 'weight_tracking_og2'
+
+def load_tracker(monkeypatch, tmp_path, layout='combined', **env):
+    """Imports a fresh copy of the app backed by data files in `tmp_path`."""
+    monkeypatch.setenv('WEIGHT_TRACKER_DATA_FILE', str(tmp_path / 'weights.xlsx'))
+    monkeypatch.setenv('WEIGHT_TRACKER_LAYOUT', layout)
+    for name in ('WEIGHT_TRACKER_TENANCY', 'WEIGHT_TRACKER_HEADLESS'): monkeypatch.delenv(name, raising=False)
+    for name, value in env.items(): monkeypatch.setenv(name, value)
+    sys.modules.pop(MODULE, None)
+    module = importlib.import_module(MODULE)
+    module.app.config['TESTING'] = True
+    return module
+
+@pytest.fixture(params=['combined', 'sharded'])
+def tracker(request, monkeypatch, tmp_path):
+    """The app module with a new data set, once per storage layout."""
+    module = load_tracker(monkeypatch, tmp_path, request.param)
+    yield module
+    sys.modules.pop(MODULE, None)
+
+@pytest.fixture
+def client(tracker):
+    return tracker.app.test_client()
+
+@pytest.fixture
+def combined_tracker(monkeypatch, tmp_path):
+    """The app module with a new data set in the combined layout only."""
+    module = load_tracker(monkeypatch, tmp_path, 'combined')
+    yield module
+    sys.modules.pop(MODULE, None)
+
+@pytest.fixture
+def sharded_tracker(monkeypatch, tmp_path):
+    """The app module with a new data set in the sharded layout only."""
+    module = load_tracker(monkeypatch, tmp_path, 'sharded')
+    yield module
+    sys.modules.pop(MODULE, None)
@@ -0,0 +1,54 @@
+import datetime
+import json
+
+ENTRIES = [{"user": "User 1", "date": "2025-05-01", "weight": 180.2},
+           {"user": "Nobody", "date": "2025-05-01", "weight": 150}]
+
+def post(client, key, entries=ENTRIES):
+    return client.post('/api/entries', data=json.dumps(entries), content_type='application/json',
+                       headers={'Idempotency-Key': key})
+
+def test_retry_replays_the_first_response(tracker, client):
+    first = post(client, 'scale-1')
+    assert first.status_code == 200
+    assert first.get_json()["created"] == 1 and first.get_json()["invalid"] == 1
+    retry = post(client, 'scale-1')
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    assert len(tracker.get_weight_entries('User 1')) == 1
+
+def test_replay_survives_a_restart(tracker, client):
+    first = post(client, 'scale-2')
+    tracker._idempotency._slots.clear()  # what a new process starts with
+    retry = post(client, 'scale-2')
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+
+def test_key_reused_for_another_body_is_rejected(tracker, client):
+    post(client, 'scale-3')
+    assert post(client, 'scale-3', ENTRIES[:1]).status_code == 422
+    tracker._idempotency._slots.clear()
+    assert post(client, 'scale-3', ENTRIES[:1]).status_code == 422
+
+def test_in_flight_keys_are_not_evicted(tracker, monkeypatch):
+    cache = tracker.IdempotencyCache(1)
+    store = tracker.get_store()
+    def nested():
+        # A second key arrives while the first is still being computed.
+        assert cache.run('b', 'fb', lambda: ({"n": 2}, 200), store) == ({"n": 2}, 200, False)
+        assert (store.snapshot_dir, 'a') in cache._slots
+        return {"n": 1}, 200
+    assert cache.run('a', 'fa', nested, store) == ({"n": 1}, 200, False)
+    assert cache.run('a', 'fa', lambda: ({"n": 0}, 200), store) == ({"n": 1}, 200, True)
+
+def test_a_full_batch_is_saved_in_one_commit(tracker, client):
+    tracker.get_store().add_user('User 2')
+    first = datetime.date(2020, 1, 1)
+    entries = [{"user": f"User {1 + i % 2}", "date": (first + datetime.timedelta(days=i // 2)).isoformat(), "weight": 150 + i % 50}
+               for i in range(tracker.API_MAX_BATCH)]
+    generation = tracker.get_store().snapshot().generation
+    commits = tracker._ingest.stats()["commits"]
+    response = post(client, 'bulk', entries)
+    assert response.status_code == 200 and response.get_json()["created"] == tracker.API_MAX_BATCH
+    assert tracker._ingest.stats()["commits"] == commits + 1
+    assert tracker.get_store().snapshot().generation == generation + 1
@@ -0,0 +1,61 @@
+import datetime
+import shutil
+
+import openpyxl
+
+def rebuild_snapshot_with_an_entry(tracker):
+    """Deletes the snapshot folder and adds a row to the workbook by hand, so versions start over."""
+    store = tracker.get_store()
+    shutil.rmtree(store.snapshot_dir)
+    workbook = openpyxl.load_workbook(tracker.EXCEL_FILE)
+    workbook["Weight Data"].append([datetime.date(2025, 1, 1), 180.0, 'User 1', None, None])
+    workbook.save(tracker.EXCEL_FILE)
+    return store.snapshot()
+
+def test_caches_do_not_outlive_a_deleted_snapshot(combined_tracker):
+    tracker = combined_tracker
+    store = tracker.get_store()
+    before = store.snapshot()
+    assert tracker.get_rollups('User 1').version == tracker.get_derived_metrics('User 1').version == 1
+    view = {"primary_user": 'User 1', "comparison_user": None}
+    etag = tracker.card_etag('history', view, before, store)
+    after = rebuild_snapshot_with_an_entry(tracker)
+    assert tracker._user_version(after, 'User 1') == 1
+    assert after.epoch != before.epoch
+    assert tracker.get_rollups('User 1', after).points('weight', 'day')[1] == [180.0]
+    assert tracker.get_derived_metrics('User 1', after).dates.tolist() == [datetime.date(2025, 1, 1).toordinal()]
+    assert tracker.card_etag('history', view, after, store) != etag
+
+def test_epoch_is_kept_across_generations(tracker):
+    store = tracker.get_store()
+    epoch = store.snapshot().epoch
+    tracker.create_user('Sam')
+    assert store.snapshot().epoch == epoch
+
+def test_store_footprint_counts_its_caches(tracker, client):
+    store = tracker.get_store()
+    client.post('/', data={'user': 'User 1', 'date': '2025-06-01', 'weight': '180'})
+    mapped = len(store.snapshot()._map)
+    tracker.forget_store_caches(store)
+    assert tracker._store_footprint(store) == mapped
+    client.get('/', query_string={'user1': 'User 1', 'compare_users': 'User 1'})
+    client.get('/leaderboard')
+    caches = tracker._cache_footprints()[store.snapshot_dir]
+    assert caches > 0
+    assert tracker._store_footprint(store) == mapped + caches
+
+def test_readded_user_does_not_get_the_old_users_caches(tracker, client):
+    client.post('/add_user', data={'new_user_name': 'Sam'})
+    client.post('/', data={'user': 'Sam', 'date': '2025-06-01', 'weight': '180'})
+    view = {'user1': 'Sam', 'compare_users': 'Sam'}
+    assert tracker.get_rollups('Sam').points('weight')[1] == [180.0]
+    client.get('/', query_string=view)
+    old_version = tracker._user_version(tracker.get_store().snapshot(), 'Sam')
+    client.post('/delete_user', data={'user': 'Sam'})
+    client.post('/add_user', data={'new_user_name': 'Sam'})
+    client.post('/', data={'user': 'Sam', 'date': '2025-06-02', 'weight': '150'})
+    assert tracker._user_version(tracker.get_store().snapshot(), 'Sam') > old_version
+    assert tracker.get_rollups('Sam').points('weight')[1] == [150.0]
+    assert tracker.get_derived_metrics('Sam').dates.tolist() == [tracker.parse_date('2025-06-02').toordinal()]
+    history = client.get('/fragments/history', query_string=view).get_data(as_text=True)
+    assert '150.00' in history and '180.00' not in history
@@ -0,0 +1,44 @@
+import datetime
+
+import pytest
+
+def add_readings(store, user, first, count, every):
+    start = datetime.date(2020, 1, 1) + datetime.timedelta(days=first)
+    store.add_entries([(start + datetime.timedelta(days=i * every), 180.0 - i / 100, user, None, None)
+                       for i in range(count)])
+
+@pytest.mark.parametrize('resample', [None, 'day', 'week'])
+def test_multi_year_comparison_stays_within_the_point_budget(tracker, resample):
+    store = tracker.get_store()
+    store.add_user('User 2')
+    store.update_goals('User 1', 200.0, 170.0)
+    store.update_goals('User 2', 190.0, 160.0)
+    add_readings(store, 'User 1', 0, 300, 6)  # each fits daily on its own, but not once merged
+    add_readings(store, 'User 2', 3, 300, 6)
+    view = {'primary_user': 'User 1', 'comparison_user': 'User 2', 'compare_users': ['User 1', 'User 2'],
+            'resample': resample, 'fill': 'ffill'}
+    snapshot = store.snapshot()
+    chart = tracker._chart_card(view, snapshot)
+    assert len(chart['combined_labels']) <= tracker.CHART_MAX_POINTS
+    assert len(chart['weight_chart']['data_1']) == len(chart['combined_labels'])
+    normalized = tracker._normalized_card(view, snapshot)['normalized_chart_data']
+    assert len(normalized['labels']) <= tracker.CHART_MAX_POINTS
+    assert normalized['grain'] == chart['chart_grain']
+
+def test_align_merges_series_in_date_order(tracker):
+    axis, columns = tracker.align_series([([1, 4, 9], [10, 40, 90]), ([2, 4, 8], [20, 41, 80]), ([], [])])
+    assert axis == [1, 2, 4, 8, 9]
+    assert columns == [[10, None, 40, None, 90], [None, 20, 41, 80, None], [None] * 5]
+
+def test_align_keeps_the_latest_point_of_a_slot(tracker):
+    axis, columns = tracker.align_series([([5, 5, 6], [1, 2, 3])])
+    assert axis == [5, 6] and columns == [[2, 3]]
+    monday = tracker._week_start(738000)
+    axis, columns = tracker.align_series([([monday + 1, monday + 3, monday + 9], [1, 2, 3]), ([monday + 2], [7])],
+                                         'week', 'ffill')
+    assert axis == [monday, monday + 7] and columns == [[2, 3], [7, None]]
+
+def test_align_fills_gaps_between_known_values_only(tracker):
+    axis, columns = tracker.align_series([([1, 4], [10.0, 40.0]), ([2, 3], [5.0, 6.0])], 'day', 'interpolate')
+    assert axis == [1, 2, 3, 4]
+    assert columns == [[10.0, 20.0, 30.0, 40.0], [None, 5.0, 6.0, None]]
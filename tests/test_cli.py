@@ -0,0 +1,30 @@
+import pytest
+
+import weight_cli
+
+def run_batch(tmp_path, text):
+    ops = tmp_path / 'ops.txt'
+    ops.write_text(text)
+    weight_cli.main(['batch', str(ops)])
+
+def test_failed_batch_saves_nothing(tracker, tmp_path):
+    with pytest.raises(SystemExit, match="Line 3: .*Nothing was saved"):
+        run_batch(tmp_path, 'add-user Sam\nadd-entry Sam 2025-01-01 180\nadd-entry Nobody 2025-01-01 150\n')
+    reopened = tracker.open_store(tracker.EXCEL_FILE)
+    assert [u["name"] for u in reopened.snapshot().users] == ['User 1']
+    if isinstance(reopened, tracker.ShardedStore):
+        assert [u["name"] for u in reopened.read_manifest()] == ['User 1']
+
+def test_batch_applies_every_line(tracker, tmp_path):
+    run_batch(tmp_path, 'add-user Sam\nadd-entry Sam 2025-01-01 180\nset-goals Sam --start 200 --goal 170 --height 70\n')
+    assert tracker.get_user_data('Sam') == {"start_weight": 200.0, "goal_weight": 170.0,
+                                            "daily_aggregation": 'last', "height": 70.0}
+    assert [e.weight for e in tracker.get_weight_entries('Sam')] == [180.0]
+
+def test_later_set_goals_in_a_batch_sees_earlier_ones(tracker, tmp_path):
+    run_batch(tmp_path, 'set-goals "User 1" --start 200 --height 70\nset-goals "User 1" --goal 150\n'
+                        'add-user Sam\nset-goals Sam --goal 140\nset-goals Sam --aggregation min\n')
+    assert tracker.get_user_data('User 1') == {"start_weight": 200.0, "goal_weight": 150.0,
+                                               "daily_aggregation": 'last', "height": 70.0}
+    assert tracker.get_user_data('Sam') == {"start_weight": None, "goal_weight": 140.0,
+                                            "daily_aggregation": 'min', "height": None}
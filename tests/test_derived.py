@@ -0,0 +1,44 @@
+import pytest
+
+def set_goals(client, **form):
+    return client.post('/update_goals', data={'user': 'User 1', 'start_weight': '200', 'goal_weight': '170', **form})
+
+def test_blank_height_clears_it(tracker, client):
+    set_goals(client, height='70')
+    assert tracker.get_user_data('User 1')["height"] == 70.0
+    set_goals(client, height='')
+    assert tracker.get_user_data('User 1')["height"] is None
+    tracker.get_store().refresh()  # the files agree with the snapshot
+    assert tracker.get_user_data('User 1')["height"] is None
+
+@pytest.mark.parametrize('height', ['0', '-70', 'nan'])
+def test_height_must_be_positive(tracker, client, height):
+    set_goals(client, height='70')
+    set_goals(client, height=height)
+    assert tracker.get_user_data('User 1')["height"] == 70.0
+
+@pytest.mark.parametrize('policy, expected', [('last', 2.0), ('mean', 1.5), ('min', 1.0)])
+def test_daily_points_follow_the_aggregation_policy(tracker, policy, expected):
+    np = tracker.np
+    dates = [5, 5, 6] if np is None else np.array([5, 5, 6], dtype=np.int64)
+    values = [1.0, 2.0, 4.0] if np is None else np.array([1.0, 2.0, 4.0])
+    derived = tracker.DerivedMetrics(dates, {'bmi': values}, policy=policy)
+    assert derived.points('bmi') == ([5, 6], [expected, 4.0])
+    assert derived.points('bmi', 'week') == ([1], [(expected + 4.0) / 2])
+
+@pytest.mark.parametrize('policy, expected', [('last', 2.0), ('mean', 1.5), ('min', 1.0)])
+def test_latest_follows_the_aggregation_policy(tracker, policy, expected):
+    np = tracker.np
+    dates = [5, 6, 6, 7] if np is None else np.array([5, 6, 6, 7], dtype=np.int64)
+    nan = float('nan')
+    values = [4.0, 1.0, 2.0, nan] if np is None else np.array([4.0, 1.0, 2.0, nan])
+    derived = tracker.DerivedMetrics(dates, {'bmi': values}, policy=policy)
+    assert derived.latest('bmi') == expected == derived.points('bmi')[1][-1]
+
+def test_dashboard_uses_the_users_policy(tracker, client):
+    set_goals(client, height='70', daily_aggregation='min')
+    for weight in ('180', '170'):
+        client.post('/', data={'user': 'User 1', 'date': '2025-06-01', 'weight': weight})
+    derived = tracker.get_derived_metrics('User 1')
+    assert derived.policy == 'min'
+    assert derived.points('bmi')[1] == [pytest.approx(703 * 170 / 70 ** 2)]
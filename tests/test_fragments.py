@@ -0,0 +1,33 @@
+import pytest
+
+VIEW = {'user1': 'User 1', 'compare_users': 'User 1'}
+
+def add_entry(client, date, weight, user='User 1'):
+    client.post('/', data={'user': user, 'date': date, 'weight': weight})
+
+@pytest.mark.parametrize('card', ['history', 'summary', 'chart', 'normalized'])
+def test_card_revalidates_until_its_data_changes(tracker, client, card):
+    add_entry(client, '2025-06-01', '180')
+    first = client.get(f'/fragments/{card}', query_string=VIEW)
+    assert first.status_code == 200 and first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+    etag = first.headers['ETag']
+    assert client.get(f'/fragments/{card}', query_string=VIEW,
+                      headers={'If-None-Match': etag}).status_code == 304
+    add_entry(client, '2025-06-02', '179')
+    changed = client.get(f'/fragments/{card}', query_string=VIEW, headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+
+def test_history_card_shows_the_new_entry(tracker, client):
+    add_entry(client, '2025-06-01', '180.5')
+    assert '180.50' in client.get('/fragments/history', query_string={'user1': 'User 1'}).get_data(as_text=True)
+
+def test_unknown_card(tracker, client):
+    assert client.get('/fragments/nope').status_code == 404
+
+def test_closing_a_store_forgets_its_cards(tracker, client):
+    client.get('/fragments/history', query_string={'user1': 'User 1'})
+    store = tracker.get_store()
+    assert any(key[0] == store.snapshot_dir for key in tracker._card_cache)
+    tracker.forget_store_caches(store)
+    assert not any(key[0] == store.snapshot_dir for key in tracker._card_cache)
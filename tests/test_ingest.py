@@ -0,0 +1,60 @@
+import datetime
+import time
+
+import pytest
+
+def entry(day, weight, user='User 1'):
+    return (datetime.date(2025, 3, day), weight, user, None, None)
+
+def test_submit_dedupes_within_and_across_commits(tracker):
+    assert tracker._ingest.submit([entry(1, 180.0), entry(1, 180.0), entry(2, 179.5)]) == ['created', 'duplicate', 'created']
+    assert tracker._ingest.submit([entry(2, 179.5)]) == ['duplicate']
+    assert [e.weight for e in tracker.get_weight_entries('User 1')] == [179.5, 180.0]
+
+def test_failed_commit_reaches_the_caller_and_the_writer_keeps_running(tracker, monkeypatch):
+    store = tracker.get_store()
+    add_entries = store.add_entries
+    def broken(entries):
+        raise OSError("disk full")
+    monkeypatch.setattr(store, 'add_entries', broken)
+    with pytest.raises(OSError, match="disk full"):
+        tracker._ingest.submit([entry(1, 180.0)])
+    monkeypatch.setattr(store, 'add_entries', add_entries)
+    assert tracker._ingest.submit([entry(1, 180.0)]) == ['created']
+
+def test_cache_update_failure_does_not_fail_saved_entries(tracker, monkeypatch):
+    def broken(store, entries):
+        raise RuntimeError("cache")
+    monkeypatch.setattr(tracker, '_absorb_appends', broken)
+    assert tracker._ingest.submit([entry(1, 180.0)]) == ['created']
+    thread = tracker._ingest._thread
+    assert tracker._ingest.submit([entry(2, 179.0)]) == ['created']
+    assert tracker._ingest._thread is thread and thread.is_alive()
+
+def test_submit_gives_up_after_the_wait_timeout(tracker, monkeypatch):
+    store = tracker.get_store()
+    add_entries = store.add_entries
+    def slow(entries):
+        time.sleep(0.5)
+        add_entries(entries)
+    monkeypatch.setattr(store, 'add_entries', slow)
+    monkeypatch.setattr(tracker, 'INGEST_WAIT_TIMEOUT', 0.05)
+    with pytest.raises(tracker.StorageBusyError):
+        tracker._ingest.submit([entry(1, 180.0)])
+
+def test_a_request_larger_than_a_window_is_committed_whole(tracker):
+    ingest = tracker.IngestQueue(0.05, 10, 100)
+    generation = tracker.get_store().snapshot().generation
+    entries = [(datetime.date(2025, 3, 1) + datetime.timedelta(days=i), 180.0 - i / 10, 'User 1', None, None)
+               for i in range(25)]
+    assert ingest.submit(entries) == ['created'] * 25
+    assert ingest.stats()["commits"] == 1 and ingest.stats()["queue_depth"] == 0
+    assert tracker.get_store().snapshot().generation == generation + 1
+
+def test_a_request_is_queued_whole_or_not_at_all(tracker, monkeypatch):
+    monkeypatch.setattr(tracker, 'STORAGE_WAIT_TIMEOUT', 0.05)
+    ingest = tracker.IngestQueue(0.05, 10, 3)
+    ingest._pending = 2  # another request still being saved
+    with pytest.raises(tracker.StorageBusyError):
+        ingest.submit([entry(1, 180.0), entry(2, 179.5)])
+    assert ingest._pending == 2 and ingest._queue.empty()
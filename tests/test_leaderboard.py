@@ -0,0 +1,15 @@
+def test_leaderboard_lists_users_without_entries_last(tracker, client):
+    client.post('/add_user', data={'new_user_name': 'Sam'})
+    client.post('/', data={'user': 'Sam', 'date': '2025-06-01', 'weight': '180'})
+    client.post('/update_goals', data={'user': 'Sam', 'start_weight': '200', 'goal_weight': '170'})
+    response = client.get('/leaderboard')
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert page.index('Sam') < page.index('User 1')
+    assert '10.00%' in page
+
+def test_leaderboard_with_only_an_empty_user(tracker, client):
+    for sort in tracker.LEADERBOARD_SORTS:
+        response = client.get('/leaderboard', query_string={'sort': sort})
+        assert response.status_code == 200
+        assert 'User 1' in response.get_data(as_text=True)
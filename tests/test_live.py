@@ -0,0 +1,47 @@
+import json
+import sys
+
+import pytest
+
+from conftest import MODULE, load_tracker
+
+@pytest.fixture
+def live(tracker, monkeypatch):
+    """Live updates on, as under ASGI; the tests run in dev mode."""
+    monkeypatch.setattr(tracker, 'LIVE_UPDATES', True)
+
+def test_events_stream_delta_after_write(tracker, client, live):
+    response = client.get('/events', query_string={'user': 'User 1'}, buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    chunks = response.iter_encoded()
+    assert next(chunks) == b"retry: 5000\n\n"
+    assert tracker.live_updates.streams == 1
+    client.post('/', data={'user': 'User 1', 'date': '2025-06-01', 'weight': '180.5'})
+    event = next(chunks).decode()
+    message = json.loads(event.split('data: ', 1)[1])
+    assert [row["weight"] for row in message["entries"]] == [180.5]
+    response.close()
+    assert tracker.live_updates.streams == 0
+    assert not tracker.live_updates._watched
+
+def test_events_release_the_slot_when_the_snapshot_is_busy(tracker, client, live, monkeypatch):
+    def busy():
+        raise tracker.StorageBusyError("busy")
+    monkeypatch.setattr(tracker.get_store(), 'snapshot', busy)
+    assert client.get('/events', query_string={'user': 'User 1'}).status_code == 503
+    assert tracker.live_updates.streams == 0
+
+def test_events_refuse_streams_beyond_the_limit(tracker, client, live, monkeypatch):
+    monkeypatch.setattr(tracker, 'LIVE_MAX_STREAMS', 0)
+    assert client.get('/events', query_string={'user': 'User 1'}).status_code == 503
+    assert not tracker.live_updates._watched
+
+@pytest.mark.parametrize('mode, expected', [('dev', False), ('asgi', True)])
+def test_live_updates_are_on_by_default_only_under_asgi(monkeypatch, tmp_path, mode, expected):
+    monkeypatch.delenv('WEIGHT_TRACKER_LIVE_UPDATES', raising=False)
+    assert load_tracker(monkeypatch, tmp_path, WEIGHT_TRACKER_SERVER=mode).LIVE_UPDATES is expected
+    sys.modules.pop(MODULE, None)
+
+def test_events_are_off_by_default_in_dev_mode(tracker, client):
+    assert client.get('/events', query_string={'user': 'User 1'}).status_code == 404
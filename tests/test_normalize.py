@@ -0,0 +1,49 @@
+import builtins
+
+def test_normalize_stamps_the_workbook(combined_tracker):
+    summary = combined_tracker.normalize_workbook()
+    assert summary["stamped"]
+    assert combined_tracker.schema_version(combined_tracker.get_store().load_workbook()) == combined_tracker.SCHEMA_VERSION
+
+def test_normalize_without_custom_properties_saves_unstamped(combined_tracker, monkeypatch):
+    real_import = builtins.__import__
+    def old_openpyxl(name, *args, **kwargs):
+        if name == 'openpyxl.packaging.custom': raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+    monkeypatch.setattr(builtins, '__import__', old_openpyxl)
+    combined_tracker.get_store().add_entries([(combined_tracker.parse_date('2025-01-02'), 180.0, 'User 1', None, None)])
+    summary = combined_tracker.normalize_workbook()
+    assert summary == {"entries": 1, "quarantined": 0, "users": 1, "dropped_users": 0, "stamped": False}
+    assert combined_tracker.schema_version(combined_tracker.get_store().load_workbook()) is None
+
+def readings(tracker):
+    return [(tracker.parse_date(f'2025-01-{day:02d}'), 180.0 - day, user, 20.5 if day % 2 else None, None)
+            for day in range(1, 8) for user in ('User 1', 'Ghost')]
+
+def as_floats(records):
+    return repr([record[:3] + tuple(map(float, record[3:])) for record in records])
+
+def test_fast_path_matches_the_full_parse(combined_tracker, monkeypatch):
+    tracker = combined_tracker
+    tracker.get_store().add_entries(readings(tracker))
+    tracker.normalize_workbook()
+    workbook = tracker.get_store().load_workbook()
+    with monkeypatch.context() as unstamped:
+        unstamped.setattr(tracker, 'schema_version', lambda workbook: None)
+        slow = tracker._columns_from_workbook(workbook)
+    def unexpected(*args):
+        raise AssertionError("the stamped workbook should not be parsed row by row")
+    monkeypatch.setattr(tracker, '_record_from_row', unexpected)
+    fast = tracker._columns_from_workbook(workbook)
+    assert fast[0] == slow[0]
+    assert as_floats(fast[1]) == as_floats(slow[1])  # openpyxl reads whole numbers back as ints
+
+def test_hand_edited_workbook_falls_back_to_the_full_parse(combined_tracker):
+    tracker = combined_tracker
+    tracker.get_store().add_entries(readings(tracker))
+    tracker.normalize_workbook()
+    workbook = tracker.get_store().load_workbook()
+    workbook["Weight Data"].cell(row=2, column=2).value = "181"  # typed as text, as in a hand edit
+    users, records = tracker._columns_from_workbook(workbook)
+    assert len(records) == len(readings(tracker))
+    assert all(isinstance(record[3], float) for record in records)
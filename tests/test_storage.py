@@ -0,0 +1,79 @@
+import datetime
+
+import pytest
+
+class Abort(Exception):
+    pass
+
+def entry(user, day, weight):
+    return (datetime.date(2025, 1, day), weight, user, None, None)
+
+def test_batch_writes_nothing_when_it_fails(tracker):
+    store = tracker.get_store()
+    generation = store.snapshot().generation
+    with pytest.raises(Abort):
+        with store.batch():
+            store.add_user('Sam')
+            store.add_entries([entry('Sam', 1, 180.0)])
+            store.delete_user('User 1')
+            raise Abort
+    reopened = tracker.open_store(tracker.EXCEL_FILE)
+    assert reopened.snapshot().generation == generation
+    assert tracker.get_users() == ['User 1']
+    if isinstance(store, tracker.ShardedStore):
+        assert [u["name"] for u in store.read_manifest()] == ['User 1']
+        assert not tracker.os.path.exists(store._shard_path('Sam'))
+
+def test_batch_publishes_once(tracker):
+    store = tracker.get_store()
+    generation = store.snapshot().generation
+    with store.batch():
+        store.add_user('Sam')
+        store.add_entries([entry('Sam', 1, 180.0), entry('Sam', 2, 179.0)])
+        store.update_goals('Sam', 200.0, 170.0)
+        store.delete_user('User 1')
+    assert store.snapshot().generation == generation + 1
+    assert tracker.get_users() == ['Sam']
+    assert [e.weight for e in tracker.get_weight_entries('Sam')] == [179.0, 180.0]
+    assert tracker.get_user_data('Sam')["goal_weight"] == 170.0
+    store.refresh()
+    assert [e.weight for e in tracker.get_weight_entries('Sam')] == [179.0, 180.0]
+
+def test_sharded_entries_for_unknown_users_are_rejected(sharded_tracker):
+    store = sharded_tracker.get_store()
+    generation = store.snapshot().generation
+    with pytest.raises(ValueError, match="Nobody"):
+        store.add_entries([entry('User 1', 1, 180.0), entry('Nobody', 1, 150.0)])
+    assert store.snapshot().generation == generation
+    assert len(sharded_tracker.get_weight_entries('User 1')) == 0
+    assert not sharded_tracker.os.path.exists(store._shard_path('Nobody'))
+
+def test_form_rejects_unknown_users(tracker, client):
+    client.post('/', data={'user': 'Nobody', 'date': '2025-06-01', 'weight': '150'})
+    assert tracker.get_store().snapshot().user_index.get('Nobody') is None
+    assert len(tracker.get_weight_entries('Nobody')) == 0
+
+def test_publish_survives_an_old_generation_that_cannot_be_removed(tracker, monkeypatch):
+    store = tracker.get_store()
+    remove = tracker.os.remove
+    def locked(path):
+        if tracker.os.path.basename(path).startswith('gen-'): raise PermissionError(path)
+        remove(path)
+    monkeypatch.setattr(tracker.os, 'remove', locked)
+    for day in range(1, tracker.SNAPSHOT_KEEP + 2):
+        store.add_entries([entry('User 1', day, 180.0)])
+    assert len(tracker.get_weight_entries('User 1')) == tracker.SNAPSHOT_KEEP + 1
+
+def test_publishing_rolls_generations_over(tracker):
+    store = tracker.get_store()
+    for day in range(1, tracker.SNAPSHOT_KEEP + 3):
+        store.add_entries([entry('User 1', day, 180.0)])
+    generation = store.snapshot().generation
+    with open(tracker.os.path.join(store.snapshot_dir, 'CURRENT')) as f:
+        assert int(f.read()) == generation
+    kept = sorted(int(name[4:-4]) for name in tracker.os.listdir(store.snapshot_dir)
+                  if name.startswith('gen-') and name.endswith('.bin'))
+    assert kept == list(range(generation - tracker.SNAPSHOT_KEEP + 1, generation + 1))
+    reopened = tracker.open_store(tracker.EXCEL_FILE)
+    assert reopened.snapshot().generation == generation
+    assert len(tracker.get_weight_entries('User 1')) == tracker.SNAPSHOT_KEEP + 2
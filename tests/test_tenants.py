@@ -0,0 +1,43 @@
+import sys
+
+import pytest
+
+from conftest import MODULE, load_tracker
+
+@pytest.fixture
+def tenants(monkeypatch, tmp_path):
+    """The app module in prefix multi-tenant mode with households 'a', 'b' and 'c'."""
+    module = load_tracker(monkeypatch, tmp_path, WEIGHT_TRACKER_TENANCY='prefix',
+                          WEIGHT_TRACKER_TENANT_DIR=str(tmp_path / 'tenants'))
+    for tenant in 'abc': module.tenant_stores.create(tenant)
+    yield module
+    sys.modules.pop(MODULE, None)
+
+def visit(client, *tenants):
+    for tenant in tenants:
+        assert client.get(f'/{tenant}/').status_code == 200
+
+def test_unknown_household_is_not_found(tenants):
+    assert tenants.app.test_client().get('/nobody/').status_code == 404
+
+def test_least_recently_used_store_is_dropped_over_budget(tenants):
+    client, stores = tenants.app.test_client(), tenants.tenant_stores
+    visit(client, 'a', 'b', 'c', 'a')
+    assert list(stores._stores) == ['b', 'c', 'a']
+    dropped = stores._stores['b'][0]
+    caches = tenants._cache_footprints()
+    assert caches.get(dropped.snapshot_dir)  # its dashboard left something cached
+    stores.budget = sum(tenants._store_footprint(stores._stores[t][0], caches) for t in 'ca')
+    visit(client, 'c')
+    assert list(stores._stores) == ['a', 'c']
+    assert stores.stats()["evicted"] == 1 and stores.stats()["bytes"] <= stores.budget
+    assert dropped.snapshot_dir not in tenants._cache_footprints()
+    visit(client, 'b')  # reopened from its sidecar
+    assert stores.stats()["opened"] == 4
+
+def test_idle_stores_are_dropped(tenants):
+    client, stores = tenants.app.test_client(), tenants.tenant_stores
+    visit(client, 'a', 'b')
+    stores.idle_seconds = 0
+    visit(client, 'c')
+    assert list(stores._stores) == ['c']
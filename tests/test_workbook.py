@@ -0,0 +1,36 @@
+import datetime
+
+import openpyxl
+
+def test_rows_with_unreadable_dates_are_reported(combined_tracker):
+    tracker = combined_tracker
+    workbook = openpyxl.load_workbook(tracker.EXCEL_FILE)
+    sheet = workbook["Weight Data"]
+    sheet.append([datetime.date(2025, 1, 1), 180.0, 'User 1', None, None])
+    sheet.append(['05/01/2024', 181.0, 'User 1', None, None])
+    sheet.append([None, None, None, None, None])
+    workbook.save(tracker.EXCEL_FILE)
+    client = tracker.app.test_client()
+    page = client.get('/', query_string={'user1': 'User 1'}).get_data(as_text=True)
+    assert '1 row of weight data could not be read' in page
+    assert 'row 3 (User 1), missing or invalid date' in page
+    assert [e.weight for e in tracker.get_weight_entries('User 1')] == [180.0]
+    # Appending through the app keeps the report.
+    client.post('/', data={'user': 'User 1', 'date': '2025-01-02', 'weight': '179'})
+    assert 'row 3 (User 1)' in client.get('/', query_string={'user1': 'User 1'}).get_data(as_text=True)
+    tracker.normalize_workbook()
+    assert 'could not be read' not in client.get('/', query_string={'user1': 'User 1'}).get_data(as_text=True)
+
+def test_shard_rows_with_unreadable_dates_are_reported(sharded_tracker):
+    tracker = sharded_tracker
+    store = tracker.get_store()
+    workbook = tracker._new_shard_workbook()
+    workbook["Weight Data"].append(['next tuesday', 181.0, None, None, None])
+    workbook.save(store._shard_path('User 1'))
+    store.refresh()
+    client = tracker.app.test_client()
+    assert 'row 2 (User 1), missing or invalid date' in client.get('/').get_data(as_text=True)
+    client.post('/', data={'user': 'User 1', 'date': '2025-01-02', 'weight': '179'})
+    assert 'row 2 (User 1)' in client.get('/').get_data(as_text=True)
+    client.get('/delete/2', query_string={'user': 'User 1'})
+    assert 'could not be read' not in client.get('/').get_data(as_text=True)
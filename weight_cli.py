@@ -0,0 +1,185 @@
+"""Headless command line for the weight tracker.
+
+Runs the same data functions as the web app without starting the server
+or rewriting the stylesheet. Every write command opens the workbook once,
+applies its operations and saves once; `batch` does that for a whole file
+of commands.
+
+    python -m weight_cli users
+    python -m weight_cli add-entry "User 1" 2024-05-01 180.2 --body-fat 21.5
+    python -m weight_cli export -o weights.csv
+    python -m weight_cli batch ops.txt      # one command per line, e.g. `add-user Sam`
+"""
+import os
+import sys
+import csv
+import shlex
+import argparse
+
+os.environ.setdefault('WEIGHT_TRACKER_HEADLESS', '1')
+
+class CommandError(Exception):
+    """A command that cannot be applied; aborts the whole batch."""
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m weight_cli', description="Weight tracker maintenance commands.")
+    parser.add_argument('--data', help="workbook to use (default: weights.xlsx next to the app)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('users', help="list users with their goals and entry counts")
+    p = commands.add_parser('entries', help="print a user's entries as CSV, oldest first")
+    p.add_argument('user')
+    p = commands.add_parser('export', help="write every entry as CSV")
+    p.add_argument('--user', action='append', help="only these users (repeatable)")
+    p.add_argument('-o', '--output', help="file to write (default: stdout)")
+    commands.add_parser('recompute', help="re-read the workbook and rebuild its snapshot")
+
+    p = commands.add_parser('add-user', help="add users")
+    p.add_argument('names', nargs='+')
+    p = commands.add_parser('delete-user', help="delete users and all their entries")
+    p.add_argument('names', nargs='+')
+    p = commands.add_parser('set-goals', help="set start/goal weight, same-day aggregation and height")
+    p.add_argument('user')
+    p.add_argument('--start', type=float)
+    p.add_argument('--goal', type=float)
+    p.add_argument('--aggregation', choices=('last', 'mean', 'min'))
+    height = p.add_mutually_exclusive_group()
+    height.add_argument('--height', type=float, help="height in inches, for BMI and waist-to-height ratio")
+    height.add_argument('--clear-height', action='store_true', help="forget the stored height")
+    p = commands.add_parser('add-entry', help="add one weigh-in")
+    p.add_argument('user')
+    p.add_argument('date', help="YYYY-MM-DD")
+    p.add_argument('weight')
+    p.add_argument('--body-fat')
+    p.add_argument('--waist')
+    p = commands.add_parser('delete-entries', help="delete a user's entries, optionally within a date range")
+    p.add_argument('user')
+    p.add_argument('--from', dest='first', help="first date to delete, YYYY-MM-DD")
+    p.add_argument('--to', dest='last', help="last date to delete, YYYY-MM-DD")
+    p = commands.add_parser('batch', help="apply write commands from a file (or stdin) with one load and one save")
+    p.add_argument('file', nargs='?', default='-')
+    return parser
+
+WRITE_COMMANDS = ('add-user', 'delete-user', 'set-goals', 'add-entry', 'delete-entries')
+
+class Session:
+    """Applies commands to one store, tracking users added or removed and goals set since it was opened.
+
+    Reads come from the snapshot, which a batch only republishes at the end, so
+    later commands in a batch look up what earlier ones changed here.
+    """
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.store = tracker.get_store()
+        self.users = set(tracker.get_users())
+        self.goals = {}  # user -> settings set by earlier commands
+
+    def run(self, args, out=sys.stdout):
+        t = self.tracker
+        if args.command == 'users':
+            snapshot = self.store.snapshot()
+            writer = csv.writer(out)
+            writer.writerow(["user", "start_weight", "goal_weight", "daily_aggregation", "height", "entries"])
+            for name in t.get_users():
+                data, (start, stop) = t.get_user_data(name), snapshot.user_range(name)
+                writer.writerow([name, data["start_weight"], data["goal_weight"], data["daily_aggregation"], data["height"],
+                                 stop - start])
+        elif args.command == 'entries':
+            self._export([args.user], out)
+        elif args.command == 'export':
+            if args.output:
+                with open(args.output, 'w', newline='') as f: self._export(args.user or t.get_users(), f)
+            else:
+                self._export(args.user or t.get_users(), out)
+        elif args.command == 'recompute':
+            self.store.refresh()
+        elif args.command == 'add-user':
+            for name in args.names:
+                if not t.create_user(name): raise CommandError(f"User '{name}' already exists.")
+                self.users.add(name)
+                self.goals[name] = {"start_weight": None, "goal_weight": None,
+                                    "daily_aggregation": t.DEFAULT_DAILY_AGGREGATION, "height": None}
+        elif args.command == 'delete-user':
+            for name in args.names:
+                self._require_user(name)
+                t.delete_user_data(name)
+                self.users.discard(name)
+                self.goals.pop(name, None)
+        elif args.command == 'set-goals':
+            self._require_user(args.user)
+            current = self.goals.get(args.user) or t.get_user_data(args.user)
+            start = args.start if args.start is not None else current["start_weight"]
+            goal = args.goal if args.goal is not None else current["goal_weight"]
+            if args.clear_height: height = None
+            elif args.height is None: height = current["height"]
+            elif args.height > 0: height = args.height
+            else: raise CommandError("Height must be a positive number of inches.")
+            t.update_user_goals(args.user, start, goal, args.aggregation, height)
+            self.goals[args.user] = {"start_weight": start, "goal_weight": goal,
+                                     "daily_aggregation": args.aggregation or current["daily_aggregation"], "height": height}
+        elif args.command == 'add-entry':
+            entry, error = t.validate_api_entry({"user": args.user, "date": args.date, "weight": args.weight,
+                                                 "body_fat": args.body_fat, "waist_size": args.waist}, self.users)
+            if error: raise CommandError(error)
+            self.store.add_entries([entry])
+        elif args.command == 'delete-entries':
+            self._require_user(args.user)
+            first, last = (self._date(v) if v else None for v in (args.first, args.last))
+            print(f"Deleted {t.delete_weight_entries(args.user, first, last)} entries for {args.user}.", file=sys.stderr)
+
+    def _require_user(self, name):
+        if name not in self.users: raise CommandError(f"Unknown user '{name}'.")
+
+    def _date(self, text):
+        value = self.tracker.parse_date(text)
+        if value is None: raise CommandError(f"Invalid date '{text}'; use YYYY-MM-DD.")
+        return value
+
+    def _export(self, users, out):
+        writer = csv.writer(out)
+        writer.writerow(["user", "date", "weight", "body_fat", "waist_size"])
+        for name in users:
+            for e in self.tracker.get_weight_entries(name)[::-1]:
+                writer.writerow([name, e.date, e.weight, "" if e.body_fat is None else e.body_fat,
+                                 "" if e.waist_size is None else e.waist_size])
+
+def run_batch(session, parser, lines):
+    """Parses every line first, then applies them all inside one store batch."""
+    commands = []
+    for number, line in enumerate(lines, start=1):
+        words = shlex.split(line, comments=True)
+        if not words: continue
+        if words[0] not in WRITE_COMMANDS:
+            raise CommandError(f"Line {number}: '{words[0]}' cannot be batched; use one of {', '.join(WRITE_COMMANDS)}.")
+        try: commands.append((number, parser.parse_args(words)))
+        except SystemExit: raise CommandError(f"Line {number}: could not parse '{line.strip()}'.")
+    with session.store.batch():
+        for number, args in commands:
+            try: session.run(args)
+            except CommandError as e: raise CommandError(f"Line {number}: {e} Nothing was saved.")
+    return len(commands)
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.data: os.environ['WEIGHT_TRACKER_DATA_FILE'] = os.path.abspath(args.data)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import weight_tracking_og2 as tracker
+
+    tracker.prepare_store(tracker.get_store(), tracker.EXCEL_FILE, log=lambda message: None)
+    session = Session(tracker)
+    try:
+        if args.command == 'batch':
+            f = sys.stdin if args.file == '-' else open(args.file)
+            with f: count = run_batch(session, parser, f)
+            print(f"Applied {count} commands.", file=sys.stderr)
+        elif args.command in WRITE_COMMANDS:
+            with session.store.batch(): session.run(args)
+        else:
+            session.run(args)
+    except CommandError as e:
+        raise SystemExit(f"error: {e}")
+
+if __name__ == '__main__':
+    main()
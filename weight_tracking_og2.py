@@ -1,8 +1,40 @@
 import os
+import sys
+import re
+import json
+import hashlib
+import secrets
+import mmap
+import math
+import struct
 import datetime
-from flask import Flask, render_template_string, request, redirect, url_for, flash
+import tempfile
+import threading
+import time
+import queue
+import heapq
+from bisect import bisect_left, bisect_right, insort
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from collections import OrderedDict, deque
+from contextlib import ExitStack, contextmanager, nullcontext
+from operator import itemgetter
+from itertools import repeat
+from flask import (Flask, Response, render_template_string, request, redirect, url_for, flash, get_flashed_messages,
+                   has_request_context, session)
 import openpyxl
 
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within one process.
+    fcntl = None
+try:
+    import numpy as np
+except ImportError:  # derived metrics fall back to a plain loop.
+    np = None
+
+NAN = float('nan')
+
 # --- Configuration ---
 # This script creates a complete Flask application in a single file.
 # It will generate the necessary HTML and CSS files automatically.
@@ -14,7 +46,65 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Define the folder structure using absolute paths
 STATIC_FOLDER = os.path.join(BASE_DIR, 'static')
 CSS_FILE = os.path.join(STATIC_FOLDER, 'style.css')
-EXCEL_FILE = os.path.join(BASE_DIR, 'weights.xlsx')
+EXCEL_FILE = os.environ.get('WEIGHT_TRACKER_DATA_FILE') or os.path.join(BASE_DIR, 'weights.xlsx')
+DATA_HEADERS = ["Date", "Weight (lbs)", "User", "Body Fat %", "Waist Size (in)"]
+USER_HEADERS = ["Username", "Start Weight (lbs)", "Goal Weight (lbs)", "Daily Aggregation", "Height (in)"]
+
+# How several weigh-ins on the same day are combined into that day's value.
+DAILY_AGGREGATIONS = ('last', 'mean', 'min')
+DEFAULT_DAILY_AGGREGATION = 'last'
+
+# Storage layout: 'combined' keeps everyone in EXCEL_FILE; 'sharded' keeps one
+# workbook per user in SHARD_DIR with a users.json manifest, so a write only
+# rewrites that user's data. Convert with `python weight_tracking_og2.py migrate-shards`.
+STORAGE_LAYOUT = os.environ.get('WEIGHT_TRACKER_LAYOUT', 'combined')
+SHARD_DIR = os.path.join(os.path.dirname(EXCEL_FILE), 'weights_shards')
+
+# Workbook loads and saves run on a small bounded pool. At most
+# STORAGE_MAX_PENDING jobs may be queued or running; callers wait up to
+# STORAGE_WAIT_TIMEOUT seconds for a slot before the request is rejected.
+STORAGE_WORKERS = int(os.environ.get('WEIGHT_TRACKER_STORAGE_WORKERS', '4'))
+STORAGE_MAX_PENDING = int(os.environ.get('WEIGHT_TRACKER_STORAGE_MAX_PENDING', '32'))
+STORAGE_WAIT_TIMEOUT = float(os.environ.get('WEIGHT_TRACKER_STORAGE_WAIT_TIMEOUT', '10'))
+
+# Serving mode: 'dev' runs Flask's built-in server, 'asgi' runs uvicorn with
+# request handlers on a bounded thread pool so slow clients only cost a coroutine.
+SERVER_MODE = os.environ.get('WEIGHT_TRACKER_SERVER', 'dev')
+ASGI_REQUEST_WORKERS = int(os.environ.get('WEIGHT_TRACKER_REQUEST_WORKERS', '16'))
+
+# Multi-tenant hosting: with WEIGHT_TRACKER_TENANCY set to 'subdomain'
+# (smiths.example.com) or 'prefix' (example.com/smiths/), each household has
+# its own data files in TENANT_DIR/<tenant>/. Open tenant stores are kept in
+# an LRU capped at TENANT_CACHE_MB of mapped snapshots and dropped after
+# TENANT_IDLE_SECONDS without requests. TENANT_DOMAIN, if set, is the parent
+# domain stripped from the host in subdomain mode.
+TENANCY = os.environ.get('WEIGHT_TRACKER_TENANCY', '')
+TENANT_DIR = os.environ.get('WEIGHT_TRACKER_TENANT_DIR') or os.path.join(BASE_DIR, 'tenants')
+TENANT_DOMAIN = os.environ.get('WEIGHT_TRACKER_TENANT_DOMAIN', '')
+TENANT_CACHE_MB = int(os.environ.get('WEIGHT_TRACKER_TENANT_CACHE_MB', '256'))
+TENANT_IDLE_SECONDS = float(os.environ.get('WEIGHT_TRACKER_TENANT_IDLE_SECONDS', '600'))
+
+# Up to this many users the pickers are plain selects and checkboxes; beyond
+# it they are autocomplete inputs backed by /api/users.
+USER_PICKER_LIMIT = int(os.environ.get('WEIGHT_TRACKER_USER_PICKER_LIMIT', '50'))
+
+# Identical dashboard requests that arrive together share one render. A
+# request waits up to COALESCE_TIMEOUT seconds for the render already in
+# flight before giving up and rendering the page itself.
+COALESCE_TIMEOUT = float(os.environ.get('WEIGHT_TRACKER_COALESCE_TIMEOUT', '10'))
+
+# Live updates: open dashboards keep a Server-Sent Events stream and patch
+# themselves after every write. Each stream holds a request thread, so at most
+# LIVE_MAX_STREAMS are open at once (beyond that pages fall back to plain
+# reloads); streams re-check for writes from other processes every
+# LIVE_POLL_SECONDS. They are on by default only in 'asgi' mode, where a
+# stream costs a coroutine; with the dev server or another threaded server
+# set WEIGHT_TRACKER_LIVE_UPDATES=1 to turn them on anyway (or 0 to turn them
+# off under ASGI). Without them the page reloads after each change.
+LIVE_UPDATES = os.environ.get('WEIGHT_TRACKER_LIVE_UPDATES', '1' if SERVER_MODE == 'asgi' else '0') != '0'
+LIVE_POLL_SECONDS = float(os.environ.get('WEIGHT_TRACKER_LIVE_POLL_SECONDS', '15'))
+LIVE_MAX_STREAMS = int(os.environ.get('WEIGHT_TRACKER_LIVE_MAX_STREAMS')
+                       or (ASGI_REQUEST_WORKERS // 2 if SERVER_MODE == 'asgi' else 64))
 
 # --- HTML Content ---
 # This is the HTML for our web page.
@@ -35,6 +125,7 @@ HTML_CONTENT = """
 <body>
     <div class="container">
         <h1>Weight & Body Tracker 🏋️</h1>
+        <p class="page-links"><a href="{{ url_for('leaderboard') }}">Leaderboard 🏆</a></p>
 
         {% with messages = get_flashed_messages(with_categories=true) %}
             {% if messages %}
@@ -45,24 +136,36 @@ HTML_CONTENT = """
                 </div>
             {% endif %}
         {% endwith %}
+        {% if unreadable_rows %}
+            <div class="flash error">
+                {{ unreadable_rows|length }} {{ 'row' if unreadable_rows|length == 1 else 'rows' }} of weight data could not be read and {{ 'is' if unreadable_rows|length == 1 else 'are' }} not shown:
+                {% for user, row, reason in unreadable_rows[:5] %}row {{ row }}{% if user %} ({{ user }}){% endif %}, {{ reason }}{% if not loop.last %}; {% endif %}{% endfor %}{% if unreadable_rows|length > 5 %}; …{% endif %}.
+                {% if sharded %}Fix them in the user's workbook in the shard folder.{% else %}Fix them in the workbook, or run <code>python weight_tracking_og2.py normalize</code> to move them to a Quarantine sheet.{% endif %}
+            </div>
+        {% endif %}
 
         <div class="main-grid">
             <div class="left-column">
                 <div class="card">
                     <h2>User Selection & Management</h2>
                     <div class="user-management-grid">
-                        <form action="/" method="get" class="user-selector-form">
+                        <form action="{{ url_for('index') }}" method="get" class="user-selector-form">
                             <div class="form-group">
                                 <label for="user1">Primary User:</label>
+                                {% if all_users %}
                                 <select name="user1" id="user1" onchange="this.form.submit()">
                                     {% for u in all_users %}
                                     <option value="{{ u }}" {% if u == primary_user %}selected{% endif %}>{{ u }}</option>
                                     {% endfor %}
                                 </select>
+                                {% else %}
+                                <input type="text" name="user1" id="user1" list="user-suggestions" autocomplete="off" value="{{ primary_user }}" onchange="this.form.submit()">
+                                {% endif %}
                             </div>
                             <div class="form-group">
                                 <label for="user2">Compare With (Optional):</label>
-                                <select name="user2" id="user2" onchange="this.form.submit()">
+                                {% if all_users %}
+                                <select name="user2" id="user2" onchange="refreshCards(this.form, ['chart'])">
                                     <option value="">-- None --</option>
                                     {% for u in all_users %}
                                         {% if u != primary_user %}
@@ -70,6 +173,9 @@ HTML_CONTENT = """
                                         {% endif %}
                                     {% endfor %}
                                 </select>
+                                {% else %}
+                                <input type="text" name="user2" id="user2" list="user-suggestions" autocomplete="off" placeholder="-- None --" value="{{ comparison_user or '' }}" onchange="refreshCards(this.form, ['chart'])">
+                                {% endif %}
                             </div>
                         </form>
                         <div class="user-actions">
@@ -89,22 +195,43 @@ HTML_CONTENT = """
                 </div>
                 <div class="card">
                     <h2>Multi-User Comparison</h2>
-                    <form action="/" method="get" class="multi-user-form">
+                    <form action="{{ url_for('index') }}" method="get" class="multi-user-form">
                         <input type="hidden" name="user1" value="{{ primary_user }}">
-                        {% if comparison_user %}
-                        <input type="hidden" name="user2" value="{{ comparison_user }}">
-                        {% endif %}
+                        <input type="hidden" name="user2" value="{{ comparison_user or '' }}">
                         <p class="form-hint">Select users to compare on the normalized chart:</p>
                         <div class="checkbox-grid">
-                            {% for u in all_users %}
+                            {% for u in all_users or selected_compare_users %}
                             <label class="checkbox-label">
                                 <input type="checkbox" name="compare_users" value="{{ u }}" 
                                     {% if u in selected_compare_users %}checked{% endif %}
-                                    onchange="this.form.submit()">
+                                    onchange="refreshCards(this.form, ['normalized'])">
                                 <span class="checkbox-text">{{ u }}</span>
                             </label>
                             {% endfor %}
                         </div>
+                        {% if not all_users %}
+                        <div class="form-group compare-search">
+                            <input type="text" name="compare_users" list="user-suggestions" autocomplete="off" placeholder="Add a user to compare..." onchange="this.form.submit()">
+                        </div>
+                        {% endif %}
+                        <div class="alignment-grid">
+                            <div class="form-group">
+                                <label for="resample">Time Grid:</label>
+                                <select id="resample" name="resample" onchange="refreshCards(this.form, ['chart', 'normalized'])">
+                                    {% for value, label in [('', 'As recorded'), ('day', 'Daily'), ('week', 'Weekly')] %}
+                                    <option value="{{ value }}" {% if request.args.get('resample', '') == value %}selected{% endif %}>{{ label }}</option>
+                                    {% endfor %}
+                                </select>
+                            </div>
+                            <div class="form-group">
+                                <label for="fill">Gaps:</label>
+                                <select id="fill" name="fill" onchange="refreshCards(this.form, ['chart', 'normalized'])">
+                                    {% for value, label in [('', 'Leave empty'), ('ffill', 'Carry forward'), ('interpolate', 'Interpolate')] %}
+                                    <option value="{{ value }}" {% if request.args.get('fill', '') == value %}selected{% endif %}>{{ label }}</option>
+                                    {% endfor %}
+                                </select>
+                            </div>
+                        </div>
                     </form>
                 </div>
                 <div class="card">
@@ -144,116 +271,26 @@ HTML_CONTENT = """
                             <label for="goal_weight">Goal Weight (lbs):</label>
                             <input type="number" id="goal_weight" name="goal_weight" step="0.01" placeholder="e.g., 165.00" value="{{ primary_user_data.goal_weight or '' }}">
                         </div>
+                        <div class="form-group">
+                            <label for="height">Height (in): <span class="optional-text">(Optional)</span></label>
+                            <input type="number" id="height" name="height" step="0.1" placeholder="e.g., 70.0" value="{{ primary_user_data.height or '' }}">
+                        </div>
+                        <div class="form-group">
+                            <label for="daily_aggregation">Same-Day Entries:</label>
+                            <select id="daily_aggregation" name="daily_aggregation">
+                                {% for value, label in [('last', 'Use latest'), ('mean', 'Average'), ('min', 'Use lowest')] %}
+                                    <option value="{{ value }}" {% if primary_user_data.daily_aggregation == value %}selected{% endif %}>{{ label }}</option>
+                                {% endfor %}
+                            </select>
+                        </div>
                         <button type="submit" class="btn btn-secondary">Save Goals</button>
                     </form>
                 </div>
-                <div class="card">
-                    <h2>History</h2>
-                    {% if entries %}
-                        <table>
-                            <thead>
-                                <tr>
-                                    <th>Date</th>
-                                    <th>Weight (lbs)</th>
-                                    <th>Body Fat %</th>
-                                    <th>Waist (in)</th>
-                                    <th>Actions</th>
-                                </tr>
-                            </thead>
-                            <tbody>
-                                {% for entry in entries %}
-                                    <tr>
-                                        <td>{{ entry.date }}</td>
-                                        <td>{{ '%.2f'|format(entry.weight) }}</td>
-                                        <td>{{ '%.2f'|format(entry.body_fat) if entry.body_fat is not none else '–' }}</td>
-                                        <td>{{ '%.2f'|format(entry.waist_size) if entry.waist_size is not none else '–' }}</td>
-                                        <td>
-                                            <a href="#" class="btn btn-secondary btn-sm" onclick="openEditModal('{{ entry.row_num }}', '{{ entry.date }}', '{{ entry.weight }}', '{{ entry.body_fat or '' }}', '{{ entry.waist_size or '' }}')">Edit</a>
-                                            <a href="{{ url_for('delete_entry', row_index=entry.row_num) }}" class="btn btn-danger btn-sm">Delete</a>
-                                        </td>
-                                    </tr>
-                                {% endfor %}
-                            </tbody>
-                        </table>
-                    {% else %}
-                        <p>No entries yet. Add one above to get started!</p>
-                    {% endif %}
-                </div>
+                {{ history_card|safe }}
             </div>
             <div class="right-column">
-                <div class="card chart-card">
-                    <h2>Weight Progress</h2>
-                    {% if combined_labels %}
-                        <canvas id="weightChart"></canvas>
-                    {% else %}
-                        <p>No data to display. Add a weight entry to see the chart.</p>
-                    {% endif %}
-                </div>
-                <div class="card">
-                    <h2>Summary</h2>
-                    {% if summary_data %}
-                        <table class="summary-table">
-                            <tbody>
-                                <tr>
-                                    <td>Current Weight</td>
-                                    <td>{{ '%.2f lbs'|format(summary_data.current) if summary_data.current is not none else 'N/A' }}</td>
-                                </tr>
-                                <tr>
-                                    <td>Start Weight</td>
-                                    <td>{{ '%.2f lbs'|format(summary_data.start) if summary_data.start is not none else 'N/A' }}</td>
-                                </tr>
-                                <tr>
-                                    <td>Goal Weight</td>
-                                    <td>{{ '%.2f lbs'|format(summary_data.goal) if summary_data.goal is not none else 'N/A' }}</td>
-                                </tr>
-                                <tr class="{{ summary_data.goal_class }}">
-                                    <td>Weight to Goal</td>
-                                    <td>{{ summary_data.to_goal if summary_data.to_goal is not none else 'N/A' }}</td>
-                                </tr>
-                                <tr>
-                                    <td>Highest Weight</td>
-                                    <td>{{ '%.2f lbs'|format(summary_data.highest) if summary_data.highest is not none else 'N/A' }}</td>
-                                </tr>
-                                <tr>
-                                    <td>Lowest Weight</td>
-                                    <td>{{ '%.2f lbs'|format(summary_data.lowest) if summary_data.lowest is not none else 'N/A' }}</td>
-                                </tr>
-                                {% if 'current_bf' in summary_data %}
-                                <tr class="summary-divider"><td colspan="2"></td></tr>
-                                <tr>
-                                    <td>Current Body Fat</td>
-                                    <td>{{ '%.2f%%'|format(summary_data.current_bf) }}</td>
-                                </tr>
-                                <tr>
-                                    <td>Highest Body Fat</td>
-                                    <td>{{ '%.2f%%'|format(summary_data.highest_bf) }}</td>
-                                </tr>
-                                <tr>
-                                    <td>Lowest Body Fat</td>
-                                    <td>{{ '%.2f%%'|format(summary_data.lowest_bf) }}</td>
-                                </tr>
-                                {% endif %}
-                                {% if 'current_ws' in summary_data %}
-                                <tr class="summary-divider"><td colspan="2"></td></tr>
-                                <tr>
-                                    <td>Current Waist Size</td>
-                                    <td>{{ '%.2f in'|format(summary_data.current_ws) }}</td>
-                                </tr>
-                                <tr>
-                                    <td>Highest Waist Size</td>
-                                    <td>{{ '%.2f in'|format(summary_data.highest_ws) }}</td>
-                                </tr>
-                                <tr>
-                                    <td>Lowest Waist Size</td>
-                                    <td>{{ '%.2f in'|format(summary_data.lowest_ws) }}</td>
-                                </tr>
-                                {% endif %}
-                            </tbody>
-                        </table>
-                    {% else %}
-                        <p>No data for summary.</p>
-                    {% endif %}
-                </div>
+                {{ chart_card|safe }}
+                {{ summary_card|safe }}
             </div>
         </div>
 
@@ -271,23 +308,41 @@ HTML_CONTENT = """
                 <canvas id="waistSizeChart"></canvas>
             </div>
             {% endif %}
-        </div>
 
-        {% if normalized_chart_data %}
-        <div class="card normalized-chart-card">
-            <h2>Normalized Weight Progress (%)</h2>
-            <p class="chart-subtitle">Percentage of starting weight over time (100% = start weight)</p>
-            <canvas id="normalizedChart"></canvas>
+            {% if composition_labels %}
+            <div class="card">
+                <h2>Fat &amp; Lean Mass (lbs)</h2>
+                <canvas id="compositionChart"></canvas>
+            </div>
+            {% endif %}
+
+            {% if bmi_labels %}
+            <div class="card">
+                <h2>BMI</h2>
+                <canvas id="bmiChart"></canvas>
+            </div>
+            {% endif %}
+
+            {% if whtr_labels %}
+            <div class="card">
+                <h2>Waist-to-Height Ratio</h2>
+                <canvas id="whtrChart"></canvas>
+            </div>
+            {% endif %}
         </div>
-        {% endif %}
+
+        {{ normalized_card|safe }}
 
     </div>
 
+    <datalist id="user-suggestions"></datalist>
+
     <div id="editModal" class="modal">
         <div class="modal-content">
             <span class="close-button" onclick="closeEditModal()">&times;</span>
             <h2>Edit Entry</h2>
             <form id="editForm" method="post">
+                <input type="hidden" name="user" value="{{ primary_user }}">
                 <div class="form-group">
                     <label for="edit_date">Date:</label>
                     <input type="date" id="edit_date" name="date" required>
@@ -310,61 +365,68 @@ HTML_CONTENT = """
     </div>
 
     <script>
+        const liveCharts = [];  // charts patched in place by live updates
+
         // --- Main Weight Chart ---
-        {% if combined_labels and chart_data_1 %}
-        const ctx = document.getElementById('weightChart').getContext('2d');
-        const chart_config = {{ chart_config | tojson }};
-        const datasets = [{
-            label: '{{ primary_user }} Weight (lbs)',
-            data: {{ chart_data_1 | tojson }},
-            borderColor: '#33CFFF',
-            backgroundColor: 'rgba(51, 207, 255, 0.1)',
-            yAxisID: 'y1',
-            fill: true,
-            tension: 0.1,
-            spanGaps: true
-        }];
-
-        {% if comparison_user and chart_data_2_to_plot %}
-        datasets.push({
-            label: '{{ comparison_user }} Weight (lbs)',
-            data: {{ chart_data_2_to_plot | tojson }},
-            borderColor: '#9D63FF',
-            backgroundColor: 'rgba(157, 99, 255, 0.1)',
-            yAxisID: 'y2',
-            fill: true,
-            tension: 0.1,
-            spanGaps: true
-        });
-        {% endif %}
+        function drawWeightChart(card) {
+            const payload = card.querySelector('.chart-data');
+            if (!payload) return;
+            const weight = JSON.parse(payload.textContent);
+            const chart_config = weight.config;
+            const datasets = [{
+                label: `${weight.primary_user} Weight (lbs)`,
+                data: weight.data_1,
+                borderColor: '#33CFFF',
+                backgroundColor: 'rgba(51, 207, 255, 0.1)',
+                yAxisID: 'y1',
+                fill: true,
+                tension: 0.1,
+                spanGaps: true
+            }];
 
-        const chartData = { labels: {{ combined_labels | tojson }}, datasets: datasets };
-        const chartOptions = {
-            responsive: true,
-            interaction: { mode: 'index', intersect: false },
-            scales: { y1: { type: 'linear', display: true, position: 'left', title: { display: true, text: '{{ primary_user }} Weight (lbs)', color: '#33CFFF'}}},
-            plugins: { tooltip: { callbacks: { label: function(context) { let label = context.dataset.label || ''; if (label) { label += ': '; } if (context.parsed.y !== null) { label += context.parsed.y.toFixed(2) + ' lbs'; } return label; }}}, annotation: { annotations: {}}}
-        };
+            if (weight.comparison_user) {
+                datasets.push({
+                    label: `${weight.comparison_user} Weight (lbs)`,
+                    data: weight.data_2,
+                    borderColor: '#9D63FF',
+                    backgroundColor: 'rgba(157, 99, 255, 0.1)',
+                    yAxisID: 'y2',
+                    fill: true,
+                    tension: 0.1,
+                    spanGaps: true
+                });
+            }
 
-        if (chart_config.y2_axis_label) {
-            chartOptions.scales.y2 = { type: 'linear', display: true, position: 'right', title: { display: true, text: chart_config.y2_axis_label, color: '#9D63FF' }, grid: { drawOnChartArea: false }};
-        }
-        {% if primary_user_data.start_weight %}
-        chartOptions.plugins.annotation.annotations.startLine1 = { type: 'line', yMin: {{ primary_user_data.start_weight }}, yMax: {{ primary_user_data.start_weight }}, yScaleID: 'y1', borderColor: '#33CFFF', borderWidth: 2, borderDash: [6, 6], label: { content: 'Start: {{ "%.2f"|format(primary_user_data.start_weight) }} lbs', display: {{ 'false' if comparison_user else 'true' }}, position: 'start', backgroundColor: 'rgba(51, 207, 255, 0.8)' }};
-        {% endif %}
-        {% if primary_user_data.goal_weight %}
-        chartOptions.plugins.annotation.annotations.goalLine1 = { type: 'line', yMin: {{ primary_user_data.goal_weight }}, yMax: {{ primary_user_data.goal_weight }}, yScaleID: 'y1', borderColor: 'var(--danger-color)', borderWidth: 2, borderDash: [6, 6], label: { content: 'Goal: {{ "%.2f"|format(primary_user_data.goal_weight) }} lbs', display: {{ 'false' if comparison_user else 'true' }}, position: 'end', backgroundColor: 'rgba(220, 53, 69, 0.8)' }};
-        {% endif %}
+            const chartData = { labels: weight.labels, datasets: datasets };
+            const chartOptions = {
+                responsive: true,
+                interaction: { mode: 'index', intersect: false },
+                scales: { y1: { type: 'linear', display: true, position: 'left', title: { display: true, text: `${weight.primary_user} Weight (lbs)`, color: '#33CFFF'}}},
+                plugins: { tooltip: { callbacks: { label: function(context) { let label = context.dataset.label || ''; if (label) { label += ': '; } if (context.parsed.y !== null) { label += context.parsed.y.toFixed(2) + ' lbs'; } return label; }}}, annotation: { annotations: {}}}
+            };
 
-        if (chart_config.y1_min !== null && chart_config.y1_max !== null) { chartOptions.scales.y1.min = chart_config.y1_min; chartOptions.scales.y1.max = chart_config.y1_max; }
-        if (chart_config.y2_axis_label && chart_config.y2_min !== null && chart_config.y2_max !== null) { chartOptions.scales.y2.min = chart_config.y2_min; chartOptions.scales.y2.max = chart_config.y2_max; }
-        new Chart(ctx, { type: 'line', data: chartData, options: chartOptions });
-        {% endif %}
+            if (chart_config.y2_axis_label) {
+                chartOptions.scales.y2 = { type: 'linear', display: true, position: 'right', title: { display: true, text: chart_config.y2_axis_label, color: '#9D63FF' }, grid: { drawOnChartArea: false }};
+            }
+            if (weight.start_weight) {
+                chartOptions.plugins.annotation.annotations.startLine1 = { type: 'line', yMin: weight.start_weight, yMax: weight.start_weight, yScaleID: 'y1', borderColor: '#33CFFF', borderWidth: 2, borderDash: [6, 6], label: { content: `Start: ${weight.start_weight.toFixed(2)} lbs`, display: !weight.comparison_user, position: 'start', backgroundColor: 'rgba(51, 207, 255, 0.8)' }};
+            }
+            if (weight.goal_weight) {
+                chartOptions.plugins.annotation.annotations.goalLine1 = { type: 'line', yMin: weight.goal_weight, yMax: weight.goal_weight, yScaleID: 'y1', borderColor: 'var(--danger-color)', borderWidth: 2, borderDash: [6, 6], label: { content: `Goal: ${weight.goal_weight.toFixed(2)} lbs`, display: !weight.comparison_user, position: 'end', backgroundColor: 'rgba(220, 53, 69, 0.8)' }};
+            }
+
+            if (chart_config.y1_min !== null && chart_config.y1_max !== null) { chartOptions.scales.y1.min = chart_config.y1_min; chartOptions.scales.y1.max = chart_config.y1_max; }
+            if (chart_config.y2_axis_label && chart_config.y2_min !== null && chart_config.y2_max !== null) { chartOptions.scales.y2.min = chart_config.y2_min; chartOptions.scales.y2.max = chart_config.y2_max; }
+            card.chart = new Chart(card.querySelector('canvas').getContext('2d'), { type: 'line', data: chartData, options: chartOptions });
+            liveCharts.push({ chart: card.chart, grain: weight.grain, aligned: true, versions: weight.versions,
+                              series: datasets.map((ds, i) => ({ user: i ? weight.comparison_user : weight.primary_user, metric: 'weight' })) });
+        }
+        drawWeightChart(document.querySelector('[data-card="chart"]'));
 
         // --- Body Fat Chart ---
         {% if body_fat_labels %}
         const bf_ctx = document.getElementById('bodyFatChart').getContext('2d');
-        new Chart(bf_ctx, {
+        liveCharts.push({ chart: new Chart(bf_ctx, {
             type: 'line',
             data: {
                 labels: {{ body_fat_labels | tojson }},
@@ -379,13 +441,13 @@ HTML_CONTENT = """
                 }]
             },
             options: { responsive: true, scales: { y: { title: { display: true, text: 'Body Fat (%)' }}}, plugins: { legend: { display: false }}}
-        });
+        }), grain: '{{ derived_grain }}', series: [{ user: {{ primary_user | tojson }}, metric: 'body_fat' }] });
         {% endif %}
 
         // --- Waist Size Chart ---
         {% if waist_size_labels %}
         const ws_ctx = document.getElementById('waistSizeChart').getContext('2d');
-        new Chart(ws_ctx, {
+        liveCharts.push({ chart: new Chart(ws_ctx, {
             type: 'line',
             data: {
                 labels: {{ waist_size_labels | tojson }},
@@ -400,89 +462,214 @@ HTML_CONTENT = """
                 }]
             },
             options: { responsive: true, scales: { y: { title: { display: true, text: 'Waist Size (in)' }}}, plugins: { legend: { display: false }}}
-        });
+        }), grain: '{{ derived_grain }}', series: [{ user: {{ primary_user | tojson }}, metric: 'waist_size' }] });
         {% endif %}
 
-        // --- Normalized Weight Chart ---
-        {% if normalized_chart_data %}
-        const norm_ctx = document.getElementById('normalizedChart').getContext('2d');
-        const normalizedChartData = {{ normalized_chart_data | tojson }};
-        const userColors = ['#33CFFF', '#9D63FF', '#28a745', '#fd7e14', '#e83e8c', '#20c997', '#6f42c1', '#17a2b8'];
-        
-        // Calculate min/max across ALL datasets for proper Y-axis scaling
-        let allValues = [];
-        normalizedChartData.datasets.forEach(ds => {
-            ds.data.forEach(val => {
-                if (val !== null && val !== undefined) {
-                    allValues.push(val);
-                }
-            });
-        });
-        // Always include 100% baseline in the range
-        allValues.push(100);
-        const yMin = Math.floor(Math.min(...allValues) - 2);
-        const yMax = Math.ceil(Math.max(...allValues) + 2);
-        
-        const normalizedDatasets = normalizedChartData.datasets.map((ds, idx) => ({
-            label: ds.label,
-            data: ds.data,
-            borderColor: userColors[idx % userColors.length],
-            backgroundColor: userColors[idx % userColors.length] + '20',
-            fill: false,
-            tension: 0.1,
-            spanGaps: true,
-            pointRadius: 4,
-            pointHoverRadius: 6
-        }));
-
-        new Chart(norm_ctx, {
+        // --- Fat & Lean Mass Chart ---
+        {% if composition_labels %}
+        const comp_ctx = document.getElementById('compositionChart').getContext('2d');
+        liveCharts.push({ chart: new Chart(comp_ctx, {
             type: 'line',
             data: {
-                labels: normalizedChartData.labels,
-                datasets: normalizedDatasets
+                labels: {{ composition_labels | tojson }},
+                datasets: [{
+                    label: 'Fat Mass (lbs)',
+                    data: {{ fat_mass_data | tojson }},
+                    borderColor: '#e83e8c',
+                    backgroundColor: 'rgba(232, 62, 140, 0.1)',
+                    fill: true,
+                    tension: 0.1,
+                    spanGaps: true
+                }, {
+                    label: 'Lean Mass (lbs)',
+                    data: {{ lean_mass_data | tojson }},
+                    borderColor: '#20c997',
+                    backgroundColor: 'rgba(32, 201, 151, 0.1)',
+                    fill: true,
+                    tension: 0.1,
+                    spanGaps: true
+                }]
             },
-            options: {
-                responsive: true,
-                interaction: { mode: 'index', intersect: false },
-                scales: {
-                    y: {
-                        min: yMin,
-                        max: yMax,
-                        title: { display: true, text: '% of Starting Weight' },
-                        ticks: { callback: function(value) { return value + '%'; } }
+            options: { responsive: true, interaction: { mode: 'index', intersect: false }, scales: { y: { title: { display: true, text: 'Mass (lbs)' }}}}
+        }), grain: '{{ derived_grain }}',
+                          series: [{ user: {{ primary_user | tojson }}, metric: 'fat_mass' }, { user: {{ primary_user | tojson }}, metric: 'lean_mass' }] });
+        {% endif %}
+
+        // --- BMI Chart ---
+        {% if bmi_labels %}
+        const bmi_ctx = document.getElementById('bmiChart').getContext('2d');
+        liveCharts.push({ chart: new Chart(bmi_ctx, {
+            type: 'line',
+            data: {
+                labels: {{ bmi_labels | tojson }},
+                datasets: [{
+                    label: 'BMI',
+                    data: {{ bmi_data | tojson }},
+                    borderColor: '#6f42c1',
+                    backgroundColor: 'rgba(111, 66, 193, 0.1)',
+                    fill: true,
+                    tension: 0.1,
+                    spanGaps: true
+                }]
+            },
+            options: { responsive: true, scales: { y: { title: { display: true, text: 'BMI' }}}, plugins: { legend: { display: false }}}
+        }), grain: '{{ derived_grain }}', series: [{ user: {{ primary_user | tojson }}, metric: 'bmi' }] });
+        {% endif %}
+
+        // --- Waist-to-Height Chart ---
+        {% if whtr_labels %}
+        const whtr_ctx = document.getElementById('whtrChart').getContext('2d');
+        liveCharts.push({ chart: new Chart(whtr_ctx, {
+            type: 'line',
+            data: {
+                labels: {{ whtr_labels | tojson }},
+                datasets: [{
+                    label: 'Waist-to-Height Ratio',
+                    data: {{ whtr_data | tojson }},
+                    borderColor: '#17a2b8',
+                    backgroundColor: 'rgba(23, 162, 184, 0.1)',
+                    fill: true,
+                    tension: 0.1,
+                    spanGaps: true
+                }]
+            },
+            options: { responsive: true, scales: { y: { title: { display: true, text: 'Waist / Height' }}}, plugins: { legend: { display: false }}}
+        }), grain: '{{ derived_grain }}', series: [{ user: {{ primary_user | tojson }}, metric: 'waist_to_height' }] });
+        {% endif %}
+
+        // --- Normalized Weight Chart ---
+        function drawNormalizedChart(card) {
+            const payload = card.querySelector('.chart-data');
+            if (!payload) return;
+            const norm_ctx = card.querySelector('canvas').getContext('2d');
+            const normalizedChartData = JSON.parse(payload.textContent);
+            const userColors = ['#33CFFF', '#9D63FF', '#28a745', '#fd7e14', '#e83e8c', '#20c997', '#6f42c1', '#17a2b8'];
+        
+            // Calculate min/max across ALL datasets for proper Y-axis scaling
+            let allValues = [];
+            normalizedChartData.datasets.forEach(ds => {
+                ds.data.forEach(val => {
+                    if (val !== null && val !== undefined) {
+                        allValues.push(val);
                     }
+                });
+            });
+            // Always include 100% baseline in the range
+            allValues.push(100);
+            const yMin = Math.floor(Math.min(...allValues) - 2);
+            const yMax = Math.ceil(Math.max(...allValues) + 2);
+        
+            const normalizedDatasets = normalizedChartData.datasets.map((ds, idx) => ({
+                label: ds.label,
+                data: ds.data,
+                borderColor: userColors[idx % userColors.length],
+                backgroundColor: userColors[idx % userColors.length] + '20',
+                fill: false,
+                tension: 0.1,
+                spanGaps: true,
+                pointRadius: 4,
+                pointHoverRadius: 6
+            }));
+
+            card.chart = new Chart(norm_ctx, {
+                type: 'line',
+                data: {
+                    labels: normalizedChartData.labels,
+                    datasets: normalizedDatasets
                 },
-                plugins: {
-                    legend: { display: true, position: 'top' },
-                    tooltip: {
-                        callbacks: {
-                            label: function(context) {
-                                return context.dataset.label + ': ' + context.parsed.y.toFixed(2) + '%';
-                            }
+                options: {
+                    responsive: true,
+                    interaction: { mode: 'index', intersect: false },
+                    scales: {
+                        y: {
+                            min: yMin,
+                            max: yMax,
+                            title: { display: true, text: '% of Starting Weight' },
+                            ticks: { callback: function(value) { return value + '%'; } }
                         }
                     },
-                    annotation: {
-                        annotations: {
-                            startLine: {
-                                type: 'line',
-                                yMin: 100,
-                                yMax: 100,
-                                borderColor: 'rgba(255, 255, 255, 0.5)',
-                                borderWidth: 2,
-                                borderDash: [6, 6],
-                                label: {
-                                    content: 'Start (100%)',
-                                    display: true,
-                                    position: 'start',
-                                    backgroundColor: 'rgba(100, 100, 100, 0.8)'
+                    plugins: {
+                        legend: { display: true, position: 'top' },
+                        tooltip: {
+                            callbacks: {
+                                label: function(context) {
+                                    return context.dataset.label + ': ' + context.parsed.y.toFixed(2) + '%';
+                                }
+                            }
+                        },
+                        annotation: {
+                            annotations: {
+                                startLine: {
+                                    type: 'line',
+                                    yMin: 100,
+                                    yMax: 100,
+                                    borderColor: 'rgba(255, 255, 255, 0.5)',
+                                    borderWidth: 2,
+                                    borderDash: [6, 6],
+                                    label: {
+                                        content: 'Start (100%)',
+                                        display: true,
+                                        position: 'start',
+                                        backgroundColor: 'rgba(100, 100, 100, 0.8)'
+                                    }
                                 }
                             }
                         }
                     }
                 }
+            });
+            liveCharts.push({ chart: card.chart, grain: normalizedChartData.grain, aligned: true, versions: normalizedChartData.versions,
+                              series: normalizedChartData.datasets.map(ds => ({ user: ds.label, metric: 'weight', scale: 100 / normalizedChartData.starts[ds.label], digits: 2 })) });
+        }
+        drawNormalizedChart(document.querySelector('[data-card="normalized"]'));
+
+        // --- Card Fragments ---
+        // The comparison controls re-render only the cards they affect from /fragments/<card>, not the whole page.
+        let onViewChange = () => {};
+
+        function refreshCards(form, names) {
+            const params = new URLSearchParams(location.search);
+            for (const field of form.elements) if (field.name) params.delete(field.name);
+            for (const [name, value] of new FormData(form)) if (value) params.append(name, value);
+            history.replaceState(null, '', '?' + params);
+            document.querySelectorAll('input[type="hidden"][name="user2"]').forEach(input => { input.value = params.get('user2') || ''; });
+            Promise.all(names.map(name => fetch(`{{ url_for('index') }}fragments/${name}?${params}`)
+                .then(response => { if (!response.ok) throw new Error(response.statusText); return response.text(); })
+                .then(html => swapCard(name, html))))
+                .then(() => onViewChange())
+                .catch(() => location.assign('?' + params));
+        }
+
+        function swapCard(name, html) {
+            const old = document.querySelector(`[data-card="${name}"]`);
+            const template = document.createElement('template');
+            template.innerHTML = html.trim();
+            const card = template.content.firstElementChild;
+            if (old.chart) {
+                old.chart.destroy();
+                liveCharts.splice(liveCharts.findIndex(entry => entry.chart === old.chart), 1);
             }
+            old.replaceWith(card);
+            if (name === 'chart') drawWeightChart(card);
+            if (name === 'normalized') drawNormalizedChart(card);
+        }
+
+        // --- User Autocomplete ---
+        // With many users the pickers are text inputs that share one datalist, filled from /api/users as you type.
+        const userSuggestions = document.getElementById('user-suggestions');
+        let userSearchTimer = null;
+        document.querySelectorAll('input[list="user-suggestions"]').forEach(input => {
+            input.addEventListener('input', () => {
+                clearTimeout(userSearchTimer);
+                userSearchTimer = setTimeout(() => {
+                    fetch(`{{ url_for('api_users') }}?q=${encodeURIComponent(input.value)}`)
+                        .then(response => response.json())
+                        .then(result => {
+                            userSuggestions.replaceChildren(...result.users.map(name => new Option(name)));
+                        });
+                }, 150);
+            });
         });
-        {% endif %}
 
         // --- Modal Control Functions ---
         function openEditModal(row_index, date, weight, body_fat, waist_size) {
@@ -492,7 +679,7 @@ HTML_CONTENT = """
             document.getElementById('edit_weight').value = weight;
             document.getElementById('edit_body_fat').value = body_fat;
             document.getElementById('edit_waist_size').value = waist_size;
-            form.action = `/update/${row_index}`;
+            form.action = `{{ url_for('index') }}update/${row_index}`;
             modal.style.display = 'block';
         }
 
@@ -506,11 +693,384 @@ HTML_CONTENT = """
                 modal.style.display = 'none';
             }
         }
+
+        // --- Live Updates ---
+        // Deltas from /events patch the history rows, summary cells and daily chart points in place. Whatever
+        // cannot be patched (a settings change, weekly or monthly charts, a resampled comparison) reloads the page.
+        // While the stream is open, entry forms and delete links post with fetch() and wait for their delta.
+        {% if live_versions %}
+        const livePrimary = {{ primary_user | tojson }};
+        const liveVersions = {{ live_versions | tojson }};
+        let liveSource = null;
+
+        // (Re)opens the stream for the users the page currently shows, resuming from the versions it has.
+        function connectLive() {
+            if (!window.EventSource) return;
+            if (liveSource) liveSource.close();
+            const params = new URLSearchParams(location.search);
+            const users = [...new Set([livePrimary, params.get('user2'), ...params.getAll('compare_users')].filter(Boolean))];
+            for (const entry of liveCharts) {
+                for (const [user, version] of Object.entries(entry.versions || {})) liveVersions[user] = Math.min(liveVersions[user] ?? version, version);
+            }
+            const query = new URLSearchParams();
+            users.forEach(user => query.append('user', user));
+            users.forEach(user => query.append('v', liveVersions[user] ?? ''));
+            liveSource = new EventSource(`{{ url_for('live_events') }}?${query}`);
+            liveSource.onmessage = event => applyDelta(JSON.parse(event.data));
+        }
+        connectLive();
+        onViewChange = connectLive;
+
+        function applyDelta(delta) {
+            const params = new URLSearchParams(location.search);
+            const resampled = Boolean(params.get('resample') || params.get('fill'));
+            const charts = liveCharts.filter(entry => entry.series.some(s => s.user === delta.user));
+            if (delta.reload || charts.some(entry => entry.grain !== 'day' || (entry.aligned && resampled))) {
+                location.reload();
+                return;
+            }
+            liveVersions[delta.user] = delta.version;
+            charts.forEach(entry => {
+                patchChart(entry, delta);
+                if (entry.versions) entry.versions[delta.user] = delta.version;
+            });
+            if (delta.user === livePrimary && !(patchHistory(delta) && patchSummary(delta.summary))) location.reload();
+        }
+
+        function patchChart(entry, delta) {
+            const data = entry.chart.data;
+            entry.series.forEach((series, i) => {
+                if (series.user !== delta.user) return;
+                for (const [day, values] of Object.entries(delta.days)) {
+                    let value = values[series.metric] ?? null;
+                    if (value !== null && series.scale) value = +(value * series.scale).toFixed(series.digits);
+                    let idx = data.labels.indexOf(day);
+                    if (idx < 0) {
+                        if (value === null) continue;
+                        idx = data.labels.findIndex(label => label > day);
+                        if (idx < 0) idx = data.labels.length;
+                        data.labels.splice(idx, 0, day);
+                        data.datasets.forEach(ds => ds.data.splice(idx, 0, null));
+                    }
+                    data.datasets[i].data[idx] = value;
+                    if (data.datasets.every(ds => ds.data[idx] === null)) {
+                        data.labels.splice(idx, 1);
+                        data.datasets.forEach(ds => ds.data.splice(idx, 1));
+                    }
+                }
+            });
+            // Axes with a fixed range widen to keep new points on the chart.
+            for (const [id, scale] of Object.entries(entry.chart.options.scales || {})) {
+                if (scale.min == null || scale.max == null) continue;
+                data.datasets.filter(ds => (ds.yAxisID || 'y') === id).forEach(ds => ds.data.forEach(v => {
+                    if (v !== null) { scale.min = Math.min(scale.min, Math.floor(v - 1)); scale.max = Math.max(scale.max, Math.ceil(v + 1)); }
+                }));
+            }
+            entry.chart.update();
+        }
+
+        function patchHistory(delta) {
+            const body = document.getElementById('history-rows');
+            if (!body) return false;
+            delta.removed.concat(delta.entries.map(e => e.row)).forEach(row => body.querySelector(`tr[data-row="${row}"]`)?.remove());
+            for (const e of delta.entries) {
+                const next = [...body.rows].find(r => r.dataset.date < e.date || (r.dataset.date === e.date && +r.dataset.row < e.row));
+                body.insertBefore(historyRow(e), next || null);
+            }
+            return true;
+        }
+
+        function historyRow(e) {
+            const tr = document.createElement('tr');
+            tr.dataset.row = e.row;
+            tr.dataset.date = e.date;
+            const format = value => value === null ? '–' : value.toFixed(2);
+            for (const text of [e.date, e.weight.toFixed(2), format(e.body_fat), format(e.waist_size)]) tr.insertCell().textContent = text;
+            const edit = Object.assign(document.createElement('a'), { href: '#', className: 'btn btn-secondary btn-sm', textContent: 'Edit' });
+            edit.onclick = () => openEditModal(e.row, e.date, e.weight, e.body_fat ?? '', e.waist_size ?? '');
+            const remove = Object.assign(document.createElement('a'), {
+                href: `{{ url_for('index') }}delete/${e.row}?user=${encodeURIComponent(livePrimary)}`,
+                className: 'btn btn-danger btn-sm', textContent: 'Delete' });
+            tr.insertCell().append(edit, ' ', remove);
+            return tr;
+        }
+
+        function patchSummary(summary) {
+            const cells = [...document.querySelectorAll('[data-summary]')];
+            if (!cells.length) return false;
+            // Optional rows only exist once recorded; one appearing or vanishing needs a reload.
+            const shown = new Set(cells.map(cell => cell.dataset.summary));
+            const optional = key => key.startsWith('current_');
+            if (Object.keys(summary).some(key => optional(key) && !shown.has(key)) ||
+                [...shown].some(key => optional(key) && !(key in summary))) return false;
+            for (const cell of cells) {
+                const value = summary[cell.dataset.summary] ?? null;
+                cell.textContent = value === null ? 'N/A' : typeof value === 'string' ? value
+                    : value.toFixed(+(cell.dataset.digits || 2)) + (cell.dataset.unit || '');
+            }
+            document.querySelectorAll('[data-summary-class]').forEach(row => { row.className = summary[row.dataset.summaryClass] || ''; });
+            return true;
+        }
+
+        function liveSubmit(url, options) {
+            fetch(url, { ...options, headers: { 'Accept': 'application/json' } })
+                .then(response => response.json())
+                .then(result => showMessages(result.messages))
+                .catch(() => location.reload());
+        }
+
+        function showMessages(messages) {
+            let box = document.querySelector('.flash-messages');
+            if (!box) {
+                box = Object.assign(document.createElement('div'), { className: 'flash-messages' });
+                document.querySelector('.main-grid').before(box);
+            }
+            box.replaceChildren(...messages.map(m => Object.assign(document.createElement('div'), { className: `flash ${m.category}`, textContent: m.message })));
+        }
+
+        const liveOpen = () => liveSource && liveSource.readyState === EventSource.OPEN;
+        document.querySelector('.log-entry-form')?.addEventListener('submit', event => {
+            if (!liveOpen()) return;
+            event.preventDefault();
+            liveSubmit(event.target.action, { method: 'POST', body: new FormData(event.target) });
+            ['weight', 'body_fat', 'waist_size'].forEach(name => { event.target.elements[name].value = ''; });
+        });
+        document.getElementById('editForm').addEventListener('submit', event => {
+            if (!liveOpen()) return;
+            event.preventDefault();
+            liveSubmit(event.target.action, { method: 'POST', body: new FormData(event.target) });
+            closeEditModal();
+        });
+        document.getElementById('history-rows')?.addEventListener('click', event => {
+            const link = event.target.closest('a.btn-danger');
+            if (!link || !liveOpen()) return;
+            event.preventDefault();
+            liveSubmit(link.href, {});
+        });
+        {% endif %}
     </script>
 </body>
 </html>
 """
 
+# --- Dashboard Cards ---
+# Cards the page can re-render on their own through /fragments/<card>. Chart
+# cards carry their data as JSON, drawn by the page's script.
+HISTORY_CARD = """
+<div class="card" data-card="history">
+    <h2>History</h2>
+    {% if entries %}
+        <table>
+            <thead>
+                <tr>
+                    <th>Date</th>
+                    <th>Weight (lbs)</th>
+                    <th>Body Fat %</th>
+                    <th>Waist (in)</th>
+                    <th>Actions</th>
+                </tr>
+            </thead>
+            <tbody id="history-rows">
+                {% for entry in entries %}
+                    <tr data-row="{{ entry.row_num }}" data-date="{{ entry.date }}">
+                        <td>{{ entry.date }}</td>
+                        <td>{{ '%.2f'|format(entry.weight) }}</td>
+                        <td>{{ '%.2f'|format(entry.body_fat) if entry.body_fat is not none else '–' }}</td>
+                        <td>{{ '%.2f'|format(entry.waist_size) if entry.waist_size is not none else '–' }}</td>
+                        <td>
+                            <a href="#" class="btn btn-secondary btn-sm" onclick="openEditModal('{{ entry.row_num }}', '{{ entry.date }}', '{{ entry.weight }}', '{{ entry.body_fat or '' }}', '{{ entry.waist_size or '' }}')">Edit</a>
+                            <a href="{{ url_for('delete_entry', row_index=entry.row_num, user=primary_user) }}" class="btn btn-danger btn-sm">Delete</a>
+                        </td>
+                    </tr>
+                {% endfor %}
+            </tbody>
+        </table>
+    {% else %}
+        <p>No entries yet. Add one above to get started!</p>
+    {% endif %}
+</div>
+"""
+
+SUMMARY_CARD = """
+<div class="card" data-card="summary">
+    <h2>Summary</h2>
+    {% if summary_data %}
+        <table class="summary-table">
+            <tbody>
+                <tr>
+                    <td>Current Weight</td>
+                    <td data-summary="current" data-unit=" lbs">{{ '%.2f lbs'|format(summary_data.current) if summary_data.current is not none else 'N/A' }}</td>
+                </tr>
+                <tr>
+                    <td>Start Weight</td>
+                    <td data-summary="start" data-unit=" lbs">{{ '%.2f lbs'|format(summary_data.start) if summary_data.start is not none else 'N/A' }}</td>
+                </tr>
+                <tr>
+                    <td>Goal Weight</td>
+                    <td data-summary="goal" data-unit=" lbs">{{ '%.2f lbs'|format(summary_data.goal) if summary_data.goal is not none else 'N/A' }}</td>
+                </tr>
+                <tr class="{{ summary_data.goal_class }}" data-summary-class="goal_class">
+                    <td>Weight to Goal</td>
+                    <td data-summary="to_goal">{{ summary_data.to_goal if summary_data.to_goal is not none else 'N/A' }}</td>
+                </tr>
+                <tr>
+                    <td>Highest Weight</td>
+                    <td data-summary="highest" data-unit=" lbs">{{ '%.2f lbs'|format(summary_data.highest) if summary_data.highest is not none else 'N/A' }}</td>
+                </tr>
+                <tr>
+                    <td>Lowest Weight</td>
+                    <td data-summary="lowest" data-unit=" lbs">{{ '%.2f lbs'|format(summary_data.lowest) if summary_data.lowest is not none else 'N/A' }}</td>
+                </tr>
+                {% if 'current_bf' in summary_data %}
+                <tr class="summary-divider"><td colspan="2"></td></tr>
+                <tr>
+                    <td>Current Body Fat</td>
+                    <td data-summary="current_bf" data-unit="%">{{ '%.2f%%'|format(summary_data.current_bf) }}</td>
+                </tr>
+                <tr>
+                    <td>Highest Body Fat</td>
+                    <td data-summary="highest_bf" data-unit="%">{{ '%.2f%%'|format(summary_data.highest_bf) }}</td>
+                </tr>
+                <tr>
+                    <td>Lowest Body Fat</td>
+                    <td data-summary="lowest_bf" data-unit="%">{{ '%.2f%%'|format(summary_data.lowest_bf) }}</td>
+                </tr>
+                {% endif %}
+                {% if 'current_ws' in summary_data %}
+                <tr class="summary-divider"><td colspan="2"></td></tr>
+                <tr>
+                    <td>Current Waist Size</td>
+                    <td data-summary="current_ws" data-unit=" in">{{ '%.2f in'|format(summary_data.current_ws) }}</td>
+                </tr>
+                <tr>
+                    <td>Highest Waist Size</td>
+                    <td data-summary="highest_ws" data-unit=" in">{{ '%.2f in'|format(summary_data.highest_ws) }}</td>
+                </tr>
+                <tr>
+                    <td>Lowest Waist Size</td>
+                    <td data-summary="lowest_ws" data-unit=" in">{{ '%.2f in'|format(summary_data.lowest_ws) }}</td>
+                </tr>
+                {% endif %}
+                {% if 'current_fat_mass' in summary_data or 'current_bmi' in summary_data or 'current_waist_to_height' in summary_data %}
+                <tr class="summary-divider"><td colspan="2"></td></tr>
+                {% endif %}
+                {% if 'current_fat_mass' in summary_data %}
+                <tr>
+                    <td>Current Fat Mass</td>
+                    <td data-summary="current_fat_mass" data-unit=" lbs">{{ '%.2f lbs'|format(summary_data.current_fat_mass) }}</td>
+                </tr>
+                <tr>
+                    <td>Current Lean Mass</td>
+                    <td data-summary="current_lean_mass" data-unit=" lbs">{{ '%.2f lbs'|format(summary_data.current_lean_mass) }}</td>
+                </tr>
+                {% endif %}
+                {% if 'current_bmi' in summary_data %}
+                <tr>
+                    <td>Current BMI</td>
+                    <td data-summary="current_bmi" data-digits="1">{{ '%.1f'|format(summary_data.current_bmi) }}</td>
+                </tr>
+                {% endif %}
+                {% if 'current_waist_to_height' in summary_data %}
+                <tr>
+                    <td>Waist-to-Height Ratio</td>
+                    <td data-summary="current_waist_to_height">{{ '%.2f'|format(summary_data.current_waist_to_height) }}</td>
+                </tr>
+                {% endif %}
+            </tbody>
+        </table>
+    {% else %}
+        <p>No data for summary.</p>
+    {% endif %}
+</div>
+"""
+
+CHART_CARD = """
+<div class="card chart-card" data-card="chart">
+    <h2>Weight Progress</h2>
+    {% if chart_grain in grain_labels %}<p class="chart-subtitle">{{ grain_labels[chart_grain] }}</p>{% endif %}
+    {% if combined_labels %}
+        <canvas id="weightChart"></canvas>
+        <script type="application/json" class="chart-data">{{ weight_chart | tojson }}</script>
+    {% else %}
+        <p>No data to display. Add a weight entry to see the chart.</p>
+    {% endif %}
+</div>
+"""
+
+NORMALIZED_CARD = """
+{% if normalized_chart_data %}
+<div class="card normalized-chart-card" data-card="normalized">
+    <h2>Normalized Weight Progress (%)</h2>
+    <p class="chart-subtitle">Percentage of starting weight over time (100% = start weight){% if compare_grain in grain_labels %}, {{ grain_labels[compare_grain]|lower }}{% endif %}</p>
+    <canvas id="normalizedChart"></canvas>
+    <script type="application/json" class="chart-data">{{ normalized_chart_data | tojson }}</script>
+</div>
+{% else %}
+<div data-card="normalized"></div>
+{% endif %}
+"""
+
+LEADERBOARD_HTML = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Leaderboard - Weight & Body Tracker</title>
+    <link rel="stylesheet" href="{{ url_for('static', filename='style.css') }}">
+    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap" rel="stylesheet">
+</head>
+<body>
+    <div class="container">
+        <h1>Leaderboard 🏆</h1>
+        <p class="page-links"><a href="{{ url_for('index') }}">Back to tracker</a></p>
+        <div class="card">
+            <p class="form-hint">Ranked by
+                {% for key, (label, _) in sorts.items() %}
+                    {% if key == sort %}<strong>{{ label }}</strong>{% else %}<a href="{{ url_for('leaderboard', sort=key) }}">{{ label }}</a>{% endif %}{% if not loop.last %} · {% endif %}
+                {% endfor %}
+            </p>
+            {% if rows %}
+                <table>
+                    <thead>
+                        <tr>
+                            <th>#</th>
+                            <th>User</th>
+                            <th>Current (lbs)</th>
+                            {% for key, (label, _) in sorts.items() %}<th>{{ label }}</th>{% endfor %}
+                            <th>Last Entry</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+                        {% for row in rows %}
+                            <tr>
+                                <td>{{ row.rank }}</td>
+                                <td><a href="{{ url_for('index', user1=row.name) }}">{{ row.name }}</a></td>
+                                <td>{{ '%.2f'|format(row.current) if row.current is not none else '–' }}</td>
+                                <td>{{ '%.2f%%'|format(row.pct_lost) if row.pct_lost is not none else '–' }}</td>
+                                <td>{{ '%.2f'|format(row.to_goal) if row.to_goal is not none else '–' }}</td>
+                                <td class="{{ 'goal-positive' if row.trend is not none and row.trend < 0 else '' }}">{{ '%+.2f'|format(row.trend) if row.trend is not none else '–' }}</td>
+                                <td>{{ row.last_date or '–' }}</td>
+                            </tr>
+                        {% endfor %}
+                    </tbody>
+                </table>
+            {% else %}
+                <p>No users yet.</p>
+            {% endif %}
+            {% if pages > 1 %}
+            <p class="page-links">
+                {% if page > 1 %}<a href="{{ url_for('leaderboard', sort=sort, page=page - 1) }}">&larr; Previous</a>{% endif %}
+                Page {{ page }} of {{ pages }} ({{ total }} users)
+                {% if page < pages %}<a href="{{ url_for('leaderboard', sort=sort, page=page + 1) }}">Next &rarr;</a>{% endif %}
+            </p>
+            {% endif %}
+        </div>
+    </div>
+</body>
+</html>
+"""
+
 # --- CSS Content ---
 CSS_CONTENT = """
 :root {
@@ -711,6 +1271,9 @@ tbody tr:last-child td { border-bottom: none; }
     flex-wrap: wrap;
     gap: 12px;
 }
+.compare-search {
+    margin: 12px 0 0;
+}
 .checkbox-label {
     display: flex;
     align-items: center;
@@ -737,6 +1300,24 @@ tbody tr:last-child td { border-bottom: none; }
     font-size: 0.9rem;
     margin-bottom: 12px;
 }
+.alignment-grid {
+    display: grid;
+    grid-template-columns: 1fr 1fr;
+    gap: 20px;
+    margin-top: 16px;
+}
+.alignment-grid .form-group {
+    margin-bottom: 0;
+}
+.page-links {
+    text-align: center;
+    margin: 0;
+}
+.page-links a {
+    color: var(--secondary-color);
+    font-weight: 500;
+    margin: 0 8px;
+}
 .chart-subtitle {
     color: #666;
     font-size: 0.9rem;
@@ -749,133 +1330,1936 @@ tbody tr:last-child td { border-bottom: none; }
 }
 """
 
-# 1. Setup: Create directories and files
-def setup_environment():
-    """Creates and validates necessary directories and files."""
-    print("Validating application environment...")
-    os.makedirs(STATIC_FOLDER, exist_ok=True)
+# --- Storage I/O ---
+class StorageBusyError(Exception):
+    """Raised when no storage slot frees up within STORAGE_WAIT_TIMEOUT."""
 
-    with open(CSS_FILE, 'w') as f:
-        f.write(CSS_CONTENT)
-    print(f"Ensured '{CSS_FILE}' is up to date.")
+_storage_pool = ThreadPoolExecutor(max_workers=STORAGE_WORKERS, thread_name_prefix='storage')
+_storage_slots = threading.BoundedSemaphore(STORAGE_MAX_PENDING)
 
-    DATA_HEADERS = ["Date", "Weight (lbs)", "User", "Body Fat %", "Waist Size (in)"]
-    USER_HEADERS = ["Username", "Start Weight (lbs)", "Goal Weight (lbs)"]
+def run_storage(fn, *args):
+    """Runs a storage job on the bounded pool and waits for its result."""
+    if not _storage_slots.acquire(timeout=STORAGE_WAIT_TIMEOUT):
+        raise StorageBusyError("Storage is busy, please retry shortly.")
+    try:
+        future = _storage_pool.submit(fn, *args)
+    except BaseException:
+        _storage_slots.release()
+        raise
+    future.add_done_callback(lambda _: _storage_slots.release())
+    return future.result()
 
-    if not os.path.exists(EXCEL_FILE):
-        workbook = openpyxl.Workbook()
-        sheet_data = workbook.active
-        sheet_data.title = "Weight Data"
-        sheet_data.append(DATA_HEADERS)
-        sheet_users = workbook.create_sheet("Users")
-        sheet_users.append(USER_HEADERS)
-        sheet_users.append(["User 1", None, None])
-        workbook.save(EXCEL_FILE)
-        print(f"Created '{EXCEL_FILE}' with required sheets and headers.")
-    else:
-        workbook = openpyxl.load_workbook(EXCEL_FILE)
-        updated = False
-        if "Users" not in workbook.sheetnames:
-            sheet_users = workbook.create_sheet("Users")
-            sheet_users.append(USER_HEADERS)
-            updated = True
-            print("Added missing 'Users' sheet.")
-        if "Weight Data" not in workbook.sheetnames:
-            sheet_data = workbook.create_sheet("Weight Data")
-            sheet_data.append(DATA_HEADERS)
-            updated = True
-            print("Added missing 'Weight Data' sheet.")
-        else:
-            sheet_data = workbook["Weight Data"]
-            current_headers = [cell.value for cell in sheet_data[1]]
-            if "Body Fat %" not in current_headers:
-                sheet_data.cell(row=1, column=sheet_data.max_column + 1, value="Body Fat %")
-                updated = True
-            if "Waist Size (in)" not in current_headers:
-                sheet_data.cell(row=1, column=sheet_data.max_column + 1, value="Waist Size (in)")
-                updated = True
-            if updated: print("Updated headers in 'Weight Data' sheet.")
-        if updated: workbook.save(EXCEL_FILE)
+def _save_atomically(workbook, path):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.xlsx.tmp')
+    os.close(fd)
+    try:
+        workbook.save(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
 
-setup_environment()
-app = Flask(__name__, static_folder=STATIC_FOLDER)
-app.secret_key = 'a_secure_random_secret_key'
+# --- Columnar Snapshot ---
+# Every write publishes an immutable snapshot of the workbook: fixed-width typed
+# columns (user id, date ordinal, weight, body fat, waist) with rows ordered by
+# (user, date), plus a small user table. Worker processes map the current
+# generation read-only, so the page cache holds one copy however many workers
+# run, and a write swaps everyone to the next generation by rewriting CURRENT.
+# Snapshots persist across restarts and record the mtime, size and hash of the
+# workbook they came from; while that still matches, nothing parses the xlsx.
+SNAPSHOT_MAGIC = b'WTSNAP03'
+SNAPSHOT_HEADER = struct.Struct('<8sQQQQ')  # magic, generation, rows, users, meta bytes
+SNAPSHOT_KEEP = 2  # generations kept on disk so readers can finish with the previous one
+_publish_listeners = []  # called with the store after each new generation is published
 
-def get_users():
-    """Reads the list of users from the 'Users' sheet."""
-    try:
-        workbook = openpyxl.load_workbook(EXCEL_FILE)
-        sheet = workbook["Users"]
-        users = [row[0] for row in sheet.iter_rows(min_row=2, values_only=True) if row[0]]
-        return users
-    except (FileNotFoundError, KeyError):
-        return ["User 1"]
+def _align8(n):
+    return (n + 7) & ~7
 
-def get_user_data(user):
-    """Reads start and goal weight for a specific user."""
-    raw_data = {"start_weight": None, "goal_weight": None}
-    try:
-        workbook = openpyxl.load_workbook(EXCEL_FILE)
-        sheet = workbook["Users"]
-        for row in sheet.iter_rows(min_row=2, values_only=True):
-            if row[0] == user:
-                raw_data = {"start_weight": row[1], "goal_weight": row[2]}
-                break
-    except (FileNotFoundError, KeyError):
-        return raw_data
-    start_weight, goal_weight = None, None
-    try:
-        if raw_data["start_weight"] is not None: start_weight = float(raw_data["start_weight"])
-    except (ValueError, TypeError): pass
-    try:
-        if raw_data["goal_weight"] is not None: goal_weight = float(raw_data["goal_weight"])
-    except (ValueError, TypeError): pass
-    return {"start_weight": start_weight, "goal_weight": goal_weight}
+def parse_date(value):
+    """Returns a datetime.date for a date cell or 'YYYY-MM-DD...' string, else None."""
+    if isinstance(value, datetime.datetime): return value.date()
+    if isinstance(value, datetime.date): return value
+    if value is None: return None
+    try: return datetime.date.fromisoformat(str(value).strip().split(' ')[0].split('T')[0])
+    except ValueError: return None
 
-def get_weight_entries(active_user):
-    """Reads all entries for a specific user from the Excel file."""
-    entries = []
-    try:
-        workbook = openpyxl.load_workbook(EXCEL_FILE)
-        sheet = workbook["Weight Data"]
-        for index, row_values in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-            if len(row_values) >= 3 and row_values[2] == active_user:
-                date_val, weight_val = row_values[0], row_values[1]
-                body_fat_val = row_values[3] if len(row_values) > 3 else None
-                waist_size_val = row_values[4] if len(row_values) > 4 else None
-                if date_val is None or weight_val is None: continue
-                try:
-                    numeric_weight = float(weight_val)
-                    numeric_body_fat = float(body_fat_val) if body_fat_val is not None else None
-                    numeric_waist_size = float(waist_size_val) if waist_size_val is not None else None
-                except (ValueError, TypeError): continue
-                normalized_date = (date_val.strftime("%Y-%m-%d") if isinstance(date_val, datetime.datetime) else str(date_val).split(' ')[0])
-                entries.append({"date": normalized_date, "weight": numeric_weight, "body_fat": numeric_body_fat, "waist_size": numeric_waist_size, "row_num": index})
-    except FileNotFoundError: return []
-    return sorted(entries, key=lambda x: x['date'], reverse=True)
+def _optional_float(value):
+    return float(value) if value is not None else NAN
 
-def add_weight_entry(date_str, weight, user, body_fat, waist_size):
-    """Adds a new entry to the Excel file."""
-    workbook = openpyxl.load_workbook(EXCEL_FILE)
-    sheet = workbook["Weight Data"]
-    sheet.append([date_str, weight, user, body_fat, waist_size])
-    workbook.save(EXCEL_FILE)
-
-def update_weight_entry(row_index, new_date, new_weight, new_body_fat, new_waist_size):
-    """Updates an existing entry by its row index."""
-    try:
-        workbook = openpyxl.load_workbook(EXCEL_FILE)
-        sheet = workbook["Weight Data"]
-        if 1 < row_index <= sheet.max_row:
-            sheet.cell(row=row_index, column=1).value = new_date
-            sheet.cell(row=row_index, column=2).value = new_weight
-            sheet.cell(row=row_index, column=4).value = new_body_fat
-            sheet.cell(row=row_index, column=5).value = new_waist_size
-            workbook.save(EXCEL_FILE)
+def _coerce_weight(value):
+    try: return float(value) if value is not None else None
+    except (ValueError, TypeError): return None
+
+def user_entry(name, start_weight=None, goal_weight=None, daily_aggregation=None, height=None, listed=True):
+    """One row of a snapshot's user table.
+
+    `listed` is False for names that only appear on entries; `version` is set
+    when the snapshot is published and changes whenever the user's rows or
+    settings do.
+    """
+    if daily_aggregation not in DAILY_AGGREGATIONS: daily_aggregation = DEFAULT_DAILY_AGGREGATION
+    return {"name": name, "start_weight": _coerce_weight(start_weight), "goal_weight": _coerce_weight(goal_weight),
+            "daily_aggregation": daily_aggregation, "height": _coerce_weight(height), "listed": listed, "version": 0}
+
+# Stamped into a workbook's custom document properties by `normalize`. A
+# stamped workbook has only typed, valid data rows, so loading skips the
+# per-cell parsing; app writes keep it that way.
+SCHEMA_PROPERTY = 'WeightTrackerSchema'
+SCHEMA_VERSION = 1
+
+def schema_version(workbook):
+    """The normalization stamp of a workbook, or None if it was never normalized."""
+    try: return workbook.custom_doc_props[SCHEMA_PROPERTY].value
+    except (AttributeError, KeyError): return None  # openpyxl < 3.1 has no custom properties
+
+def _columns_from_workbook(workbook, unreadable=None):
+    """Extracts the user table and valid entry records from a loaded workbook.
+
+    Rows that cannot be read are appended to `unreadable` as [user, row number, reason].
+    """
+    users, user_ids = [], {}
+    for row in workbook["Users"].iter_rows(min_row=2, values_only=True):
+        if not row or not row[0] or row[0] in user_ids: continue
+        row = (tuple(row) + (None,) * 5)[:5]
+        user_ids[row[0]] = len(users)
+        users.append(user_entry(*row))
+    if schema_version(workbook) == SCHEMA_VERSION:
+        try: return _canonical_columns(workbook["Weight Data"], list(users), dict(user_ids))
+        except (AttributeError, TypeError, ValueError): pass  # edited by hand since it was normalized
+    records = []
+    for row_num, row in enumerate(workbook["Weight Data"].iter_rows(min_row=2, values_only=True), start=2):
+        record = _record_from_row(row, row_num, users, user_ids)
+        if record is not None: records.append(record)
+        elif unreadable is not None and (problem := _unreadable_row(row, row_num)): unreadable.append(problem)
+    records.sort()
+    return users, records
+
+def _unreadable_row(row, row_num):
+    """[user, row number, reason] for a 'Weight Data' row that cannot be read; None for a blank row."""
+    row = (tuple(row) + (None,) * 5)[:5]
+    if all(v is None for v in row): return None
+    return [None if row[2] is None else str(row[2]), row_num, _invalid_row_reason(row) or "unreadable"]
+
+def _canonical_columns(sheet, users, user_ids):
+    """Fast path for a normalized sheet: cells are already typed, so rows map straight to records."""
+    records = []
+    for row_num, (entry_date, weight, user, body_fat, waist_size) in enumerate(
+            sheet.iter_rows(min_row=2, max_col=5, values_only=True), start=2):
+        uid = user_ids.get(user)
+        if uid is None:
+            if user is None: raise ValueError(f"Row {row_num} has no user.")
+            uid = user_ids[user] = len(users)
+            users.append(user_entry(user, listed=False))
+        records.append((uid, entry_date.toordinal(), row_num, weight,
+                        NAN if body_fat is None else body_fat, NAN if waist_size is None else waist_size))
+    for i in (3, 4, 5):
+        array('d', (r[i] for r in records))  # raises TypeError if any value is not a number
+    records.sort()
+    return users, records
+
+def _record_from_row(row, row_num, users, user_ids):
+    """Converts one 'Weight Data' row to a snapshot record, or None if it is invalid."""
+    if len(row) < 3 or row[2] is None: return None
+    entry_date = parse_date(row[0])
+    if entry_date is None or row[1] is None: return None
+    try:
+        weight = float(row[1])
+        body_fat = _optional_float(row[3] if len(row) > 3 else None)
+        waist_size = _optional_float(row[4] if len(row) > 4 else None)
+    except (ValueError, TypeError): return None
+    if row[2] not in user_ids:
+        # Entries whose user is missing from the 'Users' sheet stay reachable
+        # by name but are not listed in the user pickers.
+        user_ids[row[2]] = len(users)
+        users.append(user_entry(row[2], listed=False))
+    return (user_ids[row[2]], entry_date.toordinal(), row_num, weight, body_fat, waist_size)
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''): digest.update(chunk)
+    return digest.hexdigest()
+
+def _source_stamp(path):
+    """Identifies the workbook a snapshot is published from."""
+    try: st = os.stat(path)
+    except FileNotFoundError: return None
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": _file_sha256(path)}
+
+# Column order on disk: 8-byte columns first so every column stays aligned.
+SNAPSHOT_COLUMNS = (('user_offsets', 'q'), ('weights', 'd'), ('body_fat', 'd'), ('waist_size', 'd'),
+                    ('user_ids', 'i'), ('dates', 'i'), ('row_nums', 'i'))
+_ENTRY_COLUMNS = ('dates', 'row_nums', 'weights', 'body_fat', 'waist_size')
+
+def _build_columns(users, records):
+    """Turns sorted records into the snapshot's typed columns."""
+    user_offsets = array('q', [0] * (len(users) + 1))
+    for record in records: user_offsets[record[0] + 1] += 1
+    for i in range(len(users)): user_offsets[i + 1] += user_offsets[i]
+    columns = {"user_offsets": user_offsets}
+    for name, i in (('user_ids', 0), ('dates', 1), ('row_nums', 2), ('weights', 3), ('body_fat', 4), ('waist_size', 5)):
+        columns[name] = array(dict(SNAPSHOT_COLUMNS)[name], (r[i] for r in records))
+    return columns
+
+def _assign_user_versions(base, users, columns):
+    """Carries each user's version over from `base`, bumping it where their rows or settings changed.
+
+    Returns the last versions of users deleted since the snapshot was started, so
+    a re-added name continues after them instead of reusing version numbers.
+    """
+    retired = dict(base.retired) if base is not None else {}
+    for uid, user in enumerate(users):
+        old = base.user_index.get(user["name"]) if base is not None else None
+        if old is None:
+            user["version"] = retired.get(user["name"], 0) + 1
+            continue
+        previous = base.users[old]
+        start, stop = columns["user_offsets"][uid], columns["user_offsets"][uid + 1]
+        old_start, old_stop = base.user_offsets[old], base.user_offsets[old + 1]
+        same = (stop - start == old_stop - old_start
+                and all(getattr(base, name)[old_start:old_stop].tobytes() == memoryview(columns[name])[start:stop].tobytes()
+                        for name in _ENTRY_COLUMNS)
+                and all(previous.get(k) == v for k, v in user.items() if k not in ("version", "progress")))
+        user["version"] = previous.get("version", 0) + (0 if same else 1)
+    if base is not None:
+        names = {user["name"] for user in users}
+        retired.update((u["name"], u["version"]) for u in base.users if u["name"] not in names)
+    return retired
+
+TREND_DAYS = 30
+
+def _aggregate(values, policy):
+    """Combines one day's readings according to a daily aggregation policy."""
+    if not values: return None
+    if policy == 'mean': return sum(values) / len(values)
+    if policy == 'min': return min(values)
+    return values[-1]
+
+def _assign_user_progress(base, users, columns):
+    """Stores leaderboard aggregates on each user, recomputing them only where the version changed."""
+    for uid, user in enumerate(users):
+        old = base.user_index.get(user["name"]) if base is not None else None
+        previous = base.users[old] if old is not None else {}
+        if previous.get("version") == user["version"] and "progress" in previous:
+            user["progress"] = previous["progress"]
+        else:
+            user["progress"] = _user_progress(user, columns, columns["user_offsets"][uid], columns["user_offsets"][uid + 1])
+
+def _empty_progress():
+    """Progress of a user without entries: every aggregate is unknown."""
+    return {"current": None, "last_date": None, "entries": 0, "pct_lost": None, "to_goal": None, "trend": None}
+
+def _user_progress(user, columns, start, stop):
+    """Current weight, percent of start weight lost, lbs to goal and change over the last TREND_DAYS days."""
+    if start == stop: return _empty_progress()
+    dates, weights, policy = columns["dates"], columns["weights"], user["daily_aggregation"]
+
+    def day_value(end):  # aggregated weight of the day whose last row is end - 1
+        return _aggregate(weights[bisect_left(dates, dates[end - 1], start, end):end].tolist(), policy)
+
+    current, last_day = day_value(stop), dates[stop - 1]
+    anchor = bisect_right(dates, last_day - TREND_DAYS, start, stop)
+    start_weight, goal_weight = user["start_weight"], user["goal_weight"]
+    return {"current": current, "last_date": datetime.date.fromordinal(last_day).isoformat(), "entries": stop - start,
+            "pct_lost": (start_weight - current) / start_weight * 100 if start_weight else None,
+            "to_goal": current - goal_weight if goal_weight is not None else None,
+            "trend": current - day_value(anchor) if anchor > start else None}
+
+def _write_snapshot(path, generation, users, columns, source, epoch, retired):
+    """Serializes one snapshot generation to `path`."""
+    meta = json.dumps({"users": users, "source": source, "epoch": epoch, "retired": retired}).encode('utf-8')
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, generation, len(columns["dates"]), len(users), len(meta))
+    with open(path, 'wb') as f:
+        f.write(header + meta + b'\0' * (_align8(len(header) + len(meta)) - len(header) - len(meta)))
+        for name, _ in SNAPSHOT_COLUMNS: columns[name].tofile(f)
+
+class Snapshot:
+    """A published snapshot generation mapped read-only; columns are zero-copy memoryviews."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.generation, rows, n_users, meta_len = SNAPSHOT_HEADER.unpack_from(self._map)
+        if magic != SNAPSHOT_MAGIC: raise ValueError(f"'{path}' is not a weight snapshot.")
+        offset = SNAPSHOT_HEADER.size
+        meta = json.loads(bytes(self._map[offset:offset + meta_len]))
+        self.users, self.source = meta["users"], meta.get("source") or {}
+        # User versions and generations start over when a snapshot is built without
+        # a previous one, so caches keyed on them also key on this random id.
+        self.epoch = meta.get("epoch")
+        self.retired = meta.get("retired") or {}  # name -> last version of a deleted user
+        self.user_index = {u["name"]: i for i, u in enumerate(self.users)}
+        self._registry = None
+        view, offset = memoryview(self._map), _align8(offset + meta_len)
+        for name, code in SNAPSHOT_COLUMNS:
+            size = (n_users + 1 if name == 'user_offsets' else rows) * array(code).itemsize
+            setattr(self, name, view[offset:offset + size].cast(code))
+            offset += size
+
+    @property
+    def registry(self):
+        """The UserRegistry of this snapshot, built on first use."""
+        if self._registry is None: self._registry = UserRegistry(self)
+        return self._registry
+
+    def user_range(self, user):
+        """Returns the (start, stop) row range holding `user`'s entries in date order."""
+        uid = self.user_index.get(user)
+        if uid is None: return 0, 0
+        return self.user_offsets[uid], self.user_offsets[uid + 1]
+
+    def records(self):
+        """Returns the rows as (user id, date ordinal, row, weight, body fat, waist) tuples, in order."""
+        return list(zip(self.user_ids, self.dates, self.row_nums, self.weights, self.body_fat, self.waist_size))
+
+class Entry:
+    """One weigh-in; body_fat and waist_size are None when not recorded."""
+    __slots__ = ('date', 'weight', 'body_fat', 'waist_size', 'row_num')
+
+    def __init__(self, date, weight, body_fat, waist_size, row_num):
+        self.date, self.weight, self.row_num = date, weight, row_num
+        self.body_fat = None if math.isnan(body_fat) else body_fat
+        self.waist_size = None if math.isnan(waist_size) else waist_size
+
+class EntrySeries:
+    """A run of one user's entries as parallel column views of a snapshot; NaN marks missing values.
+
+    Slicing returns another view without copying; Entry records are only
+    built for the rows actually iterated.
+    """
+    __slots__ = ('dates', 'weights', 'body_fat', 'waist_size', 'row_nums')
+
+    def __init__(self, dates, weights, body_fat, waist_size, row_nums):
+        self.dates, self.weights, self.body_fat, self.waist_size, self.row_nums = (
+            dates, weights, body_fat, waist_size, row_nums)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, user):
+        """The user's entries in date order."""
+        start, stop = snapshot.user_range(user)
+        return cls(snapshot.dates[start:stop], snapshot.weights[start:stop], snapshot.body_fat[start:stop],
+                   snapshot.waist_size[start:stop], snapshot.row_nums[start:stop])
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return EntrySeries(self.dates[index], self.weights[index], self.body_fat[index],
+                               self.waist_size[index], self.row_nums[index])
+        return Entry(datetime.date.fromordinal(self.dates[index]).isoformat(), self.weights[index],
+                     self.body_fat[index], self.waist_size[index], self.row_nums[index])
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+    def between(self, first, last):
+        """Entries dated from `first` through `last` (date ordinals); needs date order."""
+        return self[bisect_left(self.dates, first):bisect_right(self.dates, last)]
+
+    def readings(self):
+        """(date ordinal, weight, body fat, waist) tuples without building Entry records."""
+        return zip(self.dates, self.weights, self.body_fat, self.waist_size)
+
+class UserRegistry:
+    """The listed users of one snapshot: a hash index for membership and a sorted index for prefix search."""
+
+    def __init__(self, snapshot):
+        self.names = [u["name"] for u in snapshot.users if u["listed"]]
+        self._members = set(self.names)
+        ordered = sorted((name.casefold(), name) for name in self.names)
+        self._keys, self._sorted = [k for k, _ in ordered], [name for _, name in ordered]
+
+    def __contains__(self, name):
+        return name in self._members
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, prefix, limit=20):
+        """Up to `limit` names starting with `prefix`, case-insensitively, in alphabetical order."""
+        key = prefix.casefold()
+        i = bisect_left(self._keys, key)
+        matches = []
+        while i < len(self._keys) and len(matches) < limit and self._keys[i].startswith(key):
+            matches.append(self._sorted[i])
+            i += 1
+        return matches
+
+@contextmanager
+def _flock(path):
+    """Holds an exclusive flock on `path`; a no-op where flock is unavailable."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+def _stat_stamp(path):
+    try: st = os.stat(path)
+    except FileNotFoundError: return None
+    return [st.st_mtime_ns, st.st_size]
+
+def _write_json_atomically(path, data):
+    with open(path + '.tmp', 'w') as f: json.dump(data, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+class SnapshotStore:
+    """Base for the storage layouts: the write lock and snapshot generations of one data set."""
+
+    def __init__(self, snapshot_dir):
+        self.snapshot_dir = snapshot_dir
+        self._pointer = os.path.join(snapshot_dir, 'CURRENT')
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._snapshot = None
+
+    @contextmanager
+    def write_lock(self):
+        """Serializes snapshot publishers across threads and, where flock exists, across processes."""
+        with self._lock:
+            self._lock_depth += 1
+            try:
+                if self._lock_depth > 1:
+                    yield
+                    return
+                os.makedirs(self.snapshot_dir, exist_ok=True)
+                with _flock(os.path.join(self.snapshot_dir, 'write.lock')):
+                    yield
+            finally:
+                self._lock_depth -= 1
+
+    def _generation_path(self, generation):
+        return os.path.join(self.snapshot_dir, f'gen-{generation:010d}.bin')
+
+    def _current_generation(self):
+        try:
+            with open(self._pointer) as f: return int(f.read())
+        except (FileNotFoundError, ValueError): return None
+
+    def _publish_columns(self, users, records, source):
+        with self.write_lock():
+            columns = _build_columns(users, records)
+            base = self._mapped_snapshot()
+            retired = _assign_user_versions(base, users, columns)
+            _assign_user_progress(base, users, columns)
+            epoch = base.epoch if base is not None and base.epoch else secrets.token_hex(8)
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            generation = (self._current_generation() or 0) + 1
+            path = self._generation_path(generation)
+            _write_snapshot(path + '.tmp', generation, users, columns, source, epoch, retired)
+            os.replace(path + '.tmp', path)
+            with open(self._pointer + '.tmp', 'w') as f: f.write(str(generation))
+            os.replace(self._pointer + '.tmp', self._pointer)
+            for name in os.listdir(self.snapshot_dir):
+                if name.startswith('gen-') and name.endswith('.bin') and int(name[4:-4]) <= generation - SNAPSHOT_KEEP:
+                    # CURRENT already names the new generation, so a file that cannot go yet
+                    # (still mapped on Windows, say) is left for the next publish to remove.
+                    try: os.remove(os.path.join(self.snapshot_dir, name))
+                    except OSError: pass
+            # Without a base the folder was new or deleted, and generation numbers start
+            # over: a snapshot still mapped from before may carry this same number.
+            if base is None: self._snapshot = None
+        for listener in _publish_listeners: listener(self)
+
+    def _mapped_snapshot(self):
+        """The current generation, mapped, without checking it against the source files."""
+        generation = self._current_generation()
+        if generation is None: return None
+        current = self._snapshot
+        if current is not None and current.generation == generation: return current
+        try: return Snapshot(self._generation_path(generation))
+        except (FileNotFoundError, ValueError): return None
+
+    def _fresh_snapshot(self):
+        """The current snapshot if it matches the source files on disk, else None."""
+        current = self._mapped_snapshot()
+        return current if current is not None and self._is_fresh(current) else None
+
+    def snapshot(self):
+        """Returns the current snapshot, mapping a newer generation if one was published.
+
+        A snapshot whose source was edited outside the app is republished first.
+        """
+        for _ in range(3):
+            generation = self._current_generation()
+            current = self._snapshot
+            if generation is not None and (current is None or current.generation != generation):
+                try: current = Snapshot(self._generation_path(generation))
+                except FileNotFoundError: continue  # superseded while we were looking; retry
+                except ValueError: current = None  # written by an older version of the app
+            if current is None or not self._is_fresh(current):
+                with self.write_lock():
+                    if self._current_generation() == generation: self.refresh()
+                continue
+            self._snapshot = current
+            return current
+        raise StorageBusyError("Snapshot kept changing, please retry shortly.")
+
+    @contextmanager
+    def batch(self):
+        """Groups several writes; layouts that can defer their saves override this."""
+        yield
+
+    def has_snapshot(self):
+        return self._current_generation() is not None
+
+    @property
+    def version(self):
+        """Data version: the generation of the current snapshot."""
+        return self.snapshot().generation
+
+class WorkbookStore(SnapshotStore):
+    """Combined layout: every user's data in one workbook with 'Weight Data' and 'Users' sheets."""
+
+    def __init__(self, excel_file):
+        super().__init__(excel_file + '.snapshot')
+        self.excel_file = excel_file
+        self._verified = None
+        self._batch = None  # (owning thread id, workbook, [dirty]) while batch() is open
+
+    @contextmanager
+    def batch(self):
+        """Applies every write in the block to one loaded workbook and saves it once at the end.
+
+        Nothing is saved if the block raises. The snapshot is only republished
+        at the end, so reads inside the block see the data as it was before.
+        """
+        with self.write_lock():
+            if self._batch is not None:
+                yield
+                return
+            workbook, dirty = self.load_workbook(), [False]
+            self._batch = (threading.get_ident(), workbook, dirty)
+            try:
+                yield
+            finally:
+                self._batch = None
+            if dirty[0]: self.save_workbook(workbook)
+
+    def _batch_workbook(self):
+        batch = self._batch
+        return batch if batch is not None and batch[0] == threading.get_ident() else None
+
+    def load_workbook(self):
+        if (batch := self._batch_workbook()) is not None: return batch[1]
+        if not os.path.exists(self.excel_file) and self.has_snapshot():
+            self.rebuild_workbook()
+        return run_storage(openpyxl.load_workbook, self.excel_file)
+
+    def save_workbook(self, workbook, appended_rows=()):
+        """Saves and publishes the workbook.
+
+        When the only change is rows appended to 'Weight Data', pass their row
+        numbers: they are inserted into the current snapshot in date order
+        instead of rebuilding it from every row.
+        """
+        if (batch := self._batch_workbook()) is not None:
+            batch[2][0] = True
+            return
+        base = self._fresh_snapshot() if appended_rows else None
+        run_storage(_save_atomically, workbook, self.excel_file)
+        if base is None:
+            self.publish(workbook)
+            return
+        users = [dict(u) for u in base.users]
+        user_ids, records = {u["name"]: i for i, u in enumerate(users)}, base.records()
+        sheet = workbook["Weight Data"]
+        for row_num in appended_rows:
+            row = next(sheet.iter_rows(min_row=row_num, max_row=row_num, values_only=True))
+            record = _record_from_row(row, row_num, users, user_ids)
+            if record is not None: insort(records, record)
+        source = dict(_source_stamp(self.excel_file) or {}, unreadable=base.source.get('unreadable', []))
+        self._publish_columns(users, records, source)
+
+    def publish(self, workbook, source=None):
+        """Publishes a new snapshot generation built from an in-memory workbook.
+
+        `source` stamps the workbook file the data came from; by default the
+        file currently on disk, which is right after a save.
+        """
+        unreadable = []
+        users, records = _columns_from_workbook(workbook, unreadable)
+        source = dict(source or _source_stamp(self.excel_file) or {}, unreadable=unreadable)
+        self._publish_columns(users, records, source)
+
+    def _is_fresh(self, snapshot):
+        """True when `snapshot` was published from the workbook now on disk."""
+        try: st = os.stat(self.excel_file)
+        except FileNotFoundError: return True  # the workbook is rebuilt from the snapshot on demand
+        source, key = snapshot.source, (snapshot.generation, st.st_mtime_ns, st.st_size)
+        if (st.st_mtime_ns, st.st_size) == (source.get('mtime_ns'), source.get('size')) or key == self._verified:
             return True
-    except Exception: return False
+        # Copies and restores change the mtime but not the content.
+        if st.st_size == source.get('size') and _file_sha256(self.excel_file) == source.get('sha256'):
+            self._verified = key
+            return True
+        return False
+
+    def refresh(self):
+        """Re-parses the workbook and publishes it."""
+        with self.write_lock():
+            source = _source_stamp(self.excel_file)
+            self.publish(self.load_workbook(), source)
+
+    def is_current(self):
+        """True when a published snapshot matches the workbook, so startup can skip parsing it."""
+        if not os.path.exists(self.excel_file): return False
+        try: return self._fresh_snapshot() is not None
+        except ValueError: return False
+
+    def rebuild_workbook(self):
+        """Recreates the workbook file from the current snapshot."""
+        with self.write_lock():
+            snapshot = Snapshot(self._generation_path(self._current_generation()))
+            workbook = openpyxl.Workbook()
+            sheet_data = workbook.active
+            sheet_data.title = "Weight Data"
+            sheet_data.append(DATA_HEADERS)
+            for i in sorted(range(len(snapshot.row_nums)), key=snapshot.row_nums.__getitem__):
+                sheet_data.append([datetime.date.fromordinal(snapshot.dates[i]), snapshot.weights[i],
+                                   snapshot.users[snapshot.user_ids[i]]["name"],
+                                   None if math.isnan(snapshot.body_fat[i]) else snapshot.body_fat[i],
+                                   None if math.isnan(snapshot.waist_size[i]) else snapshot.waist_size[i]])
+            sheet_users = workbook.create_sheet("Users")
+            sheet_users.append(USER_HEADERS)
+            for u in snapshot.users:
+                if u["listed"]:
+                    sheet_users.append([u["name"], u["start_weight"], u["goal_weight"], u["daily_aggregation"], u["height"]])
+            run_storage(_save_atomically, workbook, self.excel_file)
+            self.publish(workbook)
+
+    # Every mutation below loads the whole workbook and saves it back under the write lock.
+    def add_entries(self, entries):
+        """Appends (date, weight, user, body fat, waist) rows with a single load and save."""
+        if not entries: return
+        with self.write_lock():
+            workbook = self.load_workbook()
+            sheet = workbook["Weight Data"]
+            for entry in entries: sheet.append(list(entry))
+            self.save_workbook(workbook, appended_rows=range(sheet.max_row - len(entries) + 1, sheet.max_row + 1))
+
+    def update_entry(self, row_index, entry_date, weight, body_fat, waist_size, user=None):
+        with self.write_lock():
+            workbook = self.load_workbook()
+            sheet = workbook["Weight Data"]
+            if not 1 < row_index <= sheet.max_row: return False
+            sheet.cell(row=row_index, column=1).value = entry_date
+            sheet.cell(row=row_index, column=2).value = weight
+            sheet.cell(row=row_index, column=4).value = body_fat
+            sheet.cell(row=row_index, column=5).value = waist_size
+            self.save_workbook(workbook)
+            return True
+
+    def delete_entry(self, row_index, user=None):
+        with self.write_lock():
+            workbook = self.load_workbook()
+            sheet = workbook["Weight Data"]
+            if not 1 < row_index <= sheet.max_row: return False
+            sheet.delete_rows(row_index)
+            self.save_workbook(workbook)
+            return True
+
+    def update_goals(self, user, start_weight, goal_weight, daily_aggregation=None, height=None):
+        with self.write_lock():
+            workbook = self.load_workbook()
+            sheet = workbook["Users"]
+            for row in sheet.iter_rows(min_row=2):
+                if row[0].value == user:
+                    row[1].value, row[2].value = start_weight, goal_weight
+                    if daily_aggregation: sheet.cell(row=row[0].row, column=4).value = daily_aggregation
+                    sheet.cell(row=row[0].row, column=5).value = height
+                    self.save_workbook(workbook)
+                    return True
+            return False
+
+    def delete_entries(self, user, first=None, last=None):
+        """Deletes the user's entries dated from `first` through `last` (dates, either open); returns the count."""
+        with self.write_lock():
+            workbook = self.load_workbook()
+            sheet = workbook["Weight Data"]
+            rows = [row_num for row_num, row in enumerate(sheet.iter_rows(min_row=2, max_col=3, values_only=True), start=2)
+                    if row[2] == user and _in_date_range(parse_date(row[0]), first, last)]
+            for row_num in reversed(rows): sheet.delete_rows(row_num)
+            if rows: self.save_workbook(workbook)
+            return len(rows)
+
+    def add_user(self, name):
+        with self.write_lock():
+            if self._batch_workbook() is not None:
+                # The snapshot lags behind a batch, so check the workbook itself.
+                names = self.load_workbook()["Users"].iter_rows(min_row=2, max_col=1, values_only=True)
+                if any(row[0] == name for row in names): return False
+            else:
+                snapshot = self.snapshot()
+                uid = snapshot.user_index.get(name)
+                if uid is not None and snapshot.users[uid]["listed"]: return False
+            workbook = self.load_workbook()
+            workbook["Users"].append([name, None, None, DEFAULT_DAILY_AGGREGATION])
+            self.save_workbook(workbook)
+            return True
+
+    def delete_user(self, name):
+        with self.write_lock():
+            workbook = self.load_workbook()
+            for sheet_name in ["Weight Data", "Users"]:
+                sheet = workbook[sheet_name]
+                col_idx = 3 if sheet_name == "Weight Data" else 1
+                rows_to_delete = [r[0].row for r in sheet.iter_rows(min_row=2) if r[col_idx - 1].value == name]
+                for r_idx in sorted(rows_to_delete, reverse=True):
+                    sheet.delete_rows(r_idx)
+            self.save_workbook(workbook)
+
+def _in_date_range(entry_date, first, last):
+    return entry_date is not None and (first is None or entry_date >= first) and (last is None or entry_date <= last)
+
+def shard_file_name(user):
+    """Stable, filesystem-safe shard file name for a user."""
+    slug = re.sub(r'[^A-Za-z0-9_-]+', '_', user).strip('_')[:40] or 'user'
+    return f"{slug}-{hashlib.sha1(user.encode('utf-8')).hexdigest()[:8]}.xlsx"
+
+def _new_shard_workbook():
+    workbook = openpyxl.Workbook()
+    workbook.active.title = "Weight Data"
+    workbook.active.append(DATA_HEADERS)
+    return workbook
+
+class ShardedStore(SnapshotStore):
+    """Sharded layout: one workbook per user in `shard_dir` plus a users.json manifest.
+
+    An entry write loads and saves only that user's shard under the shard's own
+    lock, so writes for different users run in parallel; only publishing the
+    snapshot is serialized. Row numbers are rows within the user's shard.
+    """
+
+    def __init__(self, shard_dir):
+        super().__init__(os.path.join(shard_dir, '.snapshot'))
+        self.shard_dir = shard_dir
+        self.manifest_file = os.path.join(shard_dir, 'users.json')
+        self._lock_dir = os.path.join(shard_dir, '.locks')
+        self._manifest_lock = threading.Lock()
+        self._shard_locks = {}
+        self._shard_locks_guard = threading.Lock()
+        self._batch = None  # state of the open batch(), see there
+
+    def _shard_path(self, user):
+        return os.path.join(self.shard_dir, shard_file_name(user))
+
+    @contextmanager
+    def batch(self):
+        """Applies every write in the block to shards and a manifest held in memory and writes them at the end.
+
+        The manifest lock is held for the whole block and each shard's lock from
+        its first use, so no other writer touches those files meanwhile. Nothing
+        is written if the block raises; the snapshot is republished once at the end.
+        """
+        if self._batch_state() is not None:
+            yield
+            return
+        with ExitStack() as locks:
+            locks.enter_context(self.manifest_lock())
+            batch = {"thread": threading.get_ident(), "locks": locks, "locked": set(), "manifest": self.read_manifest(),
+                     "manifest_dirty": False, "shards": {}, "dirty": set()}  # shards: user -> workbook, None if deleted
+            self._batch = batch
+            try:
+                yield
+            finally:
+                self._batch = None
+            self._write_batch(batch)
+
+    def _batch_state(self):
+        batch = self._batch
+        return batch if batch is not None and batch["thread"] == threading.get_ident() else None
+
+    def _write_batch(self, batch):
+        """Saves the shards and manifest changed in a batch and publishes them."""
+        for user in batch["dirty"]:
+            workbook, path = batch["shards"][user], self._shard_path(user)
+            if workbook is not None: run_storage(_save_atomically, workbook, path)
+            elif os.path.exists(path): os.remove(path)
+        if batch["manifest_dirty"]: self.write_manifest(batch["manifest"])
+        if not batch["dirty"] and not batch["manifest_dirty"]: return
+
+        def update(users, records, source):
+            old_ids = {u["name"]: i for i, u in enumerate(users)}
+            new_users, new_records, unreadable = [], [], []
+            for uid, entry in enumerate(batch["manifest"]):
+                name = entry["name"]
+                new_users.append(user_entry(name, entry.get("start_weight"), entry.get("goal_weight"),
+                                            entry.get("daily_aggregation"), entry.get("height")))
+                if name in batch["shards"] or name not in old_ids:
+                    workbook = batch["shards"].get(name) or self._load_shard(name)
+                    new_records.extend(self._shard_records(workbook, name, uid, unreadable))
+                    source['shards'][name] = _stat_stamp(self._shard_path(name))
+                else:  # untouched: keep its rows, renumbered
+                    old = old_ids[name]
+                    new_records.extend((uid,) + r[1:] for r in records[bisect_left(records, (old,)):bisect_left(records, (old + 1,))])
+                    unreadable.extend(r for r in source.get('unreadable', []) if r[0] == name)
+            for name in set(source['shards']) - {u["name"] for u in new_users}: del source['shards'][name]
+            source['unreadable'] = unreadable
+            new_records.sort()
+            users[:], records[:] = new_users, new_records
+        self._republish(update)
+
+    @contextmanager
+    def manifest_lock(self):
+        if self._batch_state() is not None:  # held by the open batch
+            yield
+            return
+        os.makedirs(self._lock_dir, exist_ok=True)
+        with self._manifest_lock, _flock(os.path.join(self._lock_dir, 'users.json.lock')):
+            yield
+
+    @contextmanager
+    def shard_lock(self, user):
+        if (batch := self._batch_state()) is not None:
+            if user not in batch["locked"]:  # kept until the batch has written the shard
+                batch["locks"].enter_context(self._lock_shard(user))
+                batch["locked"].add(user)
+            yield
+            return
+        with self._lock_shard(user):
+            yield
+
+    @contextmanager
+    def _lock_shard(self, user):
+        with self._shard_locks_guard:
+            lock = self._shard_locks.setdefault(user, threading.Lock())
+        os.makedirs(self._lock_dir, exist_ok=True)
+        with lock, _flock(os.path.join(self._lock_dir, shard_file_name(user) + '.lock')):
+            yield
+
+    def read_manifest(self):
+        if (batch := self._batch_state()) is not None: return [dict(u) for u in batch["manifest"]]
+        with open(self.manifest_file) as f: return json.load(f)["users"]
+
+    def write_manifest(self, users):
+        if (batch := self._batch_state()) is not None:
+            batch["manifest"], batch["manifest_dirty"] = users, True
+            return
+        _write_json_atomically(self.manifest_file, {"users": users})
+
+    def _has_user(self, user):
+        if (batch := self._batch_state()) is not None: return any(u["name"] == user for u in batch["manifest"])
+        return user in self.snapshot().user_index
+
+    def _load_shard(self, user):
+        if (batch := self._batch_state()) is not None:
+            shards = batch["shards"]
+            if shards.get(user) is None:  # not loaded yet, or deleted earlier in the batch
+                shards[user] = self._read_shard(user) if user not in shards else _new_shard_workbook()
+            return shards[user]
+        return self._read_shard(user)
+
+    def _read_shard(self, user):
+        path = self._shard_path(user)
+        return run_storage(openpyxl.load_workbook, path) if os.path.exists(path) else _new_shard_workbook()
+
+    @staticmethod
+    def _shard_records(workbook, user, uid, unreadable):
+        """The shard's records; rows that cannot be read are appended to `unreadable`."""
+        records, user_ids = [], {user: uid}
+        for row_num, row in enumerate(workbook["Weight Data"].iter_rows(min_row=2, values_only=True), start=2):
+            row = (tuple(row) + (None,) * 5)[:5]
+            record = _record_from_row(row[:2] + (user,) + row[3:], row_num, [], user_ids)
+            if record is not None: records.append(record)
+            elif (problem := _unreadable_row(row[:2] + (user,) + row[3:], row_num)): unreadable.append(problem)
+        records.sort()
+        return records
+
+    def _is_fresh(self, snapshot):
+        # Shards are only written through the app, which republishes after each
+        # save; is_current() checks every shard when the process starts.
+        return snapshot.source.get('manifest') == _stat_stamp(self.manifest_file)
+
+    def is_current(self):
+        """True when the snapshot matches the manifest and every shard on disk."""
+        snapshot = self._fresh_snapshot()
+        if snapshot is None: return False
+        shards = snapshot.source.get('shards') or {}
+        return all(shards.get(u["name"]) == _stat_stamp(self._shard_path(u["name"])) for u in snapshot.users)
+
+    def refresh(self):
+        """Reads the manifest and every shard and publishes them."""
+        with self.write_lock():
+            manifest_stamp = _stat_stamp(self.manifest_file)
+            users, records, shards, unreadable = [], [], {}, []
+            for uid, entry in enumerate(self.read_manifest()):
+                users.append(user_entry(entry["name"], entry.get("start_weight"), entry.get("goal_weight"),
+                                        entry.get("daily_aggregation"), entry.get("height")))
+                shards[entry["name"]] = _stat_stamp(self._shard_path(entry["name"]))
+                if shards[entry["name"]] is not None:
+                    records.extend(self._shard_records(self._load_shard(entry["name"]), entry["name"], uid, unreadable))
+            self._publish_columns(users, records, {"manifest": manifest_stamp, "shards": shards, "unreadable": unreadable})
+
+    def _republish(self, update):
+        """Applies `update(users, records, source)` to the current snapshot and publishes it.
+
+        Inside a batch this is deferred: the batch republishes once when it is written.
+        """
+        if self._batch_state() is not None: return
+        with self.write_lock():
+            base = self._mapped_snapshot()
+            if base is None:
+                self.refresh()
+                return
+            users, records, source = [dict(u) for u in base.users], base.records(), dict(base.source)
+            source['shards'] = dict(source.get('shards') or {})
+            update(users, records, source)
+            source['manifest'] = _stat_stamp(self.manifest_file)
+            self._publish_columns(users, records, source)
+
+    def _write_shard(self, user, mutate):
+        """Runs `mutate(sheet)` on the user's shard and saves it if it returns True."""
+        with self.shard_lock(user):
+            workbook = self._load_shard(user)
+            if not mutate(workbook["Weight Data"]): return False
+            if (batch := self._batch_state()) is not None:
+                batch["dirty"].add(user)
+                return True
+            path = self._shard_path(user)
+            run_storage(_save_atomically, workbook, path)
+
+            def update(users, records, source):
+                uid = next(i for i, u in enumerate(users) if u["name"] == user)
+                start, stop = bisect_left(records, (uid,)), bisect_left(records, (uid + 1,))
+                unreadable = [r for r in source.get('unreadable', []) if r[0] != user]
+                records[start:stop] = self._shard_records(workbook, user, uid, unreadable)
+                source['shards'][user], source['unreadable'] = _stat_stamp(path), unreadable
+            self._republish(update)
+            return True
+
+    def add_entries(self, entries):
+        """Appends (date, weight, user, body fat, waist) rows, saving each affected shard once and publishing once.
+
+        Raises ValueError, before writing anything, if a row's user is not in the manifest.
+        """
+        by_user = {}
+        for entry in entries: by_user.setdefault(entry[2], []).append(entry)
+        if unknown := [user for user in by_user if not self._has_user(user)]:
+            raise ValueError(f"Unknown users: {', '.join(map(repr, unknown))}.")
+        with self.batch() if len(by_user) > 1 else nullcontext():
+            for user, rows in by_user.items():
+                def mutate(sheet, rows=rows):
+                    for row in rows: sheet.append(list(row))
+                    return True
+                self._write_shard(user, mutate)
+
+    def delete_entries(self, user, first=None, last=None):
+        """Deletes the user's entries dated from `first` through `last` (dates, either open); returns the count."""
+        deleted = []
+        def mutate(sheet):
+            rows = [row_num for row_num, row in enumerate(sheet.iter_rows(min_row=2, max_col=1, values_only=True), start=2)
+                    if _in_date_range(parse_date(row[0]), first, last)]
+            for row_num in reversed(rows): sheet.delete_rows(row_num)
+            deleted.extend(rows)
+            return bool(rows)
+        if self._has_user(user): self._write_shard(user, mutate)
+        return len(deleted)
+
+    def update_entry(self, row_index, entry_date, weight, body_fat, waist_size, user=None):
+        def mutate(sheet):
+            if not 1 < row_index <= sheet.max_row: return False
+            for column, value in ((1, entry_date), (2, weight), (4, body_fat), (5, waist_size)):
+                sheet.cell(row=row_index, column=column).value = value
+            return True
+        return self._has_user(user) and self._write_shard(user, mutate)
+
+    def delete_entry(self, row_index, user=None):
+        def mutate(sheet):
+            if not 1 < row_index <= sheet.max_row: return False
+            sheet.delete_rows(row_index)
+            return True
+        return self._has_user(user) and self._write_shard(user, mutate)
+
+    def update_goals(self, user, start_weight, goal_weight, daily_aggregation=None, height=None):
+        with self.manifest_lock():
+            manifest = self.read_manifest()
+            entry = next((u for u in manifest if u["name"] == user), None)
+            if entry is None: return False
+            entry["start_weight"], entry["goal_weight"], entry["height"] = start_weight, goal_weight, height
+            if daily_aggregation: entry["daily_aggregation"] = daily_aggregation
+            self.write_manifest(manifest)
+
+            def update(users, records, source):
+                for u in users:
+                    if u["name"] == user:
+                        u["start_weight"], u["goal_weight"], u["height"] = start_weight, goal_weight, height
+                        if daily_aggregation: u["daily_aggregation"] = daily_aggregation
+            self._republish(update)
+            return True
+
+    def add_user(self, name):
+        with self.manifest_lock():
+            manifest = self.read_manifest()
+            if any(u["name"] == name for u in manifest): return False
+            manifest.append({"name": name, "start_weight": None, "goal_weight": None,
+                             "daily_aggregation": DEFAULT_DAILY_AGGREGATION, "height": None, "shard": shard_file_name(name)})
+            self.write_manifest(manifest)
+            self._republish(lambda users, records, source: users.append(user_entry(name)))
+            return True
+
+    def delete_user(self, name):
+        with self.manifest_lock():
+            self.write_manifest([u for u in self.read_manifest() if u["name"] != name])
+            with self.shard_lock(name):
+                if (batch := self._batch_state()) is not None:
+                    batch["shards"][name] = None
+                    batch["dirty"].add(name)
+                elif os.path.exists(self._shard_path(name)): os.remove(self._shard_path(name))
+
+            def update(users, records, source):
+                uid = next((i for i, u in enumerate(users) if u["name"] == name), None)
+                if uid is None: return
+                del users[uid]
+                source['shards'].pop(name, None)
+                source['unreadable'] = [r for r in source.get('unreadable', []) if r[0] != name]
+                records[:] = [(r[0] - (r[0] > uid),) + r[1:] for r in records if r[0] != uid]
+            self._republish(update)
+
+def migrate_to_shards(excel_file=EXCEL_FILE, shard_dir=SHARD_DIR):
+    """Splits a combined workbook into per-user shard workbooks plus a users.json manifest."""
+    store = ShardedStore(shard_dir)
+    if os.path.exists(store.manifest_file):
+        raise RuntimeError(f"'{store.manifest_file}' already exists; refusing to overwrite it.")
+    workbook = openpyxl.load_workbook(excel_file)
+    manifest, shards = [], {}
+    for row in workbook["Users"].iter_rows(min_row=2, values_only=True):
+        if not row or not row[0] or row[0] in shards: continue
+        entry = user_entry(*(tuple(row) + (None,) * 5)[:5])
+        manifest.append({k: entry[k] for k in ("name", "start_weight", "goal_weight", "daily_aggregation", "height")})
+        manifest[-1]["shard"] = shard_file_name(row[0])
+        shards[row[0]] = _new_shard_workbook()
+    skipped = 0
+    for row in workbook["Weight Data"].iter_rows(min_row=2, values_only=True):
+        user = row[2] if len(row) > 2 else None
+        if user is None:
+            skipped += 1
+            continue
+        if user not in shards:
+            manifest.append({"name": user, "start_weight": None, "goal_weight": None,
+                             "daily_aggregation": DEFAULT_DAILY_AGGREGATION, "height": None, "shard": shard_file_name(user)})
+            shards[user] = _new_shard_workbook()
+        shards[user]["Weight Data"].append(list(row[:5]))
+    os.makedirs(shard_dir, exist_ok=True)
+    for user, shard in shards.items():
+        _save_atomically(shard, store._shard_path(user))
+    store.write_manifest(manifest)
+    store.refresh()
+    return {"users": len(manifest), "entries": sum(s["Weight Data"].max_row - 1 for s in shards.values()),
+            "skipped_rows": skipped}
+
+QUARANTINE_SHEET = "Quarantine"
+
+def normalize_workbook(store=None):
+    """Rewrites a combined workbook in canonical form and stamps SCHEMA_VERSION (with openpyxl >= 3.1).
+
+    Data rows get typed date and number cells and are sorted by (user, date);
+    rows that cannot be read are moved to the Quarantine sheet with the reason.
+    User rows get numeric goals and a valid aggregation policy; blank and
+    duplicate user rows are dropped.
+    """
+    store = store or WorkbookStore(EXCEL_FILE)
+    with store.write_lock():
+        workbook = store.load_workbook()
+        users_sheet, data_sheet = workbook["Users"], workbook["Weight Data"]
+        seen, user_rows, dropped_users = set(), [], 0
+        for row in users_sheet.iter_rows(min_row=2, values_only=True):
+            if not row or not row[0] or row[0] in seen:
+                dropped_users += 1
+                continue
+            seen.add(row[0])
+            entry = user_entry(str(row[0]), *(tuple(row[1:]) + (None,) * 4)[:4])
+            user_rows.append([entry["name"], entry["start_weight"], entry["goal_weight"], entry["daily_aggregation"],
+                              entry["height"]])
+
+        valid, quarantined = [], []
+        for row_num, row in enumerate(data_sheet.iter_rows(min_row=2, max_col=5, values_only=True), start=2):
+            row = (tuple(row) + (None,) * 5)[:5]
+            if not any(v is not None for v in row): continue  # blank row
+            reason = _invalid_row_reason(row)
+            if reason:
+                quarantined.append(list(row) + [row_num, reason])
+                continue
+            body_fat, waist_size = (float(v) if v is not None else None for v in row[3:5])
+            valid.append((str(row[2]), parse_date(row[0]), row_num, float(row[1]), body_fat, waist_size))
+        valid.sort(key=lambda r: r[:3])
+
+        users_sheet.delete_rows(2, users_sheet.max_row)
+        for row in user_rows: users_sheet.append(row)
+        data_sheet.delete_rows(2, data_sheet.max_row)
+        for user, entry_date, _, weight, body_fat, waist_size in valid:
+            data_sheet.append([entry_date, weight, user, body_fat, waist_size])
+        if quarantined:
+            if QUARANTINE_SHEET not in workbook.sheetnames:
+                workbook.create_sheet(QUARANTINE_SHEET).append(DATA_HEADERS + ["Original Row", "Reason"])
+            for row in quarantined: workbook[QUARANTINE_SHEET].append(row)
+        stamped = True
+        if schema_version(workbook) is not None:
+            workbook.custom_doc_props[SCHEMA_PROPERTY].value = SCHEMA_VERSION
+        else:
+            try: from openpyxl.packaging.custom import IntProperty
+            except ImportError: stamped = False  # openpyxl < 3.1: saved unstamped, so loads keep checking every cell
+            else: workbook.custom_doc_props.append(IntProperty(name=SCHEMA_PROPERTY, value=SCHEMA_VERSION))
+        store.save_workbook(workbook)
+    return {"entries": len(valid), "quarantined": len(quarantined), "users": len(user_rows),
+            "dropped_users": dropped_users, "stamped": stamped}
+
+def _invalid_row_reason(row):
+    entry_date, weight, user, body_fat, waist_size = row
+    if user is None or str(user).strip() == '': return "missing user"
+    if parse_date(entry_date) is None: return "missing or invalid date"
+    if _coerce_weight(weight) is None: return "missing or invalid weight"
+    for name, value in (("body fat", body_fat), ("waist size", waist_size)):
+        if value is not None and _coerce_weight(value) is None: return f"invalid {name}"
+    return None
+
+def open_store(excel_file, layout=STORAGE_LAYOUT):
+    """Returns the store for the data set whose combined workbook is `excel_file`."""
+    if layout == 'sharded': return ShardedStore(os.path.join(os.path.dirname(excel_file), 'weights_shards'))
+    return WorkbookStore(excel_file)
+
+_default_store = open_store(EXCEL_FILE)
+
+def get_store():
+    """Returns the store backing the current request: the tenant's store in multi-tenant mode."""
+    if not TENANCY or not has_request_context(): return _default_store
+    store = request.environ.get('weight_tracker.store')
+    if store is None:
+        store = request.environ['weight_tracker.store'] = tenant_stores.get(request.environ[TENANT_ENVIRON_KEY])
+    return store
+
+# --- Tenants ---
+TENANT_ENVIRON_KEY = 'weight_tracker.tenant'
+TENANT_NAME = re.compile(r'^[a-z0-9][a-z0-9_-]{0,62}$')
+
+class TenantStores:
+    """The open stores of the tenants this process serves, least recently used first.
+
+    A store's footprint is its mapped snapshot plus what it holds in the
+    rollup, derived-metric, ranking and card caches. Stores are dropped once the
+    total passes `budget` bytes or they sit idle for `idle_seconds`; the next
+    request reopens one from its snapshot sidecar without parsing workbooks.
+    """
+
+    def __init__(self, root, budget, idle_seconds):
+        self.root, self.budget, self.idle_seconds = root, budget, idle_seconds
+        self._stores = OrderedDict()  # tenant -> [store, last used]
+        self._lock = threading.Lock()
+        self.opened = self.evicted = 0
+
+    def excel_file(self, tenant):
+        return os.path.join(self.root, tenant, 'weights.xlsx')
+
+    def exists(self, tenant):
+        return bool(tenant and TENANT_NAME.match(tenant)) and os.path.isdir(os.path.join(self.root, tenant))
+
+    def create(self, tenant):
+        """Sets up a new tenant's data directory and workbook."""
+        if not TENANT_NAME.match(tenant):
+            raise ValueError("Tenant names use lowercase letters, digits, '-' and '_'.")
+        os.makedirs(os.path.join(self.root, tenant), exist_ok=True)
+        prepare_store(open_store(self.excel_file(tenant)), self.excel_file(tenant))
+
+    def get(self, tenant):
+        now = time.monotonic()
+        with self._lock:
+            slot = self._stores.get(tenant)
+            if slot is not None:
+                slot[1] = now
+                self._stores.move_to_end(tenant)
+        if slot is None:
+            store = open_store(self.excel_file(tenant))
+            prepare_store(store, self.excel_file(tenant), log=lambda message: None)
+            with self._lock:
+                slot = self._stores.setdefault(tenant, [store, now])
+                if slot[0] is store: self.opened += 1
+        self._evict(keep=tenant)
+        return slot[0]
+
+    def _evict(self, keep):
+        now, dropped, caches = time.monotonic(), [], _cache_footprints()
+        with self._lock:
+            total = sum(_store_footprint(store, caches) for store, _ in self._stores.values())
+            for tenant, (store, last_used) in list(self._stores.items()):
+                if total <= self.budget and now - last_used < self.idle_seconds: break
+                if tenant == keep: continue
+                del self._stores[tenant]
+                total -= _store_footprint(store, caches)
+                dropped.append(store)
+            self.evicted += len(dropped)
+        for store in dropped: forget_store_caches(store)
+
+    def stats(self):
+        caches = _cache_footprints()
+        with self._lock:
+            return {"open": len(self._stores), "opened": self.opened, "evicted": self.evicted,
+                    "bytes": sum(_store_footprint(store, caches) for store, _ in self._stores.values()),
+                    "budget": self.budget}
+
+def forget_store_caches(store):
+    """Drops the rollups, derived metrics, rankings and cards cached for a store that is being closed."""
+    with _rollup_cache_lock:
+        for key in [k for k in _rollup_cache if k[0] == store.snapshot_dir]: del _rollup_cache[key]
+    with _derived_cache_lock:
+        for key in [k for k in _derived_cache if k[0] == store.snapshot_dir]: del _derived_cache[key]
+    with _rankings_lock:
+        for key in [k for k in _rankings if k[0] == store.snapshot_dir]: del _rankings[key]
+    with _card_cache_lock:
+        for key in [k for k in _card_cache if k[0] == store.snapshot_dir]: del _card_cache[key]
+
+def _cache_footprints():
+    """Approximate bytes held in the rollup, derived-metric, ranking and card caches, by snapshot folder."""
+    sizes = {}
+    for cache, lock, size in ((_rollup_cache, _rollup_cache_lock, lambda rollups: rollups.nbytes),
+                              (_derived_cache, _derived_cache_lock, lambda derived: derived.nbytes),
+                              (_rankings, _rankings_lock, lambda cached: 8 * len(cached[1])),
+                              (_card_cache, _card_cache_lock, len)):
+        with lock:
+            for key, value in cache.items(): sizes[key[0]] = sizes.get(key[0], 0) + size(value)
+    return sizes
+
+def _store_footprint(store, caches=None):
+    """Bytes a store holds: its mapped snapshot and its share of the caches."""
+    snapshot = store._snapshot
+    mapped = len(snapshot._map) if snapshot is not None else 0
+    return mapped + (caches if caches is not None else _cache_footprints()).get(store.snapshot_dir, 0)
+
+class TenantMiddleware:
+    """Resolves each request's tenant from its subdomain or first path segment; unknown tenants get a 404."""
+
+    def __init__(self, wsgi_app, mode, stores):
+        self.wsgi_app, self.mode, self.stores = wsgi_app, mode, stores
+
+    def __call__(self, environ, start_response):
+        if self.mode == 'prefix':
+            tenant, _, rest = environ.get('PATH_INFO', '').lstrip('/').partition('/')
+            if self.stores.exists(tenant):
+                # Moving the prefix to SCRIPT_NAME makes url_for() generate tenant-relative links.
+                environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + '/' + tenant
+                environ['PATH_INFO'] = '/' + rest
+        else:
+            host = environ.get('HTTP_HOST', '').split(':')[0].lower()
+            if TENANT_DOMAIN: tenant = host[:-len(TENANT_DOMAIN) - 1] if host.endswith('.' + TENANT_DOMAIN) else ''
+            else: tenant = host.split('.')[0] if host.count('.') >= 2 else ''
+        if not self.stores.exists(tenant):
+            start_response('404 Not Found', [('Content-Type', 'text/plain; charset=utf-8')])
+            return [b"Unknown household.\n"]
+        environ[TENANT_ENVIRON_KEY] = tenant
+        return self.wsgi_app(environ, start_response)
+
+tenant_stores = TenantStores(TENANT_DIR, TENANT_CACHE_MB * 1024 * 1024, TENANT_IDLE_SECONDS)
+
+def load_workbook():
+    """Loads the Excel file on the storage pool."""
+    return get_store().load_workbook()
+
+def save_workbook(workbook):
+    """Saves the workbook atomically and publishes a new snapshot generation."""
+    get_store().save_workbook(workbook)
+
+# 1. Setup: Create directories and files
+def setup_environment():
+    """Creates and validates necessary directories and files."""
+    print("Validating application environment...")
+    os.makedirs(STATIC_FOLDER, exist_ok=True)
+
+    with open(CSS_FILE, 'w') as f:
+        f.write(CSS_CONTENT)
+    print(f"Ensured '{CSS_FILE}' is up to date.")
+
+    if TENANCY: os.makedirs(TENANT_DIR, exist_ok=True)  # tenants are prepared when first opened
+    else: prepare_store(get_store(), EXCEL_FILE)
+
+def prepare_store(store, excel_file, log=print):
+    """Creates or upgrades a data set's files and makes sure its snapshot is current."""
+    if isinstance(store, ShardedStore):
+        os.makedirs(store.shard_dir, exist_ok=True)
+        if not os.path.exists(store.manifest_file):
+            if os.path.exists(excel_file):
+                raise SystemExit(f"'{excel_file}' has not been split into shards yet; run "
+                                 "`python weight_tracking_og2.py migrate-shards` without WEIGHT_TRACKER_LAYOUT set.")
+            store.write_manifest([{"name": "User 1", "start_weight": None, "goal_weight": None,
+                                   "daily_aggregation": DEFAULT_DAILY_AGGREGATION, "height": None, "shard": shard_file_name("User 1")}])
+            log(f"Created '{store.manifest_file}'.")
+        if store.is_current(): log(f"Snapshot of '{store.shard_dir}' is current; skipped parsing the shards.")
+        else: store.refresh()
+        return
+
+    if not os.path.exists(excel_file) and store.has_snapshot():
+        store.rebuild_workbook()
+        log(f"Rebuilt '{excel_file}' from its snapshot.")
+
+    if not os.path.exists(excel_file):
+        workbook = openpyxl.Workbook()
+        sheet_data = workbook.active
+        sheet_data.title = "Weight Data"
+        sheet_data.append(DATA_HEADERS)
+        sheet_users = workbook.create_sheet("Users")
+        sheet_users.append(USER_HEADERS)
+        sheet_users.append(["User 1", None, None, DEFAULT_DAILY_AGGREGATION])
+        store.save_workbook(workbook)
+        log(f"Created '{excel_file}' with required sheets and headers.")
+    elif store.is_current():
+        log(f"Snapshot of '{excel_file}' is current; skipped parsing the workbook.")
+    else:
+        source = _source_stamp(excel_file)
+        workbook = store.load_workbook()
+        updated = False
+        if "Users" not in workbook.sheetnames:
+            sheet_users = workbook.create_sheet("Users")
+            sheet_users.append(USER_HEADERS)
+            updated = True
+            log("Added missing 'Users' sheet.")
+        elif [c.value for c in workbook["Users"][1][3:5]] != USER_HEADERS[3:5]:
+            for column in (4, 5): workbook["Users"].cell(row=1, column=column, value=USER_HEADERS[column - 1])
+            updated = True
+            log("Updated headers in 'Users' sheet.")
+        if "Weight Data" not in workbook.sheetnames:
+            sheet_data = workbook.create_sheet("Weight Data")
+            sheet_data.append(DATA_HEADERS)
+            updated = True
+            log("Added missing 'Weight Data' sheet.")
+        else:
+            sheet_data = workbook["Weight Data"]
+            current_headers = [cell.value for cell in sheet_data[1]]
+            if "Body Fat %" not in current_headers:
+                sheet_data.cell(row=1, column=sheet_data.max_column + 1, value="Body Fat %")
+                updated = True
+            if "Waist Size (in)" not in current_headers:
+                sheet_data.cell(row=1, column=sheet_data.max_column + 1, value="Waist Size (in)")
+                updated = True
+            if updated: log("Updated headers in 'Weight Data' sheet.")
+        # Publish the first snapshot here so requests never parse the workbook.
+        if updated: store.save_workbook(workbook)
+        else: store.publish(workbook, source)
+
+# The headless CLI (weight_cli.py) prepares only the data files it touches.
+if os.environ.get('WEIGHT_TRACKER_HEADLESS') != '1': setup_environment()
+app = Flask(__name__, static_folder=STATIC_FOLDER)
+app.secret_key = 'a_secure_random_secret_key'
+if TENANCY: app.wsgi_app = TenantMiddleware(app.wsgi_app, TENANCY, tenant_stores)
+
+@app.errorhandler(StorageBusyError)
+def storage_busy(error):
+    return str(error), 503, {'Retry-After': '2'}
+
+def create_asgi_app():
+    """ASGI entry point: `uvicorn --factory weight_tracking_og2:create_asgi_app`."""
+    try:
+        from a2wsgi import WSGIMiddleware
+    except ImportError as e:
+        raise RuntimeError("ASGI mode requires the 'a2wsgi' package (pip install a2wsgi uvicorn).") from e
+    return WSGIMiddleware(app, workers=ASGI_REQUEST_WORKERS)
+
+def get_users():
+    """Reads the list of users from the 'Users' sheet."""
+    try:
+        return get_store().snapshot().registry.names
+    except (FileNotFoundError, KeyError):
+        return ["User 1"]
+
+def get_user_data(user):
+    """Reads start weight, goal weight and daily aggregation policy for a specific user."""
+    try:
+        snapshot = get_store().snapshot()
+    except (FileNotFoundError, KeyError):
+        snapshot = None
+    uid = snapshot.user_index.get(user) if snapshot is not None else None
+    data = snapshot.users[uid] if uid is not None else user_entry(user)
+    return {k: data[k] for k in ("start_weight", "goal_weight", "daily_aggregation", "height")}
+
+def get_weight_entries(active_user):
+    """Returns all entries for a specific user as an EntrySeries, newest first."""
+    try:
+        snapshot = get_store().snapshot()
+    except FileNotFoundError: return EntrySeries(*([],) * 5)
+    return EntrySeries.from_snapshot(snapshot, active_user)[::-1]
+
+# --- Daily Aggregation & Rollups ---
+# Each user's readings are reduced to one value per day using that user's
+# daily aggregation policy, then rolled up into weekly (Monday-start) and
+# monthly periods. Rollups are cached per user and data version; appended
+# entries fold into the cached rollups, touching only their day, week and
+# month, and any other change rebuilds just that user's rollups on next use.
+METRICS = ('weight', 'body_fat', 'waist_size')
+GRAINS = ('day', 'week', 'month')  # finest first
+GRAIN_LABELS = {'week': "Weekly averages", 'month': "Monthly averages"}
+CHART_MAX_POINTS = int(os.environ.get('WEIGHT_TRACKER_CHART_MAX_POINTS', '366'))
+ROLLUP_CACHE_SIZE = 1024
+ROLLUP_DAY_BYTES = 650  # measured memory of one day's readings, daily values and share of the periods
+
+def _week_start(ordinal):
+    return ordinal - (ordinal - 1) % 7  # ordinal 1 (0001-01-01) is a Monday
+
+def _month_start(ordinal):
+    return datetime.date.fromordinal(ordinal).replace(day=1).toordinal()
+
+class UserRollups:
+    """Daily values plus weekly and monthly mean/min/max/last for one user."""
+
+    def __init__(self, policy, version=0):
+        self.policy = policy if policy in DAILY_AGGREGATIONS else DEFAULT_DAILY_AGGREGATION
+        self.version = version
+        self.days = []       # sorted day ordinals with at least one reading
+        self.readings = {}   # day ordinal -> ([weights], [body fats], [waists]) in row order
+        self.daily = {m: {} for m in METRICS}
+        self.weekly = {m: {} for m in METRICS}
+        self.monthly = {m: {} for m in METRICS}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_snapshot(cls, snapshot, user):
+        uid = snapshot.user_index.get(user)
+        info = snapshot.users[uid] if uid is not None else user_entry(user)
+        rollups = cls(info["daily_aggregation"], info["version"])
+        rollups.add(EntrySeries.from_snapshot(snapshot, user).readings())
+        return rollups
+
+    def add(self, readings):
+        """Folds in (day ordinal, weight, body fat, waist) readings; None or NaN means not recorded."""
+        with self._lock:
+            touched = set()
+            for ordinal, *values in readings:
+                day = self.readings.get(ordinal)
+                if day is None:
+                    day = self.readings[ordinal] = ([], [], [])
+                    insort(self.days, ordinal)
+                for column, value in zip(day, values):
+                    if value is not None and not math.isnan(value): column.append(value)
+                touched.add(ordinal)
+            for ordinal in touched:
+                for metric, values in zip(METRICS, self.readings[ordinal]):
+                    value = _aggregate(values, self.policy)
+                    if value is None: self.daily[metric].pop(ordinal, None)
+                    else: self.daily[metric][ordinal] = value
+            for start in {_week_start(o) for o in touched}:
+                self._roll_up(self.weekly, start, start + 7)
+            for start in {_month_start(o) for o in touched}:
+                self._roll_up(self.monthly, start, _month_start(start + 31))
+
+    def _roll_up(self, table, start, stop):
+        days = self.days[bisect_left(self.days, start):bisect_left(self.days, stop)]
+        for metric in METRICS:
+            daily = self.daily[metric]
+            values = [daily[o] for o in days if o in daily]
+            if values:
+                table[metric][start] = {"mean": sum(values) / len(values), "min": min(values),
+                                        "max": max(values), "last": values[-1], "days": len(values)}
+            else:
+                table[metric].pop(start, None)
+
+    @property
+    def nbytes(self):
+        """Approximate memory held, for the tenant cache budget."""
+        return ROLLUP_DAY_BYTES * len(self.days)
+
+    def grain(self, max_points=CHART_MAX_POINTS):
+        """Finest grain ('day', 'week' or 'month') that plots within max_points."""
+        if len(self.days) <= max_points: return 'day'
+        return 'week' if len(self.weekly['weight']) <= max_points else 'month'
+
+    def series(self, metric, grain='day'):
+        """Returns (ISO date labels, values) in date order; week and month points are period means."""
+        ordinals, values = self.points(metric, grain)
+        return _iso_dates(ordinals), values
+
+    def points(self, metric, grain='day'):
+        """Like series(), but with day ordinals instead of ISO labels."""
+        with self._lock:
+            if grain == 'day':
+                table = self.daily[metric]
+                points = [(o, table[o]) for o in self.days if o in table]
+            else:
+                table = (self.weekly if grain == 'week' else self.monthly)[metric]
+                period = _week_start if grain == 'week' else _month_start
+                starts = dict.fromkeys(period(o) for o in self.days)  # days are sorted, so periods are too
+                points = [(o, table[o]["mean"]) for o in starts if o in table]
+        return [o for o, _ in points], [v for _, v in points]
+
+    def day(self, ordinal):
+        """The daily value of each metric on one day; None where nothing was recorded."""
+        with self._lock:
+            return {m: self.daily[m].get(ordinal) for m in METRICS}
+
+    def periods(self, metric, grain):
+        """Returns the weekly or monthly rollup rows for a metric, oldest first."""
+        with self._lock:
+            table = (self.weekly if grain == 'week' else self.monthly)[metric]
+            period = _week_start if grain == 'week' else _month_start
+            starts = dict.fromkeys(period(o) for o in self.days)
+            return [dict(table[o], period=datetime.date.fromordinal(o).isoformat()) for o in starts if o in table]
+
+def _iso_dates(ordinals):
+    return [datetime.date.fromordinal(o).isoformat() for o in ordinals]
+
+_rollup_cache = OrderedDict()
+_rollup_cache_lock = threading.Lock()
+
+def _user_version(snapshot, user):
+    uid = snapshot.user_index.get(user)
+    return snapshot.users[uid]["version"] if uid is not None else 0
+
+def get_rollups(user, snapshot=None, store=None):
+    """Returns the user's rollups, rebuilding them only when the user's data version changed."""
+    store = store or get_store()
+    snapshot = snapshot or store.snapshot()
+    key = (store.snapshot_dir, snapshot.epoch, user)
+    with _rollup_cache_lock:
+        rollups = _rollup_cache.get(key)
+        if rollups is not None: _rollup_cache.move_to_end(key)
+    if rollups is None or rollups.version != _user_version(snapshot, user):
+        rollups = UserRollups.from_snapshot(snapshot, user)
+        with _rollup_cache_lock:
+            _rollup_cache[key] = rollups
+            while len(_rollup_cache) > ROLLUP_CACHE_SIZE: _rollup_cache.popitem(last=False)
+    return rollups
+
+def _absorb_appends(store, entries):
+    """Folds just-committed entries into cached rollups when they are the user's only change."""
+    snapshot = store.snapshot()
+    by_user = {}
+    for entry_date, weight, user, body_fat, waist_size in entries:
+        by_user.setdefault(user, []).append((entry_date.toordinal(), weight, body_fat, waist_size))
+    for user, readings in by_user.items():
+        with _rollup_cache_lock:
+            rollups = _rollup_cache.get((store.snapshot_dir, snapshot.epoch, user))
+        version = _user_version(snapshot, user)
+        if rollups is not None and rollups.version == version - 1:
+            rollups.add(readings)
+            rollups.version = version
+
+# --- Derived Metrics ---
+# Fat mass, lean mass, BMI and waist-to-height ratio for every entry. With
+# NumPy each metric is one whole-column operation over the user's slice of
+# the snapshot; without it the same formulas run entry by entry. Results are
+# cached per user and data version, and a height change bumps the version.
+DERIVED_METRICS = ('fat_mass', 'lean_mass', 'bmi', 'waist_to_height')
+BMI_FACTOR = 703  # lb/in^2 to kg/m^2
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+def _derive(weights, body_fat, waist_size, height):
+    """Applies the formulas to NumPy columns or to single floats alike; missing inputs give NaN."""
+    fat_mass = weights * body_fat / 100
+    return {'fat_mass': fat_mass, 'lean_mass': weights - fat_mass,
+            'bmi': BMI_FACTOR * weights / (height * height) if height else weights * NAN,
+            'waist_to_height': waist_size / height if height else waist_size * NAN}
+
+class DerivedMetrics:
+    """Per-entry derived series for one user in date order; NaN where an input was not recorded."""
+
+    def __init__(self, dates, columns, version=0, policy=DEFAULT_DAILY_AGGREGATION):
+        self.dates, self.columns, self.version, self.policy = dates, columns, version, policy
+
+    @classmethod
+    def from_snapshot(cls, snapshot, user):
+        uid = snapshot.user_index.get(user)
+        info = snapshot.users[uid] if uid is not None else user_entry(user)
+        series = EntrySeries.from_snapshot(snapshot, user)
+        if np is not None:
+            # The inputs are zero-copy views of the mapped snapshot; every result is a fresh array.
+            columns = _derive(np.asarray(series.weights), np.asarray(series.body_fat),
+                              np.asarray(series.waist_size), info["height"])
+            return cls(np.array(series.dates, dtype=np.int64), columns, info["version"], info["daily_aggregation"])
+        columns = {m: [] for m in DERIVED_METRICS}
+        for _, weight, body_fat, waist_size in series.readings():
+            for metric, value in _derive(weight, body_fat, waist_size, info["height"]).items():
+                columns[metric].append(value)
+        return cls(list(series.dates), columns, info["version"], info["daily_aggregation"])
+
+    def points(self, metric, grain='day'):
+        """Returns (day ordinals, values) for each day, week or month that has a value.
+
+        Same-day values are combined by the user's daily aggregation policy, and
+        weeks and months are the mean of their days, as in the rollups.
+        """
+        values = self.columns[metric]
+        if np is not None:
+            known = ~np.isnan(values)
+            dates, values = self.dates[known], values[known]
+            if not len(values): return [], []
+            days, firsts, slots = np.unique(dates, return_index=True, return_inverse=True)
+            if self.policy == 'mean': values = np.bincount(slots, weights=values) / np.bincount(slots)
+            elif self.policy == 'min': values = np.minimum.reduceat(values, firsts)
+            else: values = values[np.append(firsts[1:], len(values)) - 1]
+            if grain == 'day': return days.tolist(), values.tolist()
+            if grain == 'week':
+                days = days - (days - 1) % 7
+            else:
+                months = (days - EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[M]')
+                days = months.astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+            starts, slots = np.unique(days, return_inverse=True)
+            return starts.tolist(), (np.bincount(slots, weights=values) / np.bincount(slots)).tolist()
+        readings = {}
+        for ordinal, value in zip(self.dates, values):
+            if not math.isnan(value): readings.setdefault(ordinal, []).append(value)
+        days = {ordinal: _aggregate(day, self.policy) for ordinal, day in readings.items()}
+        if grain == 'day': return list(days), list(days.values())
+        period = {'week': _week_start, 'month': _month_start}[grain]
+        buckets = {}
+        for ordinal, value in days.items(): buckets.setdefault(period(ordinal), []).append(value)
+        return list(buckets), [sum(v) / len(v) for v in buckets.values()]
+
+    @property
+    def nbytes(self):
+        """Approximate memory held, for the tenant cache budget."""
+        if np is not None: return self.dates.nbytes + sum(values.nbytes for values in self.columns.values())
+        return 32 * len(self.dates) * (len(self.columns) + 1)  # a boxed number and a list slot each
+
+    def latest(self, metric):
+        """The metric on the most recent day it was recorded, combined by the daily aggregation policy, or None."""
+        values = self.columns[metric]
+        if np is not None:
+            known = np.flatnonzero(~np.isnan(values))
+            if not len(known): return None
+            day = known[self.dates[known] == self.dates[known[-1]]]
+            return float(_aggregate(values[day].tolist(), self.policy))
+        known = [i for i, v in enumerate(values) if not math.isnan(v)]
+        if not known: return None
+        return _aggregate([values[i] for i in known if self.dates[i] == self.dates[known[-1]]], self.policy)
+
+_derived_cache = OrderedDict()
+_derived_cache_lock = threading.Lock()
+
+def get_derived_metrics(user, snapshot=None, store=None):
+    """Returns the user's derived metrics, recomputing them only when the user's data version changed."""
+    store = store or get_store()
+    snapshot = snapshot or store.snapshot()
+    key = (store.snapshot_dir, snapshot.epoch, user)
+    with _derived_cache_lock:
+        derived = _derived_cache.get(key)
+        if derived is not None: _derived_cache.move_to_end(key)
+    if derived is None or derived.version != _user_version(snapshot, user):
+        derived = DerivedMetrics.from_snapshot(snapshot, user)
+        with _derived_cache_lock:
+            _derived_cache[key] = derived
+            while len(_derived_cache) > ROLLUP_CACHE_SIZE: _derived_cache.popitem(last=False)
+    return derived
+
+# --- Series Alignment ---
+# Lines several users' series up on one date axis for the comparison charts.
+# The series are already sorted, so a heap-based k-way merge visits each
+# point once instead of building a set of dates and sorting it.
+RESAMPLE_STEPS = {'day': 1, 'week': 7}
+FILL_METHODS = ('ffill', 'interpolate')
+
+def align_series(series, resample=None, fill=None):
+    """Aligns sorted (ordinals, values) series on a shared axis; returns (ordinals, [values per series]).
+
+    With `resample` ('day' or 'week') the axis is a regular grid from the first
+    to the last point and each point lands in its grid slot, the latest winning.
+    `fill` ('ffill' or 'interpolate') fills gaps between a series' known values;
+    otherwise gaps stay None.
+    """
+    step = RESAMPLE_STEPS.get(resample)
+    merged = heapq.merge(*(zip(s[0], repeat(i), s[1]) for i, s in enumerate(series)), key=itemgetter(0))
+    axis, columns, origin = [], [[] for _ in series], None
+    for ordinal, i, value in merged:
+        if step:
+            if origin is None: origin = _week_start(ordinal) if step == 7 else ordinal
+            ordinal = origin + (ordinal - origin) // step * step
+        while not axis or axis[-1] < ordinal:
+            axis.append(axis[-1] + step if step and axis else ordinal)
+            for column in columns: column.append(None)
+        columns[i][-1] = value
+    if fill in FILL_METHODS:
+        for column in columns: _fill_gaps(axis, column, fill)
+    return axis, columns
+
+def _align_for_chart(series_at, grain, resample=None, fill=None, max_points=CHART_MAX_POINTS):
+    """Aligns `series_at(grain)` at the finest grain from `grain` up whose shared axis fits `max_points`.
+
+    Merging several users, or resampling a sparse range, can give an axis far
+    longer than any one series. The grid is never finer than the grain: at
+    'week' a daily grid is weekly, and monthly points are not resampled.
+    Returns (grain, axis, columns).
+    """
+    for grain in GRAINS[GRAINS.index(grain):]:
+        step = max(resample, grain, key=GRAINS.index) if resample else None
+        axis, columns = align_series(series_at(grain), step if step in RESAMPLE_STEPS else None, fill)
+        if len(axis) <= max_points: break
+    return grain, axis, columns
+
+def _fill_gaps(axis, column, method):
+    """Fills None runs between two known values in place; leading and trailing runs stay empty."""
+    last = None
+    for i, value in enumerate(column):
+        if value is None: continue
+        if last is not None and i - last > 1:
+            before = column[last]
+            for j in range(last + 1, i):
+                column[j] = before if method == 'ffill' else \
+                    before + (value - before) * (axis[j] - axis[last]) / (axis[i] - axis[last])
+        last = i
+
+# --- Ingestion Queue ---
+# New entries from the form and the API go through one writer thread. It
+# drops readings already recorded (same user, date and values), coalesces
+# whole requests submitted within INGEST_WINDOW seconds into a single commit
+# of up to INGEST_MAX_BATCH entries, and keeps queue depth and commit
+# latency for /api/ingest/stats. A request is never split across commits.
+INGEST_WINDOW = float(os.environ.get('WEIGHT_TRACKER_INGEST_WINDOW', '0.05'))
+INGEST_MAX_BATCH = 1000
+INGEST_MAX_PENDING = 5000
+INGEST_WAIT_TIMEOUT = 60  # seconds a request waits for its entries to be committed
+
+def _entry_key(entry):
+    entry_date, weight, user, body_fat, waist_size = entry
+    return user, entry_date.toordinal(), weight, body_fat, waist_size
+
+def _already_recorded(snapshot, entry):
+    """True when the snapshot already holds this exact reading."""
+    user, ordinal, weight, body_fat, waist_size = _entry_key(entry)
+    start, stop = snapshot.user_range(user)
+    i = bisect_left(snapshot.dates, ordinal, start, stop)
+    while i < stop and snapshot.dates[i] == ordinal:
+        stored_bf, stored_ws = snapshot.body_fat[i], snapshot.waist_size[i]
+        if (snapshot.weights[i] == weight and (None if math.isnan(stored_bf) else stored_bf) == body_fat
+                and (None if math.isnan(stored_ws) else stored_ws) == waist_size):
+            return True
+        i += 1
     return False
 
+class IngestQueue:
+    """Single-writer queue that dedupes entries and commits each window's requests at once.
+
+    A request's entries are queued, and committed, as one unit: the writer
+    coalesces whole requests up to `max_batch` entries and never splits one,
+    so a request larger than that is committed on its own.
+    """
+
+    def __init__(self, window, max_batch, max_pending):
+        self.window, self.max_batch, self.max_pending = window, max_batch, max_pending
+        self._queue = queue.Queue()
+        self._pending = 0  # entries queued or being committed
+        self._space = threading.Condition()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=200)
+        self.commits = self.committed = self.duplicates = 0
+
+    def submit(self, entries, store=None):
+        """Queues (date, weight, user, body fat, waist) entries and waits until they are committed.
+
+        Returns 'created' or 'duplicate' for each entry, in order.
+        """
+        entries = list(entries)
+        if not entries: return []
+        self._ensure_writer()
+        store = store or get_store()
+        future = Future()
+        with self._space:
+            # All of the request fits, or none of it is queued; one larger than the
+            # whole limit waits for an empty queue.
+            if not self._space.wait_for(lambda: not self._pending or self._pending + len(entries) <= self.max_pending,
+                                        STORAGE_WAIT_TIMEOUT):
+                raise StorageBusyError("Too many entries waiting to be saved, please retry shortly.")
+            self._pending += len(entries)
+        self._queue.put((store, entries, future))
+        try: return future.result(timeout=INGEST_WAIT_TIMEOUT)
+        except FutureTimeoutError:
+            raise StorageBusyError("Saving entries is taking too long; they may still be saved, please check before retrying.")
+
+    def _ensure_writer(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        held = None  # a request that did not fit in the previous window
+        while True:
+            batch, held = [held or self._queue.get()], None
+            size = len(batch[0][1])
+            deadline = time.monotonic() + self.window
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: break
+                try: item = self._queue.get(timeout=remaining)
+                except queue.Empty: break
+                if size + len(item[1]) > self.max_batch:
+                    held = item
+                    break
+                batch.append(item)
+                size += len(item[1])
+            by_store = {}
+            for item in batch: by_store.setdefault(id(item[0]), []).append(item)
+            for items in by_store.values(): self._commit(items[0][0], items)
+
+    def _commit(self, store, items):
+        """Saves one store's requests from a window in one write; every request's future is resolved, whatever fails."""
+        started, results, error = time.perf_counter(), [], None
+        size = sum(len(entries) for _, entries, _ in items)
+        try:
+            snapshot, seen, fresh = store.snapshot(), set(), []
+            for _, entries, _ in items:
+                statuses = []
+                for entry in entries:
+                    key = _entry_key(entry)
+                    statuses.append('duplicate' if key in seen or _already_recorded(snapshot, entry) else 'created')
+                    seen.add(key)
+                    if statuses[-1] == 'created': fresh.append(entry)
+                results.append(statuses)
+            store.add_entries(fresh)
+            elapsed = time.perf_counter() - started
+            self._release(size)
+            size = 0  # freed before the callers are woken, so they see it gone
+            for (_, _, future), statuses in zip(items, results): future.set_result(statuses)
+            with self._stats_lock:
+                self.commits += 1 if fresh else 0
+                self.committed += len(fresh)
+                self.duplicates += sum(len(entries) for _, entries, _ in items) - len(fresh)
+                if fresh: self._latencies.append(elapsed)
+            # The entries are saved: if this fails, the stale rollups are rebuilt on their next read.
+            if fresh: _absorb_appends(store, fresh)
+        except Exception as e:
+            error = e
+        finally:
+            self._release(size)
+            for _, _, future in items:
+                if not future.done(): future.set_exception(error or StorageBusyError("Entries could not be saved, please retry."))
+
+    def _release(self, size):
+        """Frees queue capacity for `size` entries that are no longer pending."""
+        with self._space:
+            self._pending -= size
+            self._space.notify_all()
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            return {
+                "queue_depth": self._pending,
+                "commits": self.commits,
+                "entries_committed": self.committed,
+                "duplicates_dropped": self.duplicates,
+                "entries_per_commit": round(self.committed / self.commits, 2) if self.commits else None,
+                "commit_ms_last": round(self._latencies[-1] * 1000, 2) if latencies else None,
+                "commit_ms_p50": round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+                "commit_ms_max": round(latencies[-1] * 1000, 2) if latencies else None,
+            }
+
+_ingest = IngestQueue(INGEST_WINDOW, INGEST_MAX_BATCH, INGEST_MAX_PENDING)
+
+def add_weight_entry(date_str, weight, user, body_fat, waist_size):
+    """Adds a new entry through the ingestion queue; False if it was already recorded."""
+    entry_date = parse_date(date_str)
+    if entry_date is None: raise ValueError(f"Invalid date: {date_str!r}")
+    return _ingest.submit([(entry_date, weight, user, body_fat, waist_size)]) == ['created']
+
+def add_weight_entries(entries):
+    """Adds parsed (date, weight, user, body fat, waist) entries through the ingestion queue.
+
+    Returns 'created' or 'duplicate' for each entry.
+    """
+    return _ingest.submit(entries)
+
+def update_weight_entry(row_index, new_date, new_weight, new_body_fat, new_waist_size, user=None):
+    """Updates an existing entry by its row index (within `user`'s shard when sharded)."""
+    new_date = parse_date(new_date)
+    if new_date is None: return False
+    try: return get_store().update_entry(row_index, new_date, new_weight, new_body_fat, new_waist_size, user)
+    except StorageBusyError: raise
+    except Exception: return False
+
+def delete_weight_entry(row_index, user=None):
+    """Deletes an entry by its row index (within `user`'s shard when sharded)."""
+    return get_store().delete_entry(row_index, user)
+
+def delete_weight_entries(user, first=None, last=None):
+    """Deletes a user's entries dated from `first` through `last` (either may be None); returns how many."""
+    return get_store().delete_entries(user, first, last)
+
+def update_user_goals(user, start_weight, goal_weight, daily_aggregation=None, height=None):
+    """Sets a user's start and goal weight and height (None clears each), and optionally how same-day entries combine.
+
+    Returns False if the user does not exist.
+    """
+    return get_store().update_goals(user, start_weight, goal_weight, daily_aggregation, height)
+
+def create_user(name):
+    """Adds a user; False if one with that name already exists."""
+    return get_store().add_user(name)
+
+def delete_user_data(user):
+    """Removes a user and all of their entries."""
+    get_store().delete_user(user)
+
+# --- Dashboard Coalescing ---
+class SingleFlight:
+    """Runs one call per key at a time; callers that arrive while it runs share its result."""
+
+    def __init__(self, timeout=COALESCE_TIMEOUT):
+        self.timeout = timeout
+        self._calls = {}  # key -> Future of the call in flight
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "shared": 0, "timeouts": 0, "failures": 0}
+
+    def do(self, key, fn):
+        """Returns fn(), or the result of the identical call already in flight.
+
+        A follower whose leader takes longer than `timeout` or fails runs fn()
+        itself, so one stuck render never stalls everyone behind it.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader: future = self._calls[key] = Future()
+            self.stats["calls" if leader else "shared"] += 1
+        if leader:
+            try:
+                result = fn()
+                future.set_result(result)
+                return result
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with self._lock: del self._calls[key]
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._lock: self.stats["timeouts"] += 1
+        except Exception:
+            with self._lock: self.stats["failures"] += 1
+        return fn()
+
+dashboard_flights = SingleFlight()
+
+def _dashboard_key():
+    """The view a dashboard GET renders: store, data generation and the exact query string."""
+    store = get_store()
+    try: snapshot = store.snapshot()
+    except FileNotFoundError: snapshot = None
+    generation = (snapshot.epoch, snapshot.generation) if snapshot is not None else None
+    return store.snapshot_dir, generation, tuple(request.args.items(multi=True))
+
+def dashboard_summary(rollups, derived, user_data):
+    """The Summary card's values for one user; optional rows appear only when recorded."""
+    summary_data = {'current': None, 'highest': None, 'lowest': None}
+    daily_weights = rollups.series('weight')[1]
+    if daily_weights:
+        summary_data.update({'current': daily_weights[-1], 'highest': max(daily_weights), 'lowest': min(daily_weights)})
+    summary_data.update({'start': user_data.get('start_weight'), 'goal': user_data.get('goal_weight')})
+    if summary_data.get('current') and summary_data.get('goal'):
+        to_goal = summary_data['current'] - summary_data['goal']
+        if to_goal > 0.05: summary_data.update({'to_goal': f"{to_goal:.2f} lbs to lose", 'goal_class': 'goal-negative'})
+        elif to_goal < -0.05: summary_data.update({'to_goal': f"{-to_goal:.2f} lbs below goal", 'goal_class': 'goal-positive'})
+        else: summary_data.update({'to_goal': "Goal reached!", 'goal_class': 'goal-positive'})
+
+    all_bf = rollups.series('body_fat')[1]
+    if all_bf:
+        summary_data.update({'current_bf': all_bf[-1], 'highest_bf': max(all_bf), 'lowest_bf': min(all_bf)})
+    all_ws = rollups.series('waist_size')[1]
+    if all_ws:
+        summary_data.update({'current_ws': all_ws[-1], 'highest_ws': max(all_ws), 'lowest_ws': min(all_ws)})
+    for metric in DERIVED_METRICS:
+        value = derived.latest(metric)
+        if value is not None: summary_data[f'current_{metric}'] = value
+    return summary_data
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
@@ -884,30 +3268,55 @@ def index():
             weight = float(request.form['weight'])
             body_fat = float(s) if (s := request.form.get('body_fat')) else None
             waist_size = float(s) if (s := request.form.get('waist_size')) else None
-            if weight > 0 and date_str:
-                add_weight_entry(date_str, weight, user, body_fat, waist_size)
-                flash('Entry added successfully!', 'success')
+            if user not in get_store().snapshot().registry:
+                flash(f"Unknown user '{user}'.", 'error')
+            elif weight > 0 and date_str:
+                if add_weight_entry(date_str, weight, user, body_fat, waist_size):
+                    flash('Entry added successfully!', 'success')
+                else:
+                    flash('That entry was already recorded.', 'success')
             else:
                 flash('Weight must be a positive number.', 'error')
         except (ValueError, TypeError):
             flash('Invalid input. Please enter valid numbers.', 'error')
-        return redirect(url_for('index', user1=user))
+        return _write_response(redirect(url_for('index', user1=user)))
 
-    all_users = get_users()
-    if not all_users:
-        return render_template_string(HTML_CONTENT, all_users=[], primary_user=None, entries=[], primary_user_data={})
+    # The page embeds the session's flash messages, so only a render without
+    # any is shared; that covers a crowd opening the same link.
+    if session.get('_flashes'): return render_dashboard()
+    return dashboard_flights.do(_dashboard_key(), render_dashboard)
+
+def dashboard_view(all_users):
+    """The view the query string asks for: which users are shown and how comparison series are aligned."""
+    return {
+        'primary_user': request.args.get('user1') or all_users[0],
+        'comparison_user': request.args.get('user2') or None,
+        'compare_users': list(dict.fromkeys(u for u in request.args.getlist('compare_users') if u)),
+        'resample': request.args.get('resample') if request.args.get('resample') in RESAMPLE_STEPS else None,
+        'fill': request.args.get('fill') if request.args.get('fill') in FILL_METHODS else None,
+    }
+
+def _history_card(view, snapshot):
+    return {'entries': get_weight_entries(view['primary_user']), 'primary_user': view['primary_user']}
+
+def _summary_card(view, snapshot):
+    user = view['primary_user']
+    return {'summary_data': dashboard_summary(get_rollups(user, snapshot), get_derived_metrics(user, snapshot),
+                                              get_user_data(user))}
 
-    primary_user = request.args.get('user1', all_users[0])
-    comparison_user = request.args.get('user2')
-    entries = get_weight_entries(primary_user)
+def _chart_card(view, snapshot):
+    primary_user, comparison_user = view['primary_user'], view['comparison_user']
     primary_user_data = get_user_data(primary_user)
     comparison_user_data = get_user_data(comparison_user) if comparison_user else {}
-    today_date = datetime.datetime.now().strftime("%Y-%m-%d")
+    rollups1 = get_rollups(primary_user, snapshot)
+    rollups2 = get_rollups(comparison_user, snapshot) if comparison_user else None
 
     # --- Weight Chart Data ---
-    entries1 = sorted([e for e in entries if e.get('weight') is not None], key=lambda x: x['date'])
-    data1_map = {e['date']: e['weight'] for e in entries1}
-    y1_values = list(data1_map.values())
+    # Charts plot one value per day, or weekly/monthly means once a range no longer fits CHART_MAX_POINTS.
+    chart_grain = max((r.grain() for r in (rollups1, rollups2) if r is not None), key=GRAINS.index)
+    resample, fill = view['resample'], view['fill']
+    points1 = rollups1.points('weight', chart_grain)
+    y1_values = list(points1[1])
     if primary_user_data.get('start_weight') is not None: y1_values.append(primary_user_data['start_weight'])
     if primary_user_data.get('goal_weight') is not None: y1_values.append(primary_user_data['goal_weight'])
     y1_min, y1_max = (None, None)
@@ -918,11 +3327,9 @@ def index():
     combined_labels, chart_data_1, chart_data_2_to_plot = [], [], []
 
     if comparison_user:
-        entries2 = sorted(get_weight_entries(comparison_user), key=lambda x: x['date'])
-        data2_map = {e['date']: e['weight'] for e in entries2}
-        combined_labels = sorted(list(set(data1_map.keys()) | set(data2_map.keys())))
-        chart_data_1 = [data1_map.get(date) for date in combined_labels]
-        chart_data_2_to_plot = [data2_map.get(date) for date in combined_labels]
+        chart_grain, axis, (chart_data_1, chart_data_2_to_plot) = _align_for_chart(
+            lambda grain: [rollups1.points('weight', grain), rollups2.points('weight', grain)], chart_grain, resample, fill)
+        combined_labels = _iso_dates(axis)
         chart_config["y2_axis_label"] = f"{comparison_user} Weight (lbs)"
 
         # --- Proportional Y-Axis Scaling Logic ---
@@ -949,46 +3356,28 @@ def index():
                 padding = 5
                 chart_config['y2_min'], chart_config['y2_max'] = min(y2_values) - padding, max(y2_values) + padding
     else:
-        combined_labels, chart_data_1 = [e['date'] for e in entries1], [e['weight'] for e in entries1]
-
-
-    # --- Summary Data ---
-    summary_data = {}
-    if entries:
-        all_weights = [e['weight'] for e in entries]
-        summary_data.update({'current': all_weights[0], 'highest': max(all_weights), 'lowest': min(all_weights)})
-    summary_data.update({'start': primary_user_data.get('start_weight'), 'goal': primary_user_data.get('goal_weight')})
-    if summary_data.get('current') and summary_data.get('goal'):
-        to_goal = summary_data['current'] - summary_data['goal']
-        if to_goal > 0.05: summary_data.update({'to_goal': f"{to_goal:.2f} lbs to lose", 'goal_class': 'goal-negative'})
-        elif to_goal < -0.05: summary_data.update({'to_goal': f"{-to_goal:.2f} lbs below goal", 'goal_class': 'goal-positive'})
-        else: summary_data.update({'to_goal': "Goal reached!", 'goal_class': 'goal-positive'})
+        combined_labels, chart_data_1 = _iso_dates(points1[0]), points1[1]
 
-    # --- Optional Charts & Summary Stats ---
-    body_fat_entries = [e for e in entries if e.get('body_fat') is not None]
-    body_fat_labels, body_fat_data = [], []
-    if body_fat_entries:
-        sorted_bf = sorted(body_fat_entries, key=lambda x: x['date'])
-        body_fat_labels, body_fat_data = [e['date'] for e in sorted_bf], [e['body_fat'] for e in sorted_bf]
-        all_bf = [e['body_fat'] for e in body_fat_entries]
-        summary_data.update({'current_bf': body_fat_entries[0]['body_fat'], 'highest_bf': max(all_bf), 'lowest_bf': min(all_bf)})
-
-    waist_size_entries = [e for e in entries if e.get('waist_size') is not None]
-    waist_size_labels, waist_size_data = [], []
-    if waist_size_entries:
-        sorted_ws = sorted(waist_size_entries, key=lambda x: x['date'])
-        waist_size_labels, waist_size_data = [e['date'] for e in sorted_ws], [e['waist_size'] for e in sorted_ws]
-        all_ws = [e['waist_size'] for e in waist_size_entries]
-        summary_data.update({'current_ws': waist_size_entries[0]['waist_size'], 'highest_ws': max(all_ws), 'lowest_ws': min(all_ws)})
+    shown = [primary_user] + ([comparison_user] if comparison_user and chart_data_2_to_plot else [])
+    weight_chart = {
+        'labels': combined_labels, 'data_1': chart_data_1, 'data_2': chart_data_2_to_plot, 'config': chart_config,
+        'primary_user': primary_user, 'comparison_user': shown[1] if len(shown) > 1 else None,
+        'start_weight': primary_user_data.get('start_weight'), 'goal_weight': primary_user_data.get('goal_weight'),
+        'grain': chart_grain, 'versions': {user: _user_version(snapshot, user) for user in shown}
+    }
+    return {'chart_grain': chart_grain, 'grain_labels': GRAIN_LABELS, 'combined_labels': combined_labels,
+            'weight_chart': weight_chart}
 
+def _normalized_card(view, snapshot):
     # --- Multi-User Normalized Chart Data ---
-    selected_compare_users = request.args.getlist('compare_users')
-    normalized_chart_data = None
+    selected_compare_users, resample, fill = view['compare_users'], view['resample'], view['fill']
+    normalized_chart_data, compare_grain = None, None
     
     if selected_compare_users:
         # Build normalized data for each selected user
-        all_dates = set()
         user_normalized_data = {}
+        compare_rollups = {user: get_rollups(user, snapshot) for user in selected_compare_users}
+        compare_grain = max((r.grain() for r in compare_rollups.values()), key=GRAINS.index, default='day')
         
         for user in selected_compare_users:
             user_data = get_user_data(user)
@@ -997,48 +3386,149 @@ def index():
             if not start_weight or start_weight <= 0:
                 continue  # Skip users without valid start weight
             
-            user_entries = get_weight_entries(user)
-            if not user_entries:
+            ordinals, weights = compare_rollups[user].points('weight', compare_grain)
+            if not ordinals:
                 continue  # Skip users with no entries
             
-            # Calculate normalized weight for each entry
-            normalized_map = {}
-            for entry in user_entries:
-                if entry.get('weight'):
-                    normalized_pct = (entry['weight'] / start_weight) * 100
-                    normalized_map[entry['date']] = round(normalized_pct, 2)
-                    all_dates.add(entry['date'])
-            
-            if normalized_map:
-                user_normalized_data[user] = normalized_map
+            # Calculate normalized weight for each point
+            user_normalized_data[user] = (ordinals, [(weight / start_weight) * 100 for weight in weights])
         
         # Build chart data structure if we have data
         if user_normalized_data:
-            sorted_dates = sorted(list(all_dates))
+            starts = {user: get_user_data(user)['start_weight'] for user in user_normalized_data}
+
+            def normalized(grain):
+                # A coarser grain when the users' dates together don't fit the chart.
+                if grain == compare_grain: return list(user_normalized_data.values())
+                series = []
+                for user in user_normalized_data:
+                    ordinals, weights = compare_rollups[user].points('weight', grain)
+                    series.append((ordinals, [(weight / starts[user]) * 100 for weight in weights]))
+                return series
+
+            compare_grain, axis, columns = _align_for_chart(normalized, compare_grain, resample, fill)
             datasets = []
             
-            for user, norm_map in user_normalized_data.items():
-                data_points = [norm_map.get(date) for date in sorted_dates]
+            for user, data_points in zip(user_normalized_data, columns):
                 datasets.append({
                     'label': user,
-                    'data': data_points
+                    'data': [round(v, 2) if v is not None else None for v in data_points]
                 })
             
             normalized_chart_data = {
-                'labels': sorted_dates,
-                'datasets': datasets
+                'labels': _iso_dates(axis),
+                'datasets': datasets,
+                'starts': starts,
+                'grain': compare_grain,
+                'versions': {user: _user_version(snapshot, user) for user in user_normalized_data}
             }
 
+    return {'normalized_chart_data': normalized_chart_data, 'compare_grain': compare_grain, 'grain_labels': GRAIN_LABELS}
+
+# Each card's template, the function computing its context, and the view
+# fields it depends on. A card is cached under those fields plus the data
+# versions of the users they name, so it is only re-rendered when one of
+# them changes.
+DASHBOARD_CARDS = {
+    'history': (HISTORY_CARD, _history_card, ('primary_user',)),
+    'summary': (SUMMARY_CARD, _summary_card, ('primary_user',)),
+    'chart': (CHART_CARD, _chart_card, ('primary_user', 'comparison_user', 'resample', 'fill')),
+    'normalized': (NORMALIZED_CARD, _normalized_card, ('compare_users', 'resample', 'fill')),
+}
+CARD_CACHE_SIZE = 256
+_card_cache = OrderedDict()
+_card_cache_lock = threading.Lock()
+
+def card_etag(name, view, snapshot, store=None):
+    """A tag that changes whenever the card's view fields or its users' data change."""
+    store = store or get_store()
+    fields = DASHBOARD_CARDS[name][2]
+    users = []
+    for field in fields:
+        if field == 'compare_users': users.extend(view[field])
+        elif field.endswith('_user') and view[field]: users.append(view[field])
+    key = (name, store.snapshot_dir, snapshot.epoch, [view[f] for f in fields],
+           [(u, _user_version(snapshot, u)) for u in users])
+    return hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+
+def render_card(name, view, snapshot, store=None):
+    """Returns (html, etag) for one dashboard card, rendering it only on a cache miss."""
+    store = store or get_store()
+    etag = card_etag(name, view, snapshot, store)
+    key = (store.snapshot_dir, etag)  # the store in the clear, so forget_store_caches() can find it
+    with _card_cache_lock:
+        html = _card_cache.get(key)
+        if html is not None: _card_cache.move_to_end(key)
+    if html is None:
+        template, context, _ = DASHBOARD_CARDS[name]
+        html = render_template_string(template, **context(view, snapshot))
+        with _card_cache_lock:
+            _card_cache[key] = html
+            while len(_card_cache) > CARD_CACHE_SIZE: _card_cache.popitem(last=False)
+    return html, etag
+
+def render_dashboard():
+    """Renders the dashboard for the current request's query string."""
+    all_users = get_users()
+    if not all_users:
+        cards = {f'{name}_card': render_template_string(card[0]) for name, card in DASHBOARD_CARDS.items()}
+        return render_template_string(HTML_CONTENT, all_users=[], primary_user=None, primary_user_data={},
+                                      selected_compare_users=[], **cards)
+
+    view = dashboard_view(all_users)
+    primary_user, comparison_user = view['primary_user'], view['comparison_user']
+    # Past USER_PICKER_LIMIT users the pickers become autocomplete inputs instead of embedding every name.
+    picker_users = all_users if len(all_users) <= USER_PICKER_LIMIT else []
+    primary_user_data = get_user_data(primary_user)
+    today_date = datetime.datetime.now().strftime("%Y-%m-%d")
+    snapshot = get_store().snapshot()
+    rollups1 = get_rollups(primary_user, snapshot)
+    derived = get_derived_metrics(primary_user, snapshot)
+    cards = {f'{name}_card': render_card(name, view, snapshot)[0] for name in DASHBOARD_CARDS}
+
+    # --- Optional Charts ---
+    body_fat_labels, body_fat_data = rollups1.series('body_fat', rollups1.grain())
+    waist_size_labels, waist_size_data = rollups1.series('waist_size', rollups1.grain())
+
+    # --- Derived Body Composition ---
+    derived_grain = rollups1.grain()
+    composition_labels, fat_mass_data = derived.points('fat_mass', derived_grain)
+    lean_mass_data = derived.points('lean_mass', derived_grain)[1]
+    bmi_labels, bmi_data = derived.points('bmi', derived_grain)
+    whtr_labels, whtr_data = derived.points('waist_to_height', derived_grain)
+    composition_labels, bmi_labels, whtr_labels = map(_iso_dates, (composition_labels, bmi_labels, whtr_labels))
+
+    live_users = list(dict.fromkeys(u for u in (primary_user, comparison_user, *view['compare_users']) if u))
+    live_versions = {u: _user_version(snapshot, u) for u in live_users} if LIVE_UPDATES else None
+
     return render_template_string(
-        HTML_CONTENT, entries=entries, primary_user=primary_user, comparison_user=comparison_user,
-        all_users=all_users, primary_user_data=primary_user_data, comparison_user_data=comparison_user_data,
-        combined_labels=combined_labels, chart_data_1=chart_data_1, chart_data_2_to_plot=chart_data_2_to_plot,
-        chart_config=chart_config, today_date=today_date, summary_data=summary_data,
+        HTML_CONTENT, primary_user=primary_user, comparison_user=comparison_user,
+        all_users=picker_users, primary_user_data=primary_user_data, today_date=today_date,
         body_fat_labels=body_fat_labels, body_fat_data=body_fat_data,
         waist_size_labels=waist_size_labels, waist_size_data=waist_size_data,
-        selected_compare_users=selected_compare_users, normalized_chart_data=normalized_chart_data
+        composition_labels=composition_labels, fat_mass_data=fat_mass_data, lean_mass_data=lean_mass_data,
+        bmi_labels=bmi_labels, bmi_data=bmi_data, whtr_labels=whtr_labels, whtr_data=whtr_data,
+        selected_compare_users=view['compare_users'], derived_grain=derived_grain, live_versions=live_versions,
+        unreadable_rows=snapshot.source.get('unreadable'), sharded=isinstance(get_store(), ShardedStore),
+        **cards
     )
 
+@app.route('/fragments/<name>')
+def card_fragment(name):
+    """One dashboard card rendered on its own, for the page to swap in; 304 while the card is unchanged."""
+    if name not in DASHBOARD_CARDS: return "Unknown card.", 404
+    all_users = get_users()
+    if not all_users: return "No users yet.", 404
+    view, snapshot = dashboard_view(all_users), get_store().snapshot()
+    etag = card_etag(name, view, snapshot)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(render_card(name, view, snapshot)[0], mimetype='text/html')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # browsers revalidate; an unchanged card costs a 304
+    return response
+
 @app.route('/update_goals', methods=['POST'])
 def update_goals():
     user = request.form.get('user')
@@ -1048,16 +3538,13 @@ def update_goals():
     try:
         start_weight_val = float(s) if (s := request.form.get('start_weight')) else None
         goal_weight_val = float(s) if (s := request.form.get('goal_weight')) else None
-        workbook = openpyxl.load_workbook(EXCEL_FILE)
-        sheet = workbook["Users"]
-        user_found = False
-        for row in sheet.iter_rows(min_row=2):
-            if row[0].value == user:
-                row[1].value, row[2].value = start_weight_val, goal_weight_val
-                user_found = True
-                break
-        if user_found:
-            workbook.save(EXCEL_FILE)
+        daily_aggregation = request.form.get('daily_aggregation')
+        if daily_aggregation not in DAILY_AGGREGATIONS: daily_aggregation = None
+        height_val = float(s) if (s := request.form.get('height')) else None  # blank clears it
+        if height_val is not None and not (math.isfinite(height_val) and height_val > 0):
+            flash("Height must be a positive number of inches.", "error")
+            return redirect(url_for('index', user1=user))
+        if update_user_goals(user, start_weight_val, goal_weight_val, daily_aggregation, height_val):
             flash(f"Goals for {user} updated successfully!", "success")
         else:
             flash(f"Could not find user {user} to update.", "error")
@@ -1071,13 +3558,9 @@ def add_user():
     if not new_user_name:
         flash("User name cannot be empty.", "error")
         return redirect(url_for('index'))
-    if new_user_name in get_users():
+    if not create_user(new_user_name):
         flash(f"User '{new_user_name}' already exists.", "error")
         return redirect(url_for('index'))
-    workbook = openpyxl.load_workbook(EXCEL_FILE)
-    sheet = workbook["Users"]
-    sheet.append([new_user_name, None, None])
-    workbook.save(EXCEL_FILE)
     flash(f"User '{new_user_name}' added successfully!", "success")
     return redirect(url_for('index', user1=new_user_name))
 
@@ -1089,7 +3572,7 @@ def update_entry(row_index):
         new_body_fat = float(s) if (s := request.form.get('body_fat')) else None
         new_waist_size = float(s) if (s := request.form.get('waist_size')) else None
         if new_weight > 0 and new_date:
-            if update_weight_entry(row_index, new_date, new_weight, new_body_fat, new_waist_size):
+            if update_weight_entry(row_index, new_date, new_weight, new_body_fat, new_waist_size, request.form.get('user')):
                 flash('Entry updated successfully!', 'success')
             else:
                 flash('Could not find entry to update.', 'error')
@@ -1097,22 +3580,18 @@ def update_entry(row_index):
             flash('Invalid weight or date.', 'error')
     except (ValueError, TypeError):
         flash('Invalid input for weight.', 'error')
-    return redirect(request.referrer or url_for('index'))
+    return _write_response(redirect(request.referrer or url_for('index')))
 
 @app.route('/delete/<int:row_index>')
 def delete_entry(row_index):
     try:
-        workbook = openpyxl.load_workbook(EXCEL_FILE)
-        sheet = workbook["Weight Data"]
-        if 1 < row_index <= sheet.max_row:
-            sheet.delete_rows(row_index)
-            workbook.save(EXCEL_FILE)
+        if delete_weight_entry(row_index, request.args.get('user')):
             flash('Entry deleted successfully!', 'success')
         else:
             flash('Could not find the entry to delete.', 'error')
     except Exception as e:
         flash(f'An error occurred: {e}', 'error')
-    return redirect(request.referrer or url_for('index'))
+    return _write_response(redirect(request.referrer or url_for('index')))
 
 @app.route('/delete_user', methods=['POST'])
 def delete_user():
@@ -1121,24 +3600,413 @@ def delete_user():
         flash("Cannot delete the last user.", "error")
         return redirect(url_for('index', user1=user_to_delete))
     try:
-        workbook = openpyxl.load_workbook(EXCEL_FILE)
-        for sheet_name in ["Weight Data", "Users"]:
-            sheet = workbook[sheet_name]
-            col_idx = 3 if sheet_name == "Weight Data" else 1
-            rows_to_delete = [r.row for r in sheet.iter_rows(min_row=2) if r[col_idx - 1].value == user_to_delete]
-            for r_idx in sorted(rows_to_delete, reverse=True):
-                sheet.delete_rows(r_idx)
-        workbook.save(EXCEL_FILE)
+        delete_user_data(user_to_delete)
         flash(f"User '{user_to_delete}' and all data have been deleted.", "success")
     except Exception as e:
         flash(f"An error occurred: {e}", "error")
         return redirect(url_for('index', user1=user_to_delete))
     return redirect(url_for('index'))
 
+# --- Live Updates ---
+# Each open dashboard holds a Server-Sent Events stream for the users it
+# shows. A publish wakes every stream; each compares the per-user versions it
+# last sent with the current snapshot and sends a compact delta for each user
+# that changed: changed and removed rows, the new daily values of the days
+# they touched, and the user's summary. A delta is computed once per user and
+# version and shared by all streams watching that user. A stream that fell
+# further behind, or a change to a user's settings, gets a reload message.
+LIVE_MAX_CHANGES = 200  # more changed rows than this and the page reloads instead
+
+def _user_rows(snapshot, user):
+    return {e.row_num: (e.date, e.weight, e.body_fat, e.waist_size) for e in EntrySeries.from_snapshot(snapshot, user)}
+
+def _user_settings(snapshot, user):
+    uid = snapshot.user_index.get(user)
+    if uid is None: return None
+    return {k: snapshot.users[uid][k] for k in ("start_weight", "goal_weight", "daily_aggregation", "height")}
+
+class LiveUpdates:
+    """Wakes event streams on publish and keeps the latest delta of every watched user."""
+
+    def __init__(self):
+        self.ticks = 0
+        self.streams = 0
+        self._changed = threading.Condition()
+        self._lock = threading.Lock()
+        self._watched = {}  # (snapshot dir, user) -> {lock, watchers, version, rows, settings, last: (from version, delta)}
+
+    def notify(self, store=None):
+        with self._changed:
+            self.ticks += 1
+            self._changed.notify_all()
+
+    def wait(self, seen, timeout):
+        """Blocks until a publish after tick `seen`, or `timeout` seconds; returns the current tick."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.ticks != seen, timeout)
+            return self.ticks
+
+    def open_stream(self):
+        """Claims a stream slot; False once LIVE_MAX_STREAMS are open."""
+        with self._lock:
+            if self.streams >= LIVE_MAX_STREAMS: return False
+            self.streams += 1
+            return True
+
+    def close_stream(self):
+        with self._lock: self.streams -= 1
+
+    def watch(self, store, snapshot, user):
+        with self._lock:
+            state = self._watched.get((store.snapshot_dir, user))
+            if state is None:
+                state = self._watched[(store.snapshot_dir, user)] = {
+                    "lock": threading.Lock(), "watchers": 0, "version": _user_version(snapshot, user), "rows": _user_rows(snapshot, user),
+                    "settings": _user_settings(snapshot, user), "last": None}
+            state["watchers"] += 1
+
+    def unwatch(self, store, user):
+        with self._lock:
+            state = self._watched[(store.snapshot_dir, user)]
+            state["watchers"] -= 1
+            if not state["watchers"]: del self._watched[(store.snapshot_dir, user)]
+
+    def delta(self, store, snapshot, user, since):
+        """Returns (version, message) if a watched `user` changed after version `since`, else None."""
+        version = _user_version(snapshot, user)
+        if version == since: return None
+        with self._lock: state = self._watched[(store.snapshot_dir, user)]
+        # The first stream to see the change computes the delta and the others reuse
+        # it; only streams watching this user wait meanwhile, not every stream.
+        with state["lock"]:
+            if state["version"] != version:
+                rows, settings = _user_rows(snapshot, user), _user_settings(snapshot, user)
+                message = {"user": user, "version": version}
+                if settings is None or settings != state["settings"]: message["reload"] = True
+                else: message.update(_entry_delta(store, snapshot, user, state["rows"], rows))
+                state.update(version=version, rows=rows, settings=settings, last=(state["version"], message))
+            last = state["last"]
+        if last is not None and last[0] == since and last[1]["version"] == version: return version, last[1]
+        return version, {"user": user, "version": version, "reload": True}
+
+def _entry_delta(store, snapshot, user, old, new):
+    """The rows that changed between two versions of a user, with the days and summary they affect."""
+    changed = {row: values for row, values in new.items() if old.get(row) != values}
+    removed = [row for row in old if row not in new]
+    if len(changed) + len(removed) > LIVE_MAX_CHANGES: return {"reload": True}
+    days = {values[0] for values in changed.values()}
+    days.update(old[row][0] for row in removed)
+    days.update(old[row][0] for row in changed if row in old)
+    rollups, derived = get_rollups(user, snapshot, store), get_derived_metrics(user, snapshot, store)
+    ordinals = {datetime.date.fromisoformat(day).toordinal(): day for day in days}
+    day_values = {day: rollups.day(ordinal) for ordinal, day in ordinals.items()}
+    for metric in DERIVED_METRICS:
+        points = dict(zip(*derived.points(metric)))
+        for ordinal, day in ordinals.items(): day_values[day][metric] = points.get(ordinal)
+    return {"entries": [{"row": row, "date": v[0], "weight": v[1], "body_fat": v[2], "waist_size": v[3]}
+                        for row, v in sorted(changed.items())],
+            "removed": sorted(removed), "days": day_values,
+            "summary": dashboard_summary(rollups, derived, _user_settings(snapshot, user))}
+
+live_updates = LiveUpdates()
+_publish_listeners.append(live_updates.notify)
+
+def _write_response(response):
+    """The redirect a form ends with, or its flash messages as JSON when the page posted it with fetch()."""
+    if request.accept_mimetypes.best != 'application/json': return response
+    return {"messages": [{"category": c, "message": m} for c, m in get_flashed_messages(with_categories=True)]}
+
+@app.route('/events')
+def live_events():
+    """Server-Sent Events stream of deltas for the `user` parameters, starting after versions `v`."""
+    users = list(dict.fromkeys(u for u in request.args.getlist('user') if u))
+    if not LIVE_UPDATES or not users: return "No users to watch.", 404
+    # On reconnect the browser sends back the id of the last event: the versions it has applied.
+    resumed = request.headers.get('Last-Event-ID', '').split(',')
+    versions = resumed if len(resumed) == len(users) else request.args.getlist('v')
+    store = get_store()
+    snapshot = store.snapshot()  # may raise StorageBusyError, so before a stream slot is claimed
+    since = {user: int(version) if version and version.isdigit() else _user_version(snapshot, user)
+             for user, version in zip(users, versions + [None] * len(users))}
+    if not live_updates.open_stream(): return "Too many live streams.", 503
+    watched = []
+
+    def close():
+        for user in watched: live_updates.unwatch(store, user)
+        live_updates.close_stream()
+
+    try:
+        for user in users:
+            live_updates.watch(store, snapshot, user)
+            watched.append(user)
+    except Exception:
+        close()
+        raise
+
+    def stream():
+        tick = live_updates.ticks
+        yield "retry: 5000\n\n"
+        while True:
+            snapshot = store.snapshot()
+            for user in users:
+                change = live_updates.delta(store, snapshot, user, since[user])
+                if change is None: continue
+                since[user], message = change
+                yield f"id: {','.join(str(since[u]) for u in users)}\ndata: {json.dumps(message)}\n\n"
+            seen, tick = tick, live_updates.wait(tick, LIVE_POLL_SECONDS)
+            if tick == seen: yield ": keep-alive\n\n"
+
+    response = Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(close)  # runs even if the client leaves before the first event
+    return response
+
+# --- Leaderboard ---
+# Rankings come from the per-user progress aggregates stored in the snapshot,
+# which are recomputed only for users whose data changed. Each ordering is
+# sorted once per snapshot generation and pages are slices of it.
+LEADERBOARD_SORTS = {
+    'pct_lost': ("% Lost", True),     # (column label, higher is better)
+    'to_goal': ("Lbs to Goal", False),
+    'trend': (f"{TREND_DAYS}-Day Change", False),
+}
+LEADERBOARD_PAGE_SIZE = 50
+_rankings = {}
+_rankings_lock = threading.Lock()
+
+def get_ranking(snapshot, sort, store=None):
+    """Returns listed user ids ordered best first by `sort`; users without a value go last."""
+    key = ((store or get_store()).snapshot_dir, sort)
+    with _rankings_lock:
+        cached = _rankings.get(key)
+    if cached is not None and cached[0] == (snapshot.epoch, snapshot.generation): return cached[1]
+    higher_is_better = LEADERBOARD_SORTS[sort][1]
+
+    def rank_key(uid):
+        value = (snapshot.users[uid].get("progress") or {}).get(sort)
+        if value is None: return (1, 0, snapshot.users[uid]["name"])
+        return (0, -value if higher_is_better else value, snapshot.users[uid]["name"])
+    ranking = sorted((uid for uid, u in enumerate(snapshot.users) if u["listed"]), key=rank_key)
+    with _rankings_lock:
+        _rankings[key] = ((snapshot.epoch, snapshot.generation), ranking)
+    return ranking
+
+@app.route('/leaderboard')
+def leaderboard():
+    sort = request.args.get('sort', 'pct_lost')
+    if sort not in LEADERBOARD_SORTS: sort = 'pct_lost'
+    page = max(request.args.get('page', 1, type=int), 1)
+    snapshot = get_store().snapshot()
+    ranking = get_ranking(snapshot, sort)
+    pages = max((len(ranking) + LEADERBOARD_PAGE_SIZE - 1) // LEADERBOARD_PAGE_SIZE, 1)
+    page = min(page, pages)
+    first = (page - 1) * LEADERBOARD_PAGE_SIZE
+    rows = [dict(snapshot.users[uid].get("progress") or _empty_progress(), name=snapshot.users[uid]["name"], rank=first + i + 1)
+            for i, uid in enumerate(ranking[first:first + LEADERBOARD_PAGE_SIZE])]
+    return render_template_string(LEADERBOARD_HTML, rows=rows, sort=sort, sorts=LEADERBOARD_SORTS,
+                                  page=page, pages=pages, total=len(ranking))
+
+# --- JSON API ---
+API_MAX_BATCH = INGEST_MAX_BATCH  # so one API request always fits in one commit
+IDEMPOTENCY_CACHE_SIZE = 4096
+IDEMPOTENCY_WAIT_TIMEOUT = 30
+IDEMPOTENCY_KEEP_SECONDS = 24 * 3600
+IDEMPOTENCY_PRUNE_EVERY = 64  # saves between sweeps of expired keys
+
+class IdempotencyCache:
+    """Remembers API responses by Idempotency-Key so a retried request is not applied twice.
+
+    Finished responses are saved in the store's snapshot folder for
+    IDEMPOTENCY_KEEP_SECONDS, so retries that reach another worker process or
+    arrive after a restart are replayed as well. Requests still in flight are
+    tracked in memory; at most IDEMPOTENCY_CACHE_SIZE keys are kept of each.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._slots = OrderedDict()
+        self._lock = threading.Lock()
+        self._saves = 0
+
+    def run(self, key, fingerprint, compute, store=None):
+        """Returns (body, status, replayed): compute()'s result, or the stored one for a repeated key."""
+        store = store or get_store()
+        slot_key = (store.snapshot_dir, key)
+        with self._lock:
+            slot = self._slots.get(slot_key)
+            owner = slot is None
+            if owner:
+                slot = self._slots[slot_key] = {"fingerprint": fingerprint, "done": threading.Event(), "result": None}
+                # Slots still in flight are never evicted: their waiters need the result.
+                finished = [k for k, s in self._slots.items() if s["done"].is_set()]
+                for old in finished[:len(self._slots) - self.size]: del self._slots[old]
+            else:
+                self._slots.move_to_end(slot_key)
+        if not owner:
+            if slot["fingerprint"] != fingerprint:
+                return {"error": "Idempotency-Key was already used for a different request."}, 422, False
+            if not slot["done"].wait(IDEMPOTENCY_WAIT_TIMEOUT) or slot["result"] is None:
+                return {"error": "The original request with this Idempotency-Key is still in progress."}, 409, False
+            return slot["result"] + (True,)
+        try:
+            saved = self._load(store, key)
+            if saved is not None and saved["fingerprint"] != fingerprint:
+                with self._lock: self._slots.pop(slot_key, None)
+                return {"error": "Idempotency-Key was already used for a different request."}, 422, False
+            if saved is not None:
+                slot["result"] = (saved["body"], saved["status"])
+                return slot["result"] + (True,)
+            slot["result"] = compute()
+            self._save(store, key, fingerprint, slot["result"])
+        except BaseException:
+            with self._lock: self._slots.pop(slot_key, None)
+            raise
+        finally:
+            slot["done"].set()
+        return slot["result"] + (False,)
+
+    @staticmethod
+    def _path(store, key):
+        return os.path.join(store.snapshot_dir, 'idempotency', hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+    def _load(self, store, key):
+        """The saved response for `key`, or None if there is none or it has expired."""
+        path = self._path(store, key)
+        with store.write_lock():
+            try:
+                if os.stat(path).st_mtime < time.time() - IDEMPOTENCY_KEEP_SECONDS: return None
+                with open(path) as f: return json.load(f)
+            except (FileNotFoundError, ValueError):
+                return None
+
+    def _save(self, store, key, fingerprint, result):
+        path = self._path(store, key)
+        with store.write_lock():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_json_atomically(path, {"fingerprint": fingerprint, "body": result[0], "status": result[1]})
+            with self._lock:
+                self._saves += 1
+                prune = self._saves % IDEMPOTENCY_PRUNE_EVERY == 0
+            if prune: self._prune(os.path.dirname(path))
+
+    def _prune(self, folder):
+        """Deletes expired saved responses, and the oldest beyond `size`."""
+        saved = []
+        for name in os.listdir(folder):
+            try: saved.append((os.stat(os.path.join(folder, name)).st_mtime, name))
+            except FileNotFoundError: continue
+        saved.sort(reverse=True)
+        cutoff = time.time() - IDEMPOTENCY_KEEP_SECONDS
+        for i, (mtime, name) in enumerate(saved):
+            if i >= self.size or mtime < cutoff:
+                try: os.remove(os.path.join(folder, name))
+                except OSError: pass  # gone already, or locked; the next prune retries
+
+_idempotency = IdempotencyCache(IDEMPOTENCY_CACHE_SIZE)
+
+def validate_api_entry(item, known_users):
+    """Returns (entry, None) for a valid API entry object, else (None, error message)."""
+    if not isinstance(item, dict): return None, "Entry must be an object."
+    user = item.get('user')
+    if not isinstance(user, str) or user not in known_users: return None, f"Unknown user: {user!r}."
+    entry_date = parse_date(item['date']) if isinstance(item.get('date'), str) else None
+    if entry_date is None: return None, "Date must be formatted YYYY-MM-DD."
+    try:
+        weight = float(item.get('weight'))
+        body_fat = float(v) if (v := item.get('body_fat')) not in (None, '') else None
+        waist_size = float(v) if (v := item.get('waist_size')) not in (None, '') else None
+    except (ValueError, TypeError):
+        return None, "Weight, body fat and waist size must be numbers."
+    if not all(math.isfinite(v) for v in (weight, body_fat, waist_size) if v is not None):
+        return None, "Weight, body fat and waist size must be finite numbers."
+    if weight <= 0: return None, "Weight must be a positive number."
+    return (entry_date, weight, user, body_fat, waist_size), None
+
+def _add_api_entries(items):
+    known_users = get_store().snapshot().registry
+    results, valid = [], []
+    for index, item in enumerate(items):
+        entry, error = validate_api_entry(item, known_users)
+        if error:
+            results.append({"index": index, "status": "invalid", "error": error})
+        else:
+            results.append({"index": index})
+            valid.append(entry)
+    statuses = iter(add_weight_entries(valid))
+    for result in results:
+        if "status" not in result: result["status"] = next(statuses)
+    counts = {status: sum(r["status"] == status for r in results) for status in ("created", "duplicate", "invalid")}
+    return {**counts, "results": results}, 200
+
+@app.route('/api/entries', methods=['POST'])
+def api_add_entries():
+    """Batch entry sync for devices.
+
+    Body: a JSON array (or {"entries": [...]}) of {user, date, weight, body_fat,
+    waist_size}. Valid entries are written in one commit; the response reports
+    each item as created, duplicate (already recorded) or invalid. A repeated Idempotency-Key header replays the first response.
+    """
+    payload = request.get_json(silent=True)
+    items = payload.get('entries') if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        return {"error": "Expected a JSON array of entries."}, 400
+    if len(items) > API_MAX_BATCH:
+        return {"error": f"At most {API_MAX_BATCH} entries per request."}, 413
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        return _add_api_entries(items)
+    fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+    body, status, replayed = _idempotency.run(key, fingerprint, lambda: _add_api_entries(items))
+    return body, status, {'Idempotent-Replayed': 'true'} if replayed else {}
+
+@app.route('/api/ingest/stats')
+def api_ingest_stats():
+    """Ingestion queue depth, coalescing and commit latency."""
+    return _ingest.stats()
+
+@app.route('/api/users')
+def api_users():
+    """Autocomplete: listed users whose name starts with `q`."""
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    return {"users": get_store().snapshot().registry.search(request.args.get('q', ''), limit)}
+
+@app.route('/api/rollups')
+def api_rollups():
+    """Weekly or monthly rollups of a user's weight, body fat and waist size."""
+    user, grain = request.args.get('user'), request.args.get('grain', 'week')
+    if grain not in ('week', 'month'): return {"error": "grain must be 'week' or 'month'."}, 400
+    snapshot = get_store().snapshot()
+    if user not in snapshot.user_index: return {"error": f"Unknown user '{user}'."}, 404
+    rollups = get_rollups(user, snapshot)
+    result = {"user": user, "grain": grain, "daily_aggregation": rollups.policy}
+    result.update({metric: rollups.periods(metric, grain) for metric in METRICS})
+    return result
+
 if __name__ == '__main__':
-    if os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
-        print("\n--- Starting Flask Server ---")
+    if sys.argv[1:] == ['migrate-shards']:
+        summary = migrate_to_shards()
+        print(f"Migrated {summary['entries']} entries for {summary['users']} users into '{SHARD_DIR}'"
+              f" ({summary['skipped_rows']} rows without a user skipped).")
+        print("Set WEIGHT_TRACKER_LAYOUT=sharded to serve from the shards.")
+    elif len(sys.argv) == 3 and sys.argv[1] == 'add-tenant':
+        tenant_stores.create(sys.argv[2])
+        print(f"Created tenant '{sys.argv[2]}' in '{TENANT_DIR}'.")
+    elif sys.argv[1:] == ['normalize']:
+        summary = normalize_workbook()
+        print(f"Normalized '{EXCEL_FILE}': {summary['entries']} entries for {summary['users']} users,"
+              f" {summary['quarantined']} invalid rows moved to the '{QUARANTINE_SHEET}' sheet,"
+              f" {summary['dropped_users']} blank or duplicate user rows dropped.")
+        if not summary['stamped']:
+            print("openpyxl 3.1 or newer is needed to mark the workbook as normalized; until then it is loaded the slower way.")
+    elif SERVER_MODE == 'asgi':
+        import uvicorn
+        print("\n--- Starting ASGI Server ---")
         print("Open your web browser and go to: http://127.0.0.1:5000")
-    app.run(host='0.0.0.0', port=5000, debug=True)
+        uvicorn.run('weight_tracking_og2:create_asgi_app', factory=True, host='0.0.0.0', port=5000)
+    else:
+        if os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+            print("\n--- Starting Flask Server ---")
+            print("Open your web browser and go to: http://127.0.0.1:5000")
+        app.run(host='0.0.0.0', port=5000, debug=True)
 
 